@@ -0,0 +1,62 @@
+"""Full-text search index for plants
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+SEARCH_COLUMNS = "name, species, category, description"
+NEW_VALUES = "new.name, new.species, new.category, new.description"
+OLD_VALUES = "old.name, old.species, old.category, old.description"
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        # Expression must match PostgresPlantSearchEngine.document()
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_plants_search_document ON plants USING gin "
+            "(to_tsvector('english', coalesce(name, '') || ' ' || coalesce(species, '') || ' ' || "
+            "coalesce(category, '') || ' ' || coalesce(description, '')))"
+        )
+    elif dialect == 'sqlite':
+        op.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS plants_fts USING fts5({SEARCH_COLUMNS}, "
+            "content='plants', content_rowid='id', tokenize='porter unicode61')"
+        )
+        # Index the rows that already exist
+        op.execute("INSERT INTO plants_fts(plants_fts) VALUES ('rebuild')")
+        op.execute(
+            f"CREATE TRIGGER IF NOT EXISTS plants_fts_ai AFTER INSERT ON plants BEGIN "
+            f"INSERT INTO plants_fts(rowid, {SEARCH_COLUMNS}) VALUES (new.id, {NEW_VALUES}); END"
+        )
+        op.execute(
+            f"CREATE TRIGGER IF NOT EXISTS plants_fts_ad AFTER DELETE ON plants BEGIN "
+            f"INSERT INTO plants_fts(plants_fts, rowid, {SEARCH_COLUMNS}) VALUES ('delete', old.id, {OLD_VALUES}); END"
+        )
+        op.execute(
+            f"CREATE TRIGGER IF NOT EXISTS plants_fts_au AFTER UPDATE OF {SEARCH_COLUMNS} ON plants BEGIN "
+            f"INSERT INTO plants_fts(plants_fts, rowid, {SEARCH_COLUMNS}) VALUES ('delete', old.id, {OLD_VALUES}); "
+            f"INSERT INTO plants_fts(rowid, {SEARCH_COLUMNS}) VALUES (new.id, {NEW_VALUES}); END"
+        )
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_plants_search_document")
+    elif dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS plants_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS plants_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS plants_fts_ai")
+        op.execute("DROP TABLE IF EXISTS plants_fts")
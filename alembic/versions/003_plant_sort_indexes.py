@@ -0,0 +1,62 @@
+"""Plant listing sort columns and composite indexes
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+# (index suffix, sort column) for every listing sort
+SORT_COLUMNS = [
+    ('newest', 'created_at'),
+    ('price', 'price'),
+    ('popular', 'sales_count'),
+    ('rating', 'rating_average'),
+]
+
+
+def upgrade():
+    op.add_column('plants', sa.Column('sales_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('plants', sa.Column('rating_average', sa.Float(), server_default='0', nullable=False))
+    op.add_column('plants', sa.Column('rating_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill the denormalized sort columns from existing orders and reviews
+    tables = sa.inspect(op.get_bind()).get_table_names()
+    if 'order_items' in tables and 'orders' in tables:
+        op.execute(
+            "UPDATE plants SET sales_count = COALESCE(("
+            "SELECT SUM(order_items.quantity) FROM order_items "
+            "JOIN orders ON orders.id = order_items.order_id "
+            "WHERE order_items.plant_id = plants.id AND orders.status != 'CANCELLED'), 0)"
+        )
+    if 'reviews' in tables:
+        op.execute(
+            "UPDATE plants SET "
+            "rating_count = (SELECT COUNT(*) FROM reviews WHERE reviews.plant_id = plants.id), "
+            "rating_average = COALESCE((SELECT AVG(reviews.rating) FROM reviews WHERE reviews.plant_id = plants.id), 0)"
+        )
+
+    for name, column in SORT_COLUMNS:
+        op.create_index(f'ix_plants_listing_{name}', 'plants',
+                        ['is_active', 'approval_status', column, 'id'], unique=False)
+        op.create_index(f'ix_plants_category_{name}', 'plants',
+                        ['is_active', 'approval_status', 'category', column, 'id'], unique=False)
+
+
+def downgrade():
+    for name, _ in SORT_COLUMNS:
+        op.drop_index(f'ix_plants_category_{name}', table_name='plants')
+        op.drop_index(f'ix_plants_listing_{name}', table_name='plants')
+    op.drop_column('plants', 'rating_count')
+    op.drop_column('plants', 'rating_average')
+    op.drop_column('plants', 'sales_count')
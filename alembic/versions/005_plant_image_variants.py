@@ -0,0 +1,24 @@
+"""Plant image variants
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('plants', sa.Column('image_variants', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('plants', 'image_variants')
@@ -0,0 +1,41 @@
+"""Direct-to-storage image uploads
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'image_uploads',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('object_key', sa.String(length=300), nullable=False),
+        sa.Column('content_type', sa.String(length=100), nullable=False),
+        sa.Column('status', sa.Enum('PENDING', 'PROCESSING', 'READY', 'FAILED', name='uploadstatus'), nullable=False),
+        sa.Column('sha256', sa.String(length=64), nullable=True),
+        sa.Column('variants', sa.JSON(), nullable=True),
+        sa.Column('error', sa.String(length=500), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_image_uploads_user_id'), 'image_uploads', ['user_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_image_uploads_user_id'), table_name='image_uploads')
+    op.drop_table('image_uploads')
+    sa.Enum(name='uploadstatus').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,26 @@
+"""Perceptual hash on predictions
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('predictions', sa.Column('image_hash', sa.String(length=16), nullable=True))
+    op.create_index(op.f('ix_predictions_image_hash'), 'predictions', ['image_hash'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_predictions_image_hash'), table_name='predictions')
+    op.drop_column('predictions', 'image_hash')
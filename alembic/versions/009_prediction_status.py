@@ -0,0 +1,28 @@
+"""Prediction job status
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    prediction_status = sa.Enum('PENDING', 'PROCESSING', 'COMPLETED', 'FAILED', name='predictionstatus')
+    prediction_status.create(op.get_bind(), checkfirst=True)
+    # Existing predictions were all answered synchronously
+    op.add_column('predictions', sa.Column('status', prediction_status, server_default='COMPLETED', nullable=False))
+
+
+def downgrade():
+    op.drop_column('predictions', 'status')
+    sa.Enum(name='predictionstatus').drop(op.get_bind(), checkfirst=True)
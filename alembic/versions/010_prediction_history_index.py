@@ -0,0 +1,26 @@
+"""Prediction history index
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Serves a user's history newest first, including its keyset cursor
+    op.create_index('ix_predictions_user_timestamp', 'predictions',
+                    ['uploaded_by', sa.text('timestamp DESC'), 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_predictions_user_timestamp', table_name='predictions')
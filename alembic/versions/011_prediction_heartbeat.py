@@ -0,0 +1,25 @@
+"""Prediction job heartbeat
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '011'
+down_revision = '010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Touched by the worker owning a job; staleness falls back to timestamp
+    op.add_column('predictions', sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade():
+    op.drop_column('predictions', 'updated_at')
@@ -1,4 +1,6 @@
-from fastapi import APIRouter
+import json
+from fastapi import APIRouter, Request, Response
+from app.core.http_cache import make_etag, etag_matches, set_validators, not_modified
 
 
 router = APIRouter(prefix="/categories", tags=["categories"])
@@ -40,8 +42,15 @@ PLANT_CATEGORY_TREE = {
 }
 
 
+# The tree is static, so its validator is computed once
+CATEGORY_TREE_ETAG = make_etag("categories", json.dumps(PLANT_CATEGORY_TREE, sort_keys=True))
+
+
 @router.get("/tree")
-async def get_category_tree():
+async def get_category_tree(request: Request, response: Response):
+    if etag_matches(request, CATEGORY_TREE_ETAG):
+        return not_modified(CATEGORY_TREE_ETAG)
+    set_validators(response, CATEGORY_TREE_ETAG)
     return PLANT_CATEGORY_TREE
 
 
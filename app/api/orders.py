@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from typing import List
+from fastapi.responses import JSONResponse
+from typing import List, Optional
 from app.core.database import get_db
 from app.core.security import get_current_active_user, require_seller_or_admin, require_admin
+from app.core.fieldsets import parse_fields, sparse_dump
 from app.schemas.order import OrderCreate, OrderResponse, OrderUpdate, OrderListResponse, OrderStats, CheckoutRequest, CheckoutResponse, CheckoutOrderSummary
 from app.services.order_service import OrderService
 from app.models import User, OrderStatus, UserRole, DeliveryTimeline
@@ -26,14 +28,25 @@ async def create_order(
 async def get_my_orders(
     page: int = 1,
     size: int = 20,
+    fields: Optional[str] = None,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Get current user's orders"""
+    """Get current user's orders (`fields` limits the order fields returned)"""
     order_service = OrderService(db)
-    orders, total = order_service.get_user_orders(current_user.id, page, size)
+    field_names = parse_fields(fields, OrderResponse)
+    orders, total = order_service.get_user_orders(current_user.id, page, size, fields=field_names)
     pages = (total + size - 1) // size
     
+    if field_names:
+        return JSONResponse({
+            "orders": sparse_dump(orders, OrderResponse, field_names),
+            "total": total,
+            "page": page,
+            "size": size,
+            "pages": pages,
+        })
+    
     return OrderListResponse(
         orders=orders,
         total=total,
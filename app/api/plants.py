@@ -1,16 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
-from sqlalchemy.orm import Session
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Query, Request, Response, BackgroundTasks
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, sessionmaker
 from typing import Optional, List
 from app.core.database import get_db
 from app.core.security import get_current_active_user, require_seller_or_admin, require_admin
-from app.schemas.plant import PlantCreate, PlantResponse, PlantUpdate, PlantListResponse, PlantSearchParams
-from app.schemas.ml import PredictionResponse, PredictionLog
+from app.core.http_cache import make_etag, etag_matches, set_validators, not_modified
+from app.core.fieldsets import parse_fields, sparse_dump
+from app.core.image_ingest import read_stream_limited
+from fastapi.responses import JSONResponse, StreamingResponse
+from app.schemas.plant import PlantCreate, PlantResponse, PlantUpdate, PlantListResponse, PlantSearchParams, CountMode, PlantSort, PlantFacetsResponse, PlantBatchResponse, SuggestResponse, ImageUploadCreate, ImageUploadTicket, ImageUploadResponse
+from app.schemas.ml import PredictionRequest, PredictionResponse, PredictionLog, PredictionJob, BatchPredictionResponse
 from app.services.plant_service import PlantService
+from app.services.catalog_cache import catalog_fingerprint
+from app.services.suggest_index import plant_suggest_index
+from app.services.image_pipeline import image_pipeline, primary_image_url
+from app.services.upload_service import UploadService
+from app.core.storage import get_storage, LocalStorage
+from app.core.config import settings
 from app.services.prediction_service import MLService
-from app.models import User
+from app.services.prediction_jobs import prediction_jobs, TERMINAL_STATUSES
+from app.models import User, ImageUpload, UploadStatus, Prediction
 
 router = APIRouter(prefix="/plants", tags=["plants"])
 
+# Upper bound on IDs accepted by GET /plants/batch
+MAX_BATCH_PLANT_IDS = 250
+
 
 @router.post("/", response_model=PlantResponse, status_code=status.HTTP_201_CREATED)
 async def create_plant(
@@ -24,6 +40,7 @@ async def create_plant(
     verified_by_ai: Optional[str] = Form(None),  # Also accept 'verified_by_ai' for compatibility
     image: Optional[UploadFile] = File(None),
     image_url: Optional[str] = Form(None),  # Alternative to file upload
+    upload_id: Optional[str] = Form(None),  # Finished direct upload (POST /plants/uploads)
     species: Optional[str] = Form(None),
     care_instructions: Optional[str] = Form(None),
     current_user: User = Depends(require_admin),  # Admin only as per frontend requirements
@@ -41,8 +58,9 @@ async def create_plant(
     Optional fields:
     - description: Plant description
     - verified: Verification status ("true" or "false", default: "false")
-    - image: Image file upload (requires S3 configuration)
+    - image: Image file upload (requires a configured storage backend)
     - image_url: Image URL (alternative to file upload)
+    - upload_id: ID of a ready direct upload (alternative to file upload)
     - species: Plant species
     - care_instructions: Care instructions
     """
@@ -76,11 +94,22 @@ async def create_plant(
     
     # Handle image: prefer image_url if provided, otherwise upload file
     final_image_url = image_url
+    image_variants = None
+    
+    if upload_id and not final_image_url:
+        upload = UploadService(db).get_upload(upload_id, current_user.id)
+        if not upload:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+        if upload.status != UploadStatus.READY:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Upload is {upload.status.value}")
+        image_variants = upload.variants
+        final_image_url = primary_image_url(image_variants)
     
     if image and not final_image_url:
-        # Upload image file to S3
+        # Process and upload off the event loop
         try:
-            final_image_url = plant_service.upload_image_to_s3(image)
+            image_variants = await image_pipeline.upload(image, db)
+            final_image_url = primary_image_url(image_variants)
         except HTTPException:
             # Re-raise HTTP exceptions (already formatted)
             raise
@@ -107,7 +136,8 @@ async def create_plant(
         current_user.id, 
         image_file=None if final_image_url else image,  # Only pass file if no URL
         image_url=final_image_url,
-        verified_by_ai=verified_bool
+        verified_by_ai=verified_bool,
+        image_variants=image_variants
     )
     
     return plant
@@ -115,6 +145,9 @@ async def create_plant(
 
 @router.get("/", response_model=PlantListResponse)
 async def get_plants(
+    request: Request,
+    response: Response,
+    q: Optional[str] = None,
     name: Optional[str] = None,
     category: Optional[str] = None,
     min_price: Optional[float] = None,
@@ -122,49 +155,264 @@ async def get_plants(
     verified_only: Optional[bool] = None,
     page: int = 1,
     size: int = 20,
+    cursor: Optional[str] = None,
+    sort: Optional[PlantSort] = None,
+    count: CountMode = CountMode.ESTIMATE,
+    fields: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """Get plants with filtering and pagination"""
+    """
+    Get plants with filtering, sorting and pagination.
+    
+    `sort` is one of newest (default), price_asc, price_desc, popular or rating.
+    
+    Every page carries a `next_cursor`; passing it back as `cursor` (with the
+    same sort) switches to keyset pagination, which stays fast on deep pages.
+    `page` is ignored when a cursor is given.
+    
+    `q` runs a full-text search over name, species, category and description;
+    without an explicit sort, matches are ranked by relevance.
+    
+    `count` controls the total: `estimate` (default) serves a briefly cached
+    count, `exact` always counts, `none` skips counting and returns null
+    `total`/`pages`.
+    
+    `fields` (e.g. `name,price,image_url`) returns only those plant fields,
+    plus `id`, and only reads those columns.
+    
+    Responses carry an ETag tied to the catalog's contents; send it back in
+    `If-None-Match` to get a bodiless 304 while nothing has changed.
+    """
+    etag = make_etag("plants", catalog_fingerprint(db), sorted(request.query_params.multi_items()))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_validators(response, etag)
+    
     plant_service = PlantService(db)
     
     search_params = PlantSearchParams(
+        q=q,
         name=name,
         category=category,
         min_price=min_price,
         max_price=max_price,
         verified_only=verified_only,
         page=page,
-        size=size
+        size=size,
+        cursor=cursor,
+        sort=sort,
+        count=count,
+        fields=parse_fields(fields, PlantResponse)
     )
     
-    plants, total = plant_service.get_plants(search_params)
-    pages = (total + size - 1) // size
+    plants, total, next_cursor = plant_service.get_plants(search_params)
+    pages = (total + size - 1) // size if total is not None else None
+    
+    if search_params.fields:
+        sparse = JSONResponse({
+            "plants": sparse_dump(plants, PlantResponse, search_params.fields),
+            "total": total,
+            "page": page,
+            "size": size,
+            "pages": pages,
+            "next_cursor": next_cursor,
+        })
+        set_validators(sparse, etag)
+        return sparse
     
     return PlantListResponse(
         plants=plants,
         total=total,
         page=page,
         size=size,
-        pages=pages
+        pages=pages,
+        next_cursor=next_cursor
+    )
+
+
+@router.get("/facets", response_model=PlantFacetsResponse)
+async def get_plant_facets(
+    q: Optional[str] = None,
+    name: Optional[str] = None,
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    verified_only: Optional[bool] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Get filter facets for the catalog: per-category counts, a price histogram
+    and the AI-verified count. Accepts the same filters as the plant listing.
+    """
+    plant_service = PlantService(db)
+    
+    search_params = PlantSearchParams(
+        q=q,
+        name=name,
+        category=category,
+        min_price=min_price,
+        max_price=max_price,
+        verified_only=verified_only
     )
+    
+    return plant_service.get_plant_facets(search_params)
+
+
+@router.get("/suggest", response_model=SuggestResponse)
+async def suggest_plants(
+    prefix: str,
+    limit: int = Query(10, ge=1, le=25),
+    db: Session = Depends(get_db)
+):
+    """
+    Typeahead suggestions for the search box.
+    
+    Matches the start of any word in listed plant names, species and catalog
+    categories. Served from an in-memory index, so keystrokes do not query
+    the database; (re)building the index runs in the threadpool.
+    """
+    if plant_suggest_index.needs_refresh():
+        await run_in_threadpool(plant_suggest_index.refresh, db)
+    return SuggestResponse(suggestions=plant_suggest_index.suggest(db, prefix, limit))
+
+
+@router.get("/batch", response_model=PlantBatchResponse)
+async def get_plants_batch(
+    ids: List[str] = Query(...),
+    db: Session = Depends(get_db)
+):
+    """
+    Get many plants in one request.
+    
+    `ids` accepts a comma-separated list (`?ids=1,2,3`) or repeated parameters
+    (`?ids=1&ids=2`). Plants are returned in request order with duplicates
+    removed; IDs that do not exist are listed in `missing`.
+    """
+    try:
+        plant_ids = [int(value) for raw in ids for value in raw.split(",") if value.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="ids must be integers"
+        )
+    plant_ids = list(dict.fromkeys(plant_ids))
+    
+    if len(plant_ids) > MAX_BATCH_PLANT_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BATCH_PLANT_IDS} ids can be requested at once"
+        )
+    
+    plant_service = PlantService(db)
+    plants, missing = plant_service.get_plants_by_ids(plant_ids)
+    return PlantBatchResponse(plants=plants, missing=missing)
+
+
+def _upload_response(upload: ImageUpload) -> ImageUploadResponse:
+    return ImageUploadResponse(
+        id=upload.id,
+        status=upload.status,
+        image_url=primary_image_url(upload.variants) if upload.variants else None,
+        image_variants=upload.variants,
+        error=upload.error,
+        created_at=upload.created_at,
+    )
+
+
+@router.post("/uploads", response_model=ImageUploadTicket, status_code=status.HTTP_201_CREATED)
+async def create_image_upload(
+    body: ImageUploadCreate,
+    current_user: User = Depends(require_seller_or_admin),
+    db: Session = Depends(get_db)
+):
+    """
+    Start a direct upload.
+    
+    PUT the image bytes to `upload_url` with the returned headers, then call
+    `POST /plants/uploads/{upload_id}/finalize` and poll
+    `GET /plants/uploads/{upload_id}` until `status` is `ready`. Pass the
+    `upload_id` to plant creation to use the processed image.
+    """
+    upload, upload_url = UploadService(db).create_upload(current_user.id, body.content_type)
+    return ImageUploadTicket(
+        upload_id=upload.id,
+        upload_url=upload_url,
+        headers={"Content-Type": upload.content_type},
+        expires_in=settings.image_upload_url_ttl,
+    )
+
+
+@router.put("/uploads/local/{key:path}", status_code=status.HTTP_204_NO_CONTENT)
+async def put_local_upload(
+    key: str,
+    request: Request,
+    expires: int,
+    signature: str
+):
+    """Presigned PUT target for the local storage backend (stands in for S3)"""
+    storage = get_storage()
+    if not isinstance(storage, LocalStorage):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+    content_type = request.headers.get("content-type", "")
+    if not storage.verify_put(key, content_type, expires, signature):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid or expired upload URL")
+    
+    data = await read_stream_limited(request.stream(), settings.image_upload_max_bytes)
+    await run_in_threadpool(storage.put, key, data, content_type)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.post("/uploads/{upload_id}/finalize", response_model=ImageUploadResponse, status_code=status.HTTP_202_ACCEPTED)
+async def finalize_image_upload(
+    upload_id: str,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(require_seller_or_admin),
+    db: Session = Depends(get_db)
+):
+    """Queue variant generation for an upload whose bytes have been PUT"""
+    upload, queued = UploadService(db).start_finalize(upload_id, current_user.id)
+    if not upload:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+    if queued:
+        background_tasks.add_task(image_pipeline.finalize_upload, upload.id, sessionmaker(bind=db.get_bind()))
+    return _upload_response(upload)
+
+
+@router.get("/uploads/{upload_id}", response_model=ImageUploadResponse)
+async def get_image_upload(
+    upload_id: str,
+    current_user: User = Depends(require_seller_or_admin),
+    db: Session = Depends(get_db)
+):
+    """Get the processing status and variants of a direct upload"""
+    upload = UploadService(db).get_upload(upload_id, current_user.id)
+    if not upload:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+    return _upload_response(upload)
 
 
 @router.get("/{plant_id}", response_model=PlantResponse)
 async def get_plant(
     plant_id: int,
+    request: Request,
     db: Session = Depends(get_db)
 ):
-    """Get plant by ID"""
+    """Get plant by ID (supports If-None-Match)"""
     plant_service = PlantService(db)
-    plant = plant_service.get_plant_by_id(plant_id)
+    detail = plant_service.get_plant_detail(plant_id)
     
-    if not plant:
+    if not detail:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Plant not found"
         )
     
-    return plant
+    etag, body = detail
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response = Response(content=body, media_type="application/json")
+    set_validators(response, etag)
+    return response
 
 
 @router.put("/{plant_id}", response_model=PlantResponse)
@@ -210,14 +458,25 @@ async def delete_plant(
 async def get_my_plants(
     page: int = 1,
     size: int = 20,
+    fields: Optional[str] = None,
     current_user: User = Depends(require_seller_or_admin),
     db: Session = Depends(get_db)
 ):
-    """Get current seller's plants"""
+    """Get current seller's plants (`fields` limits the plant fields returned)"""
     plant_service = PlantService(db)
-    plants, total = plant_service.get_seller_plants(current_user.id, page, size)
+    field_names = parse_fields(fields, PlantResponse)
+    plants, total = plant_service.get_seller_plants(current_user.id, page, size, fields=field_names)
     pages = (total + size - 1) // size
     
+    if field_names:
+        return JSONResponse({
+            "plants": sparse_dump(plants, PlantResponse, field_names),
+            "total": total,
+            "page": page,
+            "size": size,
+            "pages": pages,
+        })
+    
     return PlantListResponse(
         plants=plants,
         total=total,
@@ -228,18 +487,105 @@ async def get_my_plants(
 
 
 # ML Prediction endpoints
-@router.post("/predict", response_model=PredictionResponse)
+@router.post("/predict", response_model=PredictionResponse, responses={202: {"model": PredictionJob}})
 async def predict_plant(
+    request: Request,
     image: UploadFile = File(...),
+    async_job: bool = Query(False, alias="async", description="Return a job to poll instead of waiting for the result"),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Predict plant type from uploaded image"""
+    """
+    Predict plant type from uploaded image.
+    
+    With `?async=true` the prediction is queued and 202 is returned at
+    once; follow it with `GET /plants/predictions/{prediction_id}` or its
+    `/events` stream.
+    """
     ml_service = MLService(db)
     
+    if async_job:
+        if prediction_jobs.full():
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many predictions in progress, please retry shortly"
+            )
+        prediction, image_data = await ml_service.create_prediction_job(image, current_user.id)
+        if image_data is not None:
+            prediction_jobs.submit(prediction.id, prediction.image_hash, image_data, sessionmaker(bind=db.get_bind()))
+        job = PredictionJob(
+            prediction_id=prediction.id,
+            status=prediction.status,
+            status_url=request.url_for("get_prediction", prediction_id=prediction.id).path,
+            events_url=request.url_for("get_prediction_events", prediction_id=prediction.id).path,
+        )
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=job.model_dump(mode="json"))
+    
     try:
-        result = ml_service.predict_from_file(image, current_user.id)
+        result = await ml_service.predict_upload(image, current_user.id)
         return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Prediction failed: {str(e)}"
+        )
+
+
+@router.post("/predict/batch", response_model=BatchPredictionResponse)
+async def predict_plants_batch(
+    images: List[UploadFile] = File(...),
+    current_user: User = Depends(require_seller_or_admin),
+    db: Session = Depends(get_db)
+):
+    """
+    Predict plant types for several images at once (catalog onboarding).
+    
+    Results come back in upload order. Images that cannot be read, or that
+    the classifier fails on, carry an `error` instead of failing the batch.
+    """
+    if len(images) > settings.prediction_batch_max_images:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.prediction_batch_max_images} images per batch"
+        )
+    
+    ml_service = MLService(db)
+    try:
+        results = await run_in_threadpool(ml_service.predict_batch, images, current_user.id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Prediction failed: {str(e)}"
+        )
+    failed = sum(1 for item in results if item.error)
+    return BatchPredictionResponse(results=results, succeeded=len(results) - failed, failed=failed)
+
+
+@router.post("/predict-url", response_model=PredictionResponse)
+async def predict_plant_from_url(
+    prediction_request: PredictionRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Predict plant type from an image URL.
+    
+    The image is downloaded with size and time limits; private and
+    loopback addresses are refused.
+    """
+    if not prediction_request.image_url:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="image_url is required"
+        )
+    
+    ml_service = MLService(db)
+    try:
+        return await run_in_threadpool(ml_service.predict_from_url, prediction_request.image_url, current_user.id)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -247,18 +593,106 @@ async def predict_plant(
         )
 
 
+# Columns the history list renders; `?compact=true` returns only these
+PREDICTION_HISTORY_COMPACT_FIELDS = ["id", "is_plant", "plant_type", "confidence", "status", "timestamp"]
+
+
 @router.get("/predictions/history", response_model=List[PredictionLog])
 async def get_prediction_history(
-    limit: int = 50,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    compact: bool = False,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Get user's prediction history"""
+    """
+    Get user's prediction history, newest first.
+    
+    When more predictions exist the `X-Next-Cursor` response header carries
+    a cursor; pass it back as `cursor` for the next page. `compact=true`
+    leaves out `image_url` and `uploaded_by`.
+    """
     ml_service = MLService(db)
-    predictions = ml_service.get_prediction_history(current_user.id, limit)
+    fields = PREDICTION_HISTORY_COMPACT_FIELDS if compact else None
+    predictions, next_cursor = ml_service.get_prediction_history(current_user.id, limit, cursor, fields=fields)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    
+    if compact:
+        return JSONResponse(sparse_dump(predictions, PredictionLog, fields), headers=headers)
+    
+    response.headers.update(headers)
     return predictions
 
 
+@router.get("/predictions/{prediction_id}", response_model=PredictionLog)
+async def get_prediction(
+    prediction_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Get one of the user's predictions, e.g. to poll a job started with `?async=true`"""
+    prediction = MLService(db).get_user_prediction(prediction_id, current_user.id)
+    if not prediction:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Prediction not found")
+    # A job whose worker went away would otherwise stay pending forever
+    if prediction.status not in TERMINAL_STATUSES and prediction_jobs.fail_stale(
+        db, settings.prediction_job_stale_after, prediction_id
+    ):
+        db.refresh(prediction)
+    return prediction
+
+
+@router.get("/predictions/{prediction_id}/events")
+async def get_prediction_events(
+    prediction_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Server-sent events for a prediction: a `prediction` event with the
+    current state, then one per change; the stream ends once the
+    prediction is completed or failed.
+    """
+    if not MLService(db).get_user_prediction(prediction_id, current_user.id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Prediction not found")
+    # The stream outlives the request's session; read with short-lived ones
+    session_factory = sessionmaker(bind=db.get_bind())
+    
+    def read_state() -> PredictionLog:
+        session = session_factory()
+        try:
+            prediction = session.query(Prediction).filter(Prediction.id == prediction_id).first()
+            if prediction.status not in TERMINAL_STATUSES and prediction_jobs.fail_stale(
+                session, settings.prediction_job_stale_after, prediction_id
+            ):
+                session.refresh(prediction)
+            return PredictionLog.model_validate(prediction)
+        finally:
+            session.close()
+    
+    async def events():
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.prediction_events_timeout
+        last_payload = None
+        while True:
+            state = await run_in_threadpool(read_state)
+            payload = state.model_dump_json()
+            if payload != last_payload:
+                yield f"event: prediction\ndata: {payload}\n\n"
+                last_payload = payload
+            remaining = deadline - loop.time()
+            if state.status in TERMINAL_STATUSES or remaining <= 0:
+                return
+            await prediction_jobs.wait(prediction_id, min(settings.prediction_events_poll_interval, remaining))
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.put("/{plant_id}/verify")
 async def verify_plant(
     plant_id: int,
@@ -4,6 +4,7 @@ from typing import List, Optional, Union
 import os
 import json
 import sys
+import tempfile
 
 
 class Settings(BaseSettings):
@@ -62,11 +63,57 @@ class Settings(BaseSettings):
     cloudinary_api_key: Optional[str] = None
     cloudinary_api_secret: Optional[str] = None
     
+    # Image storage (see app/core/storage.py)
+    storage_backend: str = "auto"  # auto (S3, then Cloudinary), s3, cloudinary or local
+    storage_local_root: str = "./uploads"  # Directory used by the local backend
+    storage_local_base_url: str = "/uploads"  # URL prefix the local backend is served under
+    storage_local_upload_url: str = "/api/v1/plants/uploads/local"  # Presigned PUT stand-in route
+    storage_max_connections: int = 20  # Connection pool size of the shared S3 client
+    
+    # Image processing (see app/services/image_pipeline.py)
+    image_process_workers: int = 2  # Processes for decode/resize/encode; 0 uses a thread instead
+    image_upload_workers: int = 8  # Threads for storage uploads
+    image_max_in_flight: int = 8  # Uploads handled at once per worker; the rest wait
+    image_variant_formats: str = "webp,jpeg"  # Add "avif" to also encode AVIF (slower)
+    image_upload_url_ttl: int = 900  # Seconds a presigned upload URL stays valid
+    image_upload_processing_timeout: int = 600  # Seconds after which an upload stuck in processing may be finalized again
+    image_upload_max_bytes: int = 15 * 1024 * 1024  # Largest accepted image upload (plants and predictions)
+    
+    # Plant identification (see app/services/classifier_backends.py)
+    classifier_backend: str = "gemini"  # gemini, or local (offline stub for load tests and development)
+    classifier_fallback: str = ""  # Set to "local" to answer with the local backend while Gemini fails
+    local_classifier_latency: float = 0.0  # Seconds the local backend waits per call, to mimic the upstream
+    
     # Google Gemini API
     gemini_api_key: Optional[str] = None
+    gemini_model: Optional[str] = None  # Pin a model and skip discovery, e.g. gemini-1.5-flash
+    gemini_model_cache_file: str = os.path.join(tempfile.gettempdir(), "plantit-gemini-model.json")  # Discovered model, shared by workers
+    gemini_model_cache_ttl: int = 7 * 86400  # Seconds before the model list is fetched again
+    classifier_timeout: float = 20.0  # Seconds allowed for one identification call
+    classifier_max_in_flight: int = 8  # Identification calls one worker has open at once (sync and async paths together)
+    classifier_breaker_failures: int = 5  # Consecutive failures that stop calls to the upstream
+    classifier_breaker_reset: float = 30.0  # Seconds before a trial call is let through again
     
     # ML Model Configuration
     model_confidence_threshold: float = 0.7
+    prediction_image_max_dimension: int = 1024  # Images are downscaled to this before classification
+    prediction_cache_size: int = 4096  # Recent results kept per worker, by perceptual hash
+    prediction_cache_ttl: int = 86400  # Seconds a result stays in the in-memory tier
+    prediction_cache_max_distance: int = 4  # Differing hash bits still treated as the same photo (0 = exact only)
+    prediction_batch_max_images: int = 20  # Images accepted by /plants/predict/batch
+    prediction_batch_concurrency: int = 4  # Images of one batch decoded/classified at once
+    prediction_job_workers: int = 4  # Threads running /plants/predict?async=true jobs
+    prediction_job_max_queued: int = 200  # Jobs waiting or running per worker before new ones get 503
+    prediction_job_stale_after: int = 300  # Seconds without a heartbeat after which a pending/processing prediction is failed as lost
+    prediction_events_timeout: float = 120.0  # Longest a prediction event stream stays open
+    prediction_events_poll_interval: float = 1.0  # Database re-check interval of an event stream
+    
+    # Remote images (POST /plants/predict-url, see app/core/remote_images.py)
+    remote_image_pool_size: int = 10  # Kept-alive connections per image host
+    remote_image_connect_timeout: float = 3.0  # Seconds to connect to an image host
+    remote_image_read_timeout: float = 10.0  # Longest silence while downloading
+    remote_image_total_timeout: float = 20.0  # Longest a whole download may take
+    remote_image_cache_dir: str = ""  # Keep downloads here and revalidate them by ETag (empty = no cache)
     
     # Supabase Configuration (optional - for direct API usage)
     supabase_url: Optional[str] = None
@@ -77,6 +124,12 @@ class Settings(BaseSettings):
     # Redis
     redis_url: str = "redis://localhost:6379/0"
     
+    # Catalog caching
+    catalog_count_cache_ttl: int = 30  # Seconds a cached listing total (and listing ETag state) stays valid
+    plant_detail_cache_size: int = 2048  # Serialized plant detail payloads kept per worker
+    plant_detail_cache_ttl: int = 600  # Upper bound on staleness if an invalidation is lost
+    catalog_invalidation_backend: str = "memory"  # "memory" (single worker) or "redis" (uses redis_url)
+    
     # Email
     sendgrid_api_key: Optional[str] = None
     from_email: str = "noreply@plantdelivery.com"
@@ -0,0 +1,50 @@
+"""
+Sparse fieldsets for list endpoints (`?fields=id,name,price`).
+
+parse_fields() checks the requested names against the response schema,
+load_only_columns() restricts the SELECT to the matching columns and
+sparse_dump() serializes only those attributes, so unrequested columns are
+neither read from the database nor sent to the client.
+"""
+from functools import lru_cache
+from typing import Iterable, List, Optional, Type
+from fastapi import HTTPException, status
+from pydantic import BaseModel, ConfigDict, create_model
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only
+
+
+def parse_fields(value: Optional[str], schema: Type[BaseModel], always: Iterable[str] = ("id",)) -> Optional[List[str]]:
+    """Parse a comma-separated `fields` value; None means every field"""
+    if not value:
+        return None
+    requested = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = sorted(set(requested) - set(schema.model_fields))
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}"
+        )
+    return list(dict.fromkeys([*always, *requested]))
+
+
+def load_only_columns(model, fields: Iterable[str], extra: Iterable[str] = ()):
+    """Loader option selecting only the mapped columns among `fields` and `extra`"""
+    column_names = inspect(model).column_attrs.keys()
+    names = [name for name in dict.fromkeys([*fields, *extra]) if name in column_names]
+    return load_only(*(getattr(model, name) for name in names))
+
+
+@lru_cache(maxsize=256)
+def _sparse_schema(schema: Type[BaseModel], fields: tuple) -> Type[BaseModel]:
+    return create_model(
+        f"{schema.__name__}Fields",
+        __config__=ConfigDict(from_attributes=True),
+        **{name: (schema.model_fields[name].annotation, None) for name in fields},
+    )
+
+
+def sparse_dump(objects, schema: Type[BaseModel], fields: List[str]) -> List[dict]:
+    """Serialize only `fields` of each object, typed as in `schema`"""
+    sparse = _sparse_schema(schema, tuple(fields))
+    return [sparse.model_validate(obj).model_dump(mode="json") for obj in objects]
@@ -0,0 +1,41 @@
+"""
+HTTP conditional GET helpers (ETag / If-None-Match).
+"""
+import hashlib
+from fastapi import Request, Response, status
+
+
+def make_etag(*parts) -> str:
+    """Build a weak ETag from the values that identify a representation"""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True if the request's If-None-Match already names this ETag (weak comparison)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    bare = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == bare:
+            return True
+    return False
+
+
+def set_validators(response: Response, etag: str) -> None:
+    """Attach the ETag and ask clients to revalidate before reusing a cached copy"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+
+
+def not_modified(etag: str) -> Response:
+    """304 response carrying the current validators and no body"""
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_validators(response, etag)
+    return response
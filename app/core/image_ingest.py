@@ -0,0 +1,59 @@
+"""
+Size-bounded reading of uploaded images.
+
+Uploads are read in chunks and rejected with 413 as soon as they pass the
+limit, instead of reading the whole body and checking afterwards, so one
+request never holds more than `max_bytes` of an upload in memory. Decoding
+at reduced resolution lives in app/core/imaging.py.
+"""
+import io
+from typing import AsyncIterable, BinaryIO
+from fastapi import HTTPException, UploadFile, status
+
+# Spooled uploads are read off disk in a thread per chunk; keep the hops few
+CHUNK_SIZE = 1024 * 1024
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Image is too large (limit {max_bytes // (1024 * 1024)} MB)"
+    )
+
+
+def read_limited(file: BinaryIO, max_bytes: int, chunk_size: int = CHUNK_SIZE) -> bytes:
+    """Read a file object to the end, failing once more than `max_bytes` arrive"""
+    buffer = io.BytesIO()
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            break
+        if buffer.tell() + len(chunk) > max_bytes:
+            raise _too_large(max_bytes)
+        buffer.write(chunk)
+    return buffer.getvalue()
+
+
+async def read_stream_limited(chunks: AsyncIterable[bytes], max_bytes: int) -> bytes:
+    """Collect an async byte stream (e.g. request.stream()), failing past `max_bytes`"""
+    buffer = io.BytesIO()
+    async for chunk in chunks:
+        if buffer.tell() + len(chunk) > max_bytes:
+            raise _too_large(max_bytes)
+        buffer.write(chunk)
+    return buffer.getvalue()
+
+
+async def read_upload(file: UploadFile, max_bytes: int, chunk_size: int = CHUNK_SIZE) -> bytes:
+    """Read a multipart upload, rejecting it early when its declared size is over the limit"""
+    if file.size is not None and file.size > max_bytes:
+        raise _too_large(max_bytes)
+
+    async def chunks():
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    return await read_stream_limited(chunks(), max_bytes)
@@ -0,0 +1,130 @@
+"""
+CPU-bound image transforms.
+
+These run inside worker processes (see app/services/image_pipeline.py), so
+the module only depends on PIL and takes and returns plain bytes.
+"""
+import hashlib
+import io
+import math
+from typing import Dict, Iterable
+from PIL import Image, ImageOps, features
+
+# Largest side of a stored plant image
+MAX_IMAGE_DIMENSION = 1920
+JPEG_QUALITY = 85
+
+# Variant name -> largest side in pixels. Grid views use thumb, cards use
+# card, the detail screen uses full.
+IMAGE_VARIANTS = {
+    "thumb": 320,
+    "card": 800,
+    "full": MAX_IMAGE_DIMENSION,
+}
+
+# Output format -> (PIL format, content type, extension, save options)
+VARIANT_FORMATS = {
+    "avif": ("AVIF", "image/avif", "avif", {"quality": 60}),
+    "webp": ("WEBP", "image/webp", "webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "image/jpeg", "jpg", {"quality": JPEG_QUALITY, "optimize": True, "progressive": True}),
+}
+
+# WebP for current clients plus a JPEG fallback
+DEFAULT_VARIANT_FORMATS = ("webp", "jpeg")
+
+
+def available_variant_formats(requested: Iterable[str]) -> tuple:
+    """The requested formats this PIL build can encode (AVIF support is optional)"""
+    return tuple(
+        name for name in requested
+        if name == "jpeg" or (name in VARIANT_FORMATS and features.check(name))
+    )
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 hex digest of raw image bytes; identifies an upload for dedup and caching"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def open_image(data: bytes, max_dimension: int) -> Image.Image:
+    """
+    Decode an image upright, in RGB, with its largest side at most `max_dimension`.
+
+    JPEGs are decoded directly at a reduced scale with draft() (libjpeg can
+    scale by 1/2, 1/4 or 1/8 while decoding), other formats are shrunk by an
+    integer factor with reduce() before the final resample, so a 12 MP photo
+    never has to be held in memory at full resolution.
+    """
+    image = Image.open(io.BytesIO(data))
+    scale = max_dimension / max(image.size)
+    if image.format == "JPEG" and scale < 1:
+        image.draft("RGB", (math.ceil(image.size[0] * scale), math.ceil(image.size[1] * scale)))
+    # Phone cameras store the rotation in EXIF instead of rotating pixels
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    factor = max(image.size) // max_dimension
+    if factor >= 2:
+        image = image.reduce(factor)
+    if image.size[0] > max_dimension or image.size[1] > max_dimension:
+        image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+    return image
+
+
+def encode_jpeg(image: Image.Image, quality: int = JPEG_QUALITY) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def compact_jpeg(data: bytes, max_dimension: int, quality: int = JPEG_QUALITY) -> bytes:
+    """Re-encode an image as an upright JPEG no larger than `max_dimension`"""
+    return encode_jpeg(open_image(data, max_dimension), quality)
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> str:
+    """
+    Difference hash of an image as hex (16 digits for the default 64 bits).
+
+    Compares neighbouring pixels of a tiny grayscale copy, so re-encoding,
+    resizing and small shifts in exposure or framing change only a few bits.
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for column in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+def hash_distance(a: str, b: str) -> int:
+    """Number of differing bits between two hex hashes of the same length"""
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+
+def build_image_variants(data: bytes, formats: Iterable[str] = DEFAULT_VARIANT_FORMATS) -> Dict[str, dict]:
+    """
+    Decode an image once and encode every size in IMAGE_VARIANTS.
+
+    Returns {variant: {"width", "height", "formats": {format: bytes}}}. The
+    original is decoded at the largest variant size (see open_image) and
+    each smaller size is downscaled from the previous one, which keeps the
+    resize work close to a single pass.
+    """
+    variants = {}
+    current = open_image(data, max(IMAGE_VARIANTS.values()))
+    for name, dimension in sorted(IMAGE_VARIANTS.items(), key=lambda item: -item[1]):
+        if current.size[0] > dimension or current.size[1] > dimension:
+            current = current.copy()
+            current.thumbnail((dimension, dimension), Image.Resampling.LANCZOS)
+        encoded = {}
+        for format_name in formats:
+            pil_format, _, _, options = VARIANT_FORMATS[format_name]
+            buffer = io.BytesIO()
+            current.save(buffer, format=pil_format, **options)
+            encoded[format_name] = buffer.getvalue()
+        variants[name] = {"width": current.size[0], "height": current.size[1], "formats": encoded}
+    return variants
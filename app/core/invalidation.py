@@ -0,0 +1,110 @@
+"""
+Cache invalidation channels shared by all workers.
+
+In-process caches live in every worker, so a change committed in one worker
+has to reach the others. publish() always runs the local handlers before
+returning, so a worker reads its own writes. The Redis backend then fans the
+message out over pub/sub (settings.redis_url) to the other workers. The
+in-memory backend stops at the local process; tests and single-worker
+deployments use it.
+"""
+import json
+import threading
+import uuid
+from typing import Callable, List
+from app.core.logging import logger
+
+# Optional redis import for cross-worker invalidation
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+    redis = None
+
+
+class InMemoryInvalidationBus:
+    """Delivers messages to handlers registered in this process"""
+
+    def __init__(self):
+        self._handlers: List[Callable[[str], None]] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, handler: Callable[[str], None]) -> None:
+        with self._lock:
+            self._handlers.append(handler)
+
+    def _deliver(self, message: str) -> None:
+        with self._lock:
+            handlers = list(self._handlers)
+        for handler in handlers:
+            try:
+                handler(message)
+            except Exception as e:
+                logger.error(f"Invalidation handler failed for {message!r}: {e}")
+
+    def publish(self, message: str) -> None:
+        self._deliver(message)
+
+    def close(self) -> None:
+        pass
+
+
+class RedisInvalidationBus(InMemoryInvalidationBus):
+    """Also relays messages to every other worker through a Redis channel"""
+
+    def __init__(self, url: str, channel: str):
+        super().__init__()
+        self.channel = channel
+        self._client = redis.Redis.from_url(url)
+        # Lets a worker skip its own messages, which it already applied
+        self._origin = uuid.uuid4().hex
+        self._closed = threading.Event()
+        self._listener = None
+
+    def subscribe(self, handler: Callable[[str], None]) -> None:
+        super().subscribe(handler)
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(
+                    target=self._listen, name=f"invalidation-{self.channel}", daemon=True
+                )
+                self._listener.start()
+
+    def publish(self, message: str) -> None:
+        self._deliver(message)
+        try:
+            self._client.publish(self.channel, json.dumps({"origin": self._origin, "message": message}))
+        except Exception as e:
+            # Other workers catch up when their cache entries expire
+            logger.warning(f"Failed to publish invalidation on {self.channel}: {e}")
+
+    def _listen(self) -> None:
+        while not self._closed.is_set():
+            try:
+                pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                while not self._closed.is_set():
+                    item = pubsub.get_message(timeout=1.0)
+                    if item is None:
+                        continue
+                    payload = json.loads(item["data"])
+                    if payload.get("origin") != self._origin:
+                        self._deliver(payload["message"])
+            except Exception as e:
+                logger.warning(f"Invalidation listener on {self.channel} disconnected: {e}")
+                self._closed.wait(5.0)
+
+    def close(self) -> None:
+        self._closed.set()
+
+
+def create_invalidation_bus(backend: str, redis_url: str, channel: str):
+    """Build the bus named by `backend` ("memory" or "redis")"""
+    if backend == "redis":
+        if REDIS_AVAILABLE:
+            return RedisInvalidationBus(redis_url, channel)
+        logger.warning("redis package not installed - cache invalidation stays within this worker")
+    elif backend != "memory":
+        logger.warning(f"Unknown invalidation backend {backend!r} - using in-memory")
+    return InMemoryInvalidationBus()
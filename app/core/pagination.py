@@ -0,0 +1,65 @@
+"""
+Opaque cursor helpers for keyset pagination.
+
+A cursor is the sort key of the last row a client has seen, serialized as
+URL-safe base64 JSON so clients treat it as an opaque token.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """Encode the sort key of the last row on a page into an opaque cursor"""
+    payload = [
+        {"dt": value.isoformat()} if isinstance(value, datetime) else value
+        for value in values
+    ]
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, length: int) -> List[Any]:
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Raises ValueError if the cursor is malformed or does not carry
+    exactly `length` key values.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+    if not isinstance(payload, list) or len(payload) != length:
+        raise ValueError("Invalid cursor")
+
+    values = []
+    for value in payload:
+        if isinstance(value, dict):
+            try:
+                value = datetime.fromisoformat(value["dt"])
+            except (KeyError, TypeError, ValueError):
+                raise ValueError("Invalid cursor")
+        values.append(value)
+    return values
+
+
+def keyset_timestamp(db: Session, column, value: Optional[datetime] = None):
+    """
+    Return a timestamp sort column (or a cursor value for it) in a form that compares correctly.
+
+    SQLite stores server-side timestamps and bound datetimes in different
+    text formats, so both sides are normalized there. PostgreSQL compares
+    natively so the sort indexes stay usable.
+    """
+    target = column if value is None else value
+    if db.get_bind().dialect.name == "sqlite":
+        if value is not None:
+            target = value.strftime("%Y-%m-%d %H:%M:%S.%f")
+        return func.strftime("%Y-%m-%d %H:%M:%f", target)
+    return target
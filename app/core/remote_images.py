@@ -0,0 +1,280 @@
+"""
+Downloads of remote images (POST /plants/predict-url).
+
+One pooled requests.Session per process keeps connections to image hosts
+alive between requests. Every download has a connect timeout, a read
+timeout and an overall deadline, is streamed with a byte cap, must be an
+image/* response and may not reach private or loopback addresses (redirects
+are followed by hand so each hop is checked, and the connection is pinned to
+the address that was checked so a second DNS answer cannot swap it). With REMOTE_IMAGE_CACHE_DIR
+set, bodies are kept on disk per URL and revalidated with the stored
+ETag / Last-Modified, so repeated URLs usually cost one 304.
+"""
+import hashlib
+import ipaddress
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from typing import Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+from fastapi import HTTPException, status
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError, ReadTimeoutError
+from urllib3.exceptions import HTTPError as Urllib3Error
+from urllib3.util import connection
+from app.core.config import settings
+from app.core.logging import logger
+
+CHUNK_SIZE = 8 * 1024
+MAX_REDIRECTS = 3
+
+# host -> address checked by _check_url for the request running on this thread
+_pinned = threading.local()
+
+
+def _error(status_code: int, detail: str) -> HTTPException:
+    return HTTPException(status_code=status_code, detail=detail)
+
+
+class _PinnedConnectionMixin:
+    """Connect to the pinned address; Host, SNI and certificate checks still use the hostname"""
+
+    def _new_conn(self):
+        address = getattr(_pinned, "hosts", {}).get(self.host.lower())
+        if address is None:
+            return super()._new_conn()
+        try:
+            return connection.create_connection(
+                (address, self.port),
+                self.timeout,
+                source_address=self.source_address,
+                socket_options=self.socket_options,
+            )
+        except socket.timeout as e:
+            raise ConnectTimeoutError(
+                self, f"Connection to {self.host} timed out. (connect timeout={self.timeout})"
+            ) from e
+        except OSError as e:
+            raise NewConnectionError(self, f"Failed to establish a new connection: {e}") from e
+
+
+class _PinnedHTTPConnection(_PinnedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _PinnedHTTPSConnection(_PinnedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _PinnedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _PinnedHTTPConnection
+
+
+class _PinnedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _PinnedHTTPSConnection
+
+
+class _PinnedAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _PinnedHTTPConnectionPool,
+            "https": _PinnedHTTPSConnectionPool,
+        }
+
+
+class RemoteImageFetcher:
+    def __init__(self, pool_size: int = 10, connect_timeout: float = 3.0, read_timeout: float = 10.0,
+                 total_timeout: float = 20.0, max_bytes: int = 15 * 1024 * 1024,
+                 cache_dir: str = "", allow_private: bool = False):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.allow_private = allow_private
+        self._session: Optional[requests.Session] = None
+        self._lock = threading.Lock()
+        self._counts = {"downloaded": 0, "revalidated": 0}
+
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = _PinnedAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=0)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    session.headers["User-Agent"] = "PlantDeliveryAPI/1.0 (+image fetch)"
+                    self._session = session
+        return self._session
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+
+    def _check_url(self, url: str) -> Optional[str]:
+        """Validate the URL and return the address to connect to (None when private hosts are allowed)"""
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise _error(status.HTTP_400_BAD_REQUEST, "Image URL must be an http(s) URL")
+        if self.allow_private:
+            return None
+        try:
+            addresses = [info[4][0] for info in socket.getaddrinfo(parts.hostname, parts.port or 443)]
+        except socket.gaierror:
+            raise _error(status.HTTP_400_BAD_REQUEST, "Image host could not be resolved")
+        for address in addresses:
+            ip = ipaddress.ip_address(address.split("%")[0])
+            if not ip.is_global:
+                raise _error(status.HTTP_400_BAD_REQUEST, "Image URL points to a private address")
+        return addresses[0]
+
+    def _get(self, url: str, headers: dict) -> requests.Response:
+        """GET with redirects followed manually, so every hop passes _check_url"""
+        for _ in range(MAX_REDIRECTS + 1):
+            address = self._check_url(url)
+            _pinned.hosts = {urlsplit(url).hostname: address} if address else {}
+            try:
+                response = self.session.get(
+                    url, headers=headers, stream=True, allow_redirects=False,
+                    timeout=(self.connect_timeout, self.read_timeout)
+                )
+            except requests.Timeout:
+                raise _error(status.HTTP_504_GATEWAY_TIMEOUT, "Image host timed out")
+            except requests.RequestException as e:
+                raise _error(status.HTTP_502_BAD_GATEWAY, f"Could not fetch image: {e.__class__.__name__}")
+            finally:
+                _pinned.hosts = {}
+            if response.is_redirect:
+                location = response.headers.get("location", "")
+                response.close()
+                url = urljoin(url, location)
+                continue
+            return response
+        raise _error(status.HTTP_502_BAD_GATEWAY, "Too many redirects")
+
+    def _read_body(self, response: requests.Response, started: float) -> bytes:
+        declared = response.headers.get("content-length")
+        if declared and declared.isdigit() and int(declared) > self.max_bytes:
+            raise _error(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, "Image is too large")
+        # read1 returns after a single socket read and the socket timeout is
+        # capped at the time left, so a host trickling bytes cannot outlast
+        # total_timeout by more than one read. urllib3 before 2.3 has no
+        # read1; read() there may wait for several socket reads per chunk
+        read = getattr(response.raw, "read1", None) or response.raw.read
+        sock = getattr(getattr(response.raw, "connection", None), "sock", None)
+        deadline = started + self.total_timeout
+        body = bytearray()
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise _error(status.HTTP_504_GATEWAY_TIMEOUT, "Image download took too long")
+            if sock is not None:
+                sock.settimeout(min(self.read_timeout, remaining))
+            try:
+                chunk = read(CHUNK_SIZE, decode_content=True)
+            except (ReadTimeoutError, socket.timeout):
+                raise _error(status.HTTP_504_GATEWAY_TIMEOUT, "Image download took too long")
+            except (Urllib3Error, OSError) as e:
+                raise _error(status.HTTP_502_BAD_GATEWAY, f"Could not fetch image: {e.__class__.__name__}")
+            if not chunk:
+                return bytes(body)
+            body.extend(chunk)
+            if len(body) > self.max_bytes:
+                raise _error(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, "Image is too large")
+
+    def _cache_paths(self, url: str) -> Tuple[str, str]:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.cache_dir, key[:2], key)
+        return f"{base}.json", f"{base}.bin"
+
+    def _cache_get(self, url: str) -> Optional[Tuple[dict, str]]:
+        meta_path, body_path = self._cache_paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url or not os.path.exists(body_path):
+            return None
+        return meta, body_path
+
+    def _cache_put(self, url: str, response: requests.Response, body: bytes) -> None:
+        validators = {
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+        }
+        if not any(validators.values()):
+            return
+        meta_path, body_path = self._cache_paths(url)
+        try:
+            os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+            # Body first, then metadata; both written then renamed
+            for path, data in ((body_path, body), (meta_path, json.dumps({"url": url, **validators}).encode("utf-8"))):
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+                with os.fdopen(fd, "wb") as tmp:
+                    tmp.write(data)
+                os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not cache remote image: {e}")
+
+    def fetch(self, url: str) -> bytes:
+        """Download an image, or reuse the cached copy if the server says it is unchanged"""
+        started = time.monotonic()
+        cached = self._cache_get(url) if self.cache_dir else None
+        headers = {"Accept": "image/*"}
+        if cached:
+            meta, _ = cached
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = self._get(url, headers)
+        with response:
+            if response.status_code == 304 and cached:
+                self._count("revalidated")
+                with open(cached[1], "rb") as f:
+                    return f.read()
+            if response.status_code != 200:
+                raise _error(status.HTTP_502_BAD_GATEWAY, f"Image host answered {response.status_code}")
+            content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+            if not content_type.startswith("image/"):
+                raise _error(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, "URL does not point to an image")
+            body = self._read_body(response, started)
+        self._count("downloaded")
+        if self.cache_dir:
+            self._cache_put(url, response, body)
+        return body
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counts)
+        stats["cache"] = bool(self.cache_dir)
+        return stats
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+
+
+# Process-wide fetcher; the connection pool is created on first use
+remote_image_fetcher = RemoteImageFetcher(
+    pool_size=settings.remote_image_pool_size,
+    connect_timeout=settings.remote_image_connect_timeout,
+    read_timeout=settings.remote_image_read_timeout,
+    total_timeout=settings.remote_image_total_timeout,
+    max_bytes=settings.image_upload_max_bytes,
+    cache_dir=settings.remote_image_cache_dir,
+)
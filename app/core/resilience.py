@@ -0,0 +1,73 @@
+"""
+Guards for calls to upstream services.
+
+CircuitBreaker stops calling an upstream that keeps failing: after
+`failure_threshold` consecutive failures it opens and callers fail fast for
+`reset_timeout` seconds, then a single trial call is let through (half-open)
+and its outcome closes or re-opens the circuit.
+"""
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._failures < self.failure_threshold:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go through now"""
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return
+            now = time.monotonic()
+            # One trial at a time; a trial that never reported back expires
+            if state == self.HALF_OPEN and (
+                self._trial_started_at is None or now - self._trial_started_at >= self.reset_timeout
+            ):
+                self._trial_started_at = now
+                return
+        raise CircuitOpenError(f"{self.name} is unavailable, retrying in at most {self.reset_timeout:g}s")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._trial_started_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_started_at = None
+            if self._failures >= self.failure_threshold:
+                # (Re)open: a failed trial call restarts the wait
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"state": self._state(), "consecutive_failures": self._failures}
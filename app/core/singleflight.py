@@ -0,0 +1,75 @@
+"""
+Coalescing of identical concurrent calls.
+
+While a call for a key is in flight, further calls for the same key wait for
+its result instead of starting their own. Works across threads (do) and
+event loops (do_async), and the two can share one flight: both sides wait on
+the same concurrent.futures.Future.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: dict = {}
+        self._tasks: set = set()  # Keep running tasks referenced until they finish
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def _join(self, key: Hashable) -> tuple[Future, bool]:
+        """The in-flight future for `key` and whether this caller must run the call"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def _forget(self, key: Hashable) -> None:
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args) -> tuple[Any, bool]:
+        """Run fn(*args) unless an identical call is in flight; returns (result, shared)"""
+        future, leader = self._join(key)
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            self._forget(key)
+            future.set_exception(e)
+            raise
+        self._forget(key)
+        future.set_result(result)
+        return result, False
+
+    async def do_async(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args) -> tuple[Any, bool]:
+        """
+        Await fn(*args) unless an identical call is in flight; returns (result, shared).
+
+        The call runs as its own task, so a caller that is cancelled (e.g. the
+        client disconnected) does not cancel it for the others waiting on it.
+        """
+        future, leader = self._join(key)
+        if leader:
+            task = asyncio.ensure_future(fn(*args))
+            self._tasks.add(task)
+
+            def finish(task: asyncio.Task) -> None:
+                self._tasks.discard(task)
+                self._forget(key)
+                if task.cancelled():
+                    future.cancel()
+                elif task.exception() is not None:
+                    future.set_exception(task.exception())
+                else:
+                    future.set_result(task.result())
+
+            task.add_done_callback(finish)
+        result = await asyncio.shield(asyncio.wrap_future(future))
+        return result, not leader
@@ -0,0 +1,277 @@
+"""
+Object storage for uploaded images.
+
+get_storage() returns one backend per process, chosen from Settings. With
+STORAGE_BACKEND=auto (the default) S3 is used when AWS credentials and a
+bucket are configured, then Cloudinary; the local filesystem backend is only
+used when asked for explicitly (offline development, tests, benchmarks).
+Clients are created on first upload and shared across threads, so request
+handlers never pay for building one.
+"""
+import hashlib
+import hmac
+import io
+import os
+import tempfile
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlencode
+from app.core.config import settings
+from app.core.logging import logger
+
+# Optional boto3 import for S3 storage
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    BOTO3_AVAILABLE = True
+except ImportError:
+    BOTO3_AVAILABLE = False
+    boto3 = None
+    BotoConfig = None
+
+# Optional cloudinary import
+try:
+    import cloudinary
+    import cloudinary.uploader
+    CLOUDINARY_AVAILABLE = True
+except ImportError:
+    CLOUDINARY_AVAILABLE = False
+    cloudinary = None
+
+# Uploaded keys are never rewritten, so they can be cached indefinitely
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class ObjectTooLarge(ValueError):
+    """Raised by StorageBackend.get when an object is over the caller's size limit"""
+
+
+class StorageBackend:
+    """Stores objects under a key and returns their public URL"""
+
+    name = "none"
+
+    def put(self, key: str, data: bytes, content_type: str) -> str:
+        raise NotImplementedError
+
+    def get(self, key: str, max_bytes: Optional[int] = None) -> bytes:
+        """Read an object; with `max_bytes`, raise ObjectTooLarge instead of reading more"""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def presign_put(self, key: str, content_type: str, expires_in: int) -> str:
+        """URL a client can PUT the object to directly, without going through the API"""
+        raise NotImplementedError(f"{self.name} storage does not support direct uploads")
+
+
+class S3Storage(StorageBackend):
+    name = "s3"
+
+    def __init__(self, bucket: str, region: str, access_key_id: str, secret_access_key: str,
+                 max_connections: int = 10):
+        self.bucket = bucket
+        self.region = region
+        self._credentials = (access_key_id, secret_access_key)
+        self._max_connections = max_connections
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        # boto3 clients are thread-safe once built; building one is not
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    access_key_id, secret_access_key = self._credentials
+                    self._client = boto3.client(
+                        's3',
+                        aws_access_key_id=access_key_id,
+                        aws_secret_access_key=secret_access_key,
+                        region_name=self.region,
+                        config=BotoConfig(
+                            max_pool_connections=self._max_connections,
+                            retries={"max_attempts": 3, "mode": "standard"},
+                        ),
+                    )
+        return self._client
+
+    def put(self, key: str, data: bytes, content_type: str) -> str:
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=data,
+            ContentType=content_type,
+            CacheControl=IMMUTABLE_CACHE_CONTROL,
+        )
+        return f"https://{self.bucket}.s3.{self.region}.amazonaws.com/{key}"
+
+    def get(self, key: str, max_bytes: Optional[int] = None) -> bytes:
+        response = self.client.get_object(Bucket=self.bucket, Key=key)
+        body = response["Body"]
+        try:
+            if max_bytes is None:
+                return body.read()
+            # Presigned PUTs cannot cap the object size, so check before reading
+            if response.get("ContentLength", 0) > max_bytes:
+                raise ObjectTooLarge(f"{key} is larger than {max_bytes} bytes")
+            data = body.read(max_bytes + 1)
+        finally:
+            body.close()
+        if len(data) > max_bytes:
+            raise ObjectTooLarge(f"{key} is larger than {max_bytes} bytes")
+        return data
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def presign_put(self, key: str, content_type: str, expires_in: int) -> str:
+        return self.client.generate_presigned_url(
+            'put_object',
+            Params={"Bucket": self.bucket, "Key": key, "ContentType": content_type},
+            ExpiresIn=expires_in,
+        )
+
+
+class CloudinaryStorage(StorageBackend):
+    name = "cloudinary"
+
+    def __init__(self, cloud_name: str, api_key: str, api_secret: str):
+        cloudinary.config(cloud_name=cloud_name, api_key=api_key, api_secret=api_secret, secure=True)
+
+    def put(self, key: str, data: bytes, content_type: str) -> str:
+        # Cloudinary adds the extension itself
+        public_id = key.rsplit(".", 1)[0]
+        result = cloudinary.uploader.upload(io.BytesIO(data), public_id=public_id, resource_type="image", overwrite=True)
+        return result["secure_url"]
+
+
+class LocalStorage(StorageBackend):
+    """
+    Writes objects under a directory that main.py serves at `base_url`.
+
+    Presigned uploads point at `upload_url` (the PUT stand-in route in
+    app/api/plants.py) with an HMAC signature instead of an S3 signature.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str, base_url: str, upload_url: str = "", secret: str = ""):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip("/")
+        self.upload_url = upload_url.rstrip("/")
+        self._secret = secret.encode("utf-8")
+
+    def path_for(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def put(self, key: str, data: bytes, content_type: str) -> str:
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        return f"{self.base_url}/{key}"
+
+    def get(self, key: str, max_bytes: Optional[int] = None) -> bytes:
+        with open(self.path_for(key), "rb") as f:
+            if max_bytes is None:
+                return f.read()
+            if os.fstat(f.fileno()).st_size > max_bytes:
+                raise ObjectTooLarge(f"{key} is larger than {max_bytes} bytes")
+            data = f.read(max_bytes + 1)
+        if len(data) > max_bytes:
+            raise ObjectTooLarge(f"{key} is larger than {max_bytes} bytes")
+        return data
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path_for(key))
+        except FileNotFoundError:
+            pass
+
+    def _signature(self, key: str, content_type: str, expires: int) -> str:
+        message = f"{key}\n{content_type}\n{expires}".encode("utf-8")
+        return hmac.new(self._secret, message, hashlib.sha256).hexdigest()
+
+    def presign_put(self, key: str, content_type: str, expires_in: int) -> str:
+        expires = int(time.time()) + expires_in
+        query = urlencode({"expires": expires, "signature": self._signature(key, content_type, expires)})
+        return f"{self.upload_url}/{key}?{query}"
+
+    def verify_put(self, key: str, content_type: str, expires: int, signature: str) -> bool:
+        """Check a presigned PUT issued by presign_put is genuine and unexpired"""
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(self._signature(key, content_type, expires), signature)
+
+
+def create_storage(backend: str) -> Optional[StorageBackend]:
+    """Build the backend named by `backend`; None when nothing usable is configured"""
+    s3_configured = bool(settings.aws_access_key_id and settings.aws_secret_access_key and settings.aws_bucket_name)
+    cloudinary_configured = bool(
+        settings.cloudinary_cloud_name and settings.cloudinary_api_key and settings.cloudinary_api_secret
+    )
+
+    if backend == "local":
+        return LocalStorage(
+            settings.storage_local_root,
+            settings.storage_local_base_url,
+            upload_url=settings.storage_local_upload_url,
+            secret=settings.secret_key,
+        )
+    if backend in ("auto", "s3") and s3_configured:
+        if BOTO3_AVAILABLE:
+            return S3Storage(
+                settings.aws_bucket_name,
+                settings.aws_region,
+                settings.aws_access_key_id,
+                settings.aws_secret_access_key,
+                max_connections=settings.storage_max_connections,
+            )
+        logger.warning("S3 is configured but boto3 is not installed")
+    if backend in ("auto", "cloudinary") and cloudinary_configured:
+        if CLOUDINARY_AVAILABLE:
+            return CloudinaryStorage(
+                settings.cloudinary_cloud_name, settings.cloudinary_api_key, settings.cloudinary_api_secret
+            )
+        logger.warning("Cloudinary is configured but the cloudinary package is not installed")
+    if backend not in ("auto", "s3", "cloudinary"):
+        logger.warning(f"Unknown storage backend {backend!r}")
+    return None
+
+
+_storage: Optional[StorageBackend] = None
+_storage_ready = False
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> Optional[StorageBackend]:
+    """Process-wide storage backend, created on first use"""
+    global _storage, _storage_ready
+    if not _storage_ready:
+        with _storage_lock:
+            if not _storage_ready:
+                _storage = create_storage(settings.storage_backend)
+                _storage_ready = True
+                logger.info(f"Image storage backend: {_storage.name if _storage else 'none'}")
+    return _storage
+
+
+def reset_storage() -> None:
+    """Forget the current backend so the next get_storage() re-reads settings"""
+    global _storage, _storage_ready
+    with _storage_lock:
+        _storage = None
+        _storage_ready = False
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Text, ForeignKey, Enum
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Text, ForeignKey, Enum, DDL, Index, JSON, event
+from sqlalchemy.orm import relationship, object_session
 from sqlalchemy.sql import func
 from app.core.database import Base
 import enum
@@ -33,6 +33,20 @@ class ApprovalStatus(str, enum.Enum):
     REJECTED = "rejected"
 
 
+class UploadStatus(str, enum.Enum):
+    PENDING = "pending"  # Waiting for the client to PUT the bytes
+    PROCESSING = "processing"
+    READY = "ready"
+    FAILED = "failed"
+
+
+class PredictionStatus(str, enum.Enum):
+    PENDING = "pending"  # Queued job (POST /plants/predict?async=true)
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
 class User(Base):
     __tablename__ = "users"
     
@@ -63,6 +77,8 @@ class Plant(Base):
     name = Column(String(200), nullable=False)
     description = Column(Text, nullable=True)
     image_url = Column(String(500), nullable=True)
+    # {"thumb"|"card"|"full": {"width", "height", "webp", "jpeg", ...}} for uploaded images
+    image_variants = Column(JSON, nullable=True)
     price = Column(Float, nullable=False)
     category = Column(String(100), nullable=True)
     species = Column(String(200), nullable=True)
@@ -72,12 +88,80 @@ class Plant(Base):
     verified_by_ai = Column(Boolean, default=False)
     is_active = Column(Boolean, default=True)
     approval_status = Column(Enum(ApprovalStatus), default=ApprovalStatus.PENDING, nullable=False)
+    # Denormalized so listings can sort by popularity and rating from an index
+    sales_count = Column(Integer, default=0, server_default="0", nullable=False)
+    rating_average = Column(Float, default=0.0, server_default="0", nullable=False)
+    rating_count = Column(Integer, default=0, server_default="0", nullable=False)
+    # Bumped on every UPDATE (see _bump_plant_version); used as the detail ETag
+    version = Column(Integer, default=1, server_default="1", nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
     seller = relationship("User", back_populates="plants")
     order_items = relationship("OrderItem", back_populates="plant")
+    
+    # One index per listing sort, with and without the category filter, led by
+    # the filters every catalog query applies (see PLANT_SORTS in plant_service)
+    __table_args__ = (
+        Index("ix_plants_listing_newest", "is_active", "approval_status", "created_at", "id"),
+        Index("ix_plants_category_newest", "is_active", "approval_status", "category", "created_at", "id"),
+        Index("ix_plants_listing_price", "is_active", "approval_status", "price", "id"),
+        Index("ix_plants_category_price", "is_active", "approval_status", "category", "price", "id"),
+        Index("ix_plants_listing_popular", "is_active", "approval_status", "sales_count", "id"),
+        Index("ix_plants_category_popular", "is_active", "approval_status", "category", "sales_count", "id"),
+        Index("ix_plants_listing_rating", "is_active", "approval_status", "rating_average", "id"),
+        Index("ix_plants_category_rating", "is_active", "approval_status", "category", "rating_average", "id"),
+    )
+
+
+@event.listens_for(Plant, "before_update")
+def _bump_plant_version(mapper, connection, target):
+    # updated_at only has second precision on some backends, so HTTP
+    # validators use this counter instead
+    if object_session(target).is_modified(target, include_collections=False):
+        target.version = (target.version or 0) + 1
+
+
+# Full-text search over the plant catalog (queried by app/services/plant_search.py).
+# PostgreSQL uses a GIN index on a tsvector expression; SQLite uses an FTS5
+# external-content table kept in sync with triggers. Alembic migration 002
+# creates the same objects for databases that are not built with create_all.
+PLANT_SEARCH_COLUMNS = ("name", "species", "category", "description")
+
+event.listen(
+    Plant.__table__,
+    "after_create",
+    DDL(
+        "CREATE INDEX IF NOT EXISTS ix_plants_search_document ON plants USING gin "
+        "(to_tsvector('english', coalesce(name, '') || ' ' || coalesce(species, '') || ' ' || "
+        "coalesce(category, '') || ' ' || coalesce(description, '')))"
+    ).execute_if(dialect="postgresql"),
+)
+
+_sqlite_fts_columns = ", ".join(PLANT_SEARCH_COLUMNS)
+_sqlite_fts_new = ", ".join(f"new.{c}" for c in PLANT_SEARCH_COLUMNS)
+_sqlite_fts_old = ", ".join(f"old.{c}" for c in PLANT_SEARCH_COLUMNS)
+for _statement in (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS plants_fts USING fts5({_sqlite_fts_columns}, "
+    "content='plants', content_rowid='id', tokenize='porter unicode61')",
+    "INSERT INTO plants_fts(plants_fts) VALUES ('rebuild')",
+    f"CREATE TRIGGER IF NOT EXISTS plants_fts_ai AFTER INSERT ON plants BEGIN "
+    f"INSERT INTO plants_fts(rowid, {_sqlite_fts_columns}) VALUES (new.id, {_sqlite_fts_new}); END",
+    f"CREATE TRIGGER IF NOT EXISTS plants_fts_ad AFTER DELETE ON plants BEGIN "
+    f"INSERT INTO plants_fts(plants_fts, rowid, {_sqlite_fts_columns}) VALUES ('delete', old.id, {_sqlite_fts_old}); END",
+    f"CREATE TRIGGER IF NOT EXISTS plants_fts_au AFTER UPDATE OF {_sqlite_fts_columns} ON plants BEGIN "
+    f"INSERT INTO plants_fts(plants_fts, rowid, {_sqlite_fts_columns}) VALUES ('delete', old.id, {_sqlite_fts_old}); "
+    f"INSERT INTO plants_fts(rowid, {_sqlite_fts_columns}) VALUES (new.id, {_sqlite_fts_new}); END",
+):
+    event.listen(Plant.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+
+# The FTS5 table is not part of the metadata, so drop it alongside plants
+event.listen(
+    Plant.__table__,
+    "before_drop",
+    DDL("DROP TABLE IF EXISTS plants_fts").execute_if(dialect="sqlite"),
+)
 
 
 class Order(Base):
@@ -115,6 +199,35 @@ class OrderItem(Base):
     plant = relationship("Plant", back_populates="order_items")
 
 
+class ImageBlob(Base):
+    """A processed image upload, keyed by the SHA-256 of the uploaded bytes"""
+    __tablename__ = "image_blobs"
+    
+    sha256 = Column(String(64), primary_key=True)
+    image_url = Column(String(500), nullable=False)  # Full-size JPEG
+    variants = Column(JSON, nullable=False)  # Same shape as Plant.image_variants
+    width = Column(Integer, nullable=False)  # Of the full variant
+    height = Column(Integer, nullable=False)
+    size_bytes = Column(Integer, nullable=False)  # Of the original upload
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class ImageUpload(Base):
+    """A direct-to-storage upload, from presigned URL to processed variants"""
+    __tablename__ = "image_uploads"
+    
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    object_key = Column(String(300), nullable=False)  # Where the client PUTs the original
+    content_type = Column(String(100), nullable=False)
+    status = Column(Enum(UploadStatus), default=UploadStatus.PENDING, nullable=False)
+    sha256 = Column(String(64), nullable=True)
+    variants = Column(JSON, nullable=True)  # Same shape as Plant.image_variants
+    error = Column(String(500), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
 class Prediction(Base):
     __tablename__ = "predictions"
     
@@ -124,10 +237,18 @@ class Prediction(Base):
     plant_type = Column(String(200), nullable=True)
     confidence = Column(Float, nullable=False)
     uploaded_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    image_hash = Column(String(16), nullable=True, index=True)  # dHash of the classified image
+    status = Column(Enum(PredictionStatus), default=PredictionStatus.COMPLETED, server_default="COMPLETED", nullable=False)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())  # Also the heartbeat of a running job
     
     # Relationships
     user = relationship("User", back_populates="predictions")
+    
+    __table_args__ = (
+        # Keyset pagination of a user's history (newest first)
+        Index("ix_predictions_user_timestamp", "uploaded_by", timestamp.desc(), "id"),
+    )
 
 
 class DeliveryAgent(Base):
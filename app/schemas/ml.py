@@ -1,6 +1,7 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
+from app.models import PredictionStatus
 
 
 class PredictionRequest(BaseModel):
@@ -12,15 +13,39 @@ class PredictionResponse(BaseModel):
     plant_type: str
     confidence: float
     prediction_id: Optional[int] = None
+    cached: bool = False  # Served from an earlier prediction of the same (or a near-identical) photo
+    degraded: bool = False  # Answered by the fallback classifier because the primary one failed
+
+
+class PredictionJob(BaseModel):
+    """Returned by POST /plants/predict?async=true"""
+    prediction_id: int
+    status: PredictionStatus
+    status_url: str  # Poll with GET
+    events_url: str  # Or subscribe (text/event-stream)
+
+
+class BatchPredictionItem(BaseModel):
+    index: int  # Position of the image in the request
+    filename: Optional[str] = None
+    result: Optional[PredictionResponse] = None  # None when the image could not be read
+    error: Optional[str] = None
+
+
+class BatchPredictionResponse(BaseModel):
+    results: List[BatchPredictionItem]
+    succeeded: int
+    failed: int
 
 
 class PredictionLog(BaseModel):
     id: int
     image_url: str
     is_plant: bool
-    plant_type: str
+    plant_type: Optional[str] = None  # None until a queued prediction completes
     confidence: float
     uploaded_by: Optional[int] = None
+    status: PredictionStatus = PredictionStatus.COMPLETED
     timestamp: datetime
     
     class Config:
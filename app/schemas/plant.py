@@ -1,6 +1,22 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
+import enum
+from app.models import UploadStatus
+
+
+class CountMode(str, enum.Enum):
+    ESTIMATE = "estimate"  # Cached total, may lag writes by a few seconds
+    EXACT = "exact"  # Always run COUNT
+    NONE = "none"  # Skip the count (infinite scroll)
+
+
+class PlantSort(str, enum.Enum):
+    NEWEST = "newest"
+    PRICE_ASC = "price_asc"
+    PRICE_DESC = "price_desc"
+    POPULAR = "popular"  # Most units sold
+    RATING = "rating"  # Highest average review rating
 
 
 class PlantBase(BaseModel):
@@ -28,9 +44,18 @@ class PlantUpdate(BaseModel):
     is_active: Optional[bool] = None
 
 
+class ImageVariant(BaseModel):
+    width: int
+    height: int
+    webp: Optional[str] = None
+    jpeg: Optional[str] = None
+    avif: Optional[str] = None  # Only when AVIF output is enabled
+
+
 class PlantResponse(PlantBase):
     id: int
-    image_url: Optional[str] = None
+    image_url: Optional[str] = None  # Full-size JPEG
+    image_variants: Optional[Dict[str, ImageVariant]] = None  # thumb, card and full
     seller_id: int
     verified_by_ai: bool
     is_active: bool
@@ -43,13 +68,47 @@ class PlantResponse(PlantBase):
 
 class PlantListResponse(BaseModel):
     plants: List[PlantResponse]
-    total: int
+    total: Optional[int] = None  # None when count=none
     page: int
     size: int
-    pages: int
+    pages: Optional[int] = None
+    next_cursor: Optional[str] = None  # Pass as `cursor` to fetch the next page
+
+
+class PlantBatchResponse(BaseModel):
+    plants: List[PlantResponse]  # In request order
+    missing: List[int]  # Requested IDs that do not exist
+
+
+class Suggestion(BaseModel):
+    text: str
+    kind: str  # plant, species or category
+
+
+class SuggestResponse(BaseModel):
+    suggestions: List[Suggestion]
+
+
+class FacetCount(BaseModel):
+    value: Optional[str] = None
+    count: int
+
+
+class PriceBucket(BaseModel):
+    min_price: float
+    max_price: Optional[float] = None  # None for the open-ended top bucket
+    count: int
+
+
+class PlantFacetsResponse(BaseModel):
+    total: int
+    verified_count: int
+    categories: List[FacetCount]
+    price_buckets: List[PriceBucket]
 
 
 class PlantSearchParams(BaseModel):
+    q: Optional[str] = None  # Full-text search over name, species, category and description
     name: Optional[str] = None
     category: Optional[str] = None
     min_price: Optional[float] = None
@@ -57,3 +116,28 @@ class PlantSearchParams(BaseModel):
     verified_only: Optional[bool] = None
     page: int = 1
     size: int = 20
+    cursor: Optional[str] = None
+    sort: Optional[PlantSort] = None  # Defaults to relevance for q, newest otherwise
+    count: CountMode = CountMode.ESTIMATE
+    fields: Optional[List[str]] = None  # Sparse fieldset; None loads every column
+
+
+class ImageUploadCreate(BaseModel):
+    content_type: str = "image/jpeg"
+
+
+class ImageUploadTicket(BaseModel):
+    upload_id: str
+    upload_url: str  # PUT the image bytes here
+    method: str = "PUT"
+    headers: Dict[str, str]  # Send these headers with the PUT
+    expires_in: int  # Seconds
+
+
+class ImageUploadResponse(BaseModel):
+    id: str
+    status: UploadStatus
+    image_url: Optional[str] = None  # Full-size JPEG once ready
+    image_variants: Optional[Dict[str, ImageVariant]] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
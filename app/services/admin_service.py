@@ -8,6 +8,7 @@ from app.schemas.admin import (
     TopSeller, AdminDashboard, SystemHealth
 )
 from app.core.logging import logger
+from app.services.catalog_cache import invalidate_catalog
 from io import BytesIO
 
 # Optional reportlab import for PDF generation
@@ -284,7 +285,7 @@ class AdminService:
         # Check ML model
         try:
             from app.services.ml_service import plant_classifier
-            ml_model_status = "healthy" if plant_classifier.model else "not_configured"
+            ml_model_status = "healthy" if plant_classifier.status() != "not_configured" else "not_configured"
         except Exception:
             ml_model_status = "unhealthy"
         
@@ -404,4 +405,5 @@ class AdminService:
             return False
         plant.approval_status = status
         self.db.commit()
+        invalidate_catalog(plant.id)
         return True
@@ -0,0 +1,112 @@
+"""
+Caches derived from the plant catalog and their invalidation.
+
+Services call invalidate_catalog() after committing any change that can
+alter what catalog reads return (create, update, approval, deactivation,
+stock and rating changes). Invalidations go through catalog_bus so that,
+with the Redis backend, every worker drops its copies.
+"""
+import threading
+import uuid
+from typing import Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.invalidation import create_invalidation_bus
+from app.models import Plant
+from app.schemas.plant import PlantSearchParams
+from app.services.suggest_index import plant_suggest_index
+
+
+# Total match counts for listing queries, keyed by the normalized filter set
+plant_count_cache = TTLCache(maxsize=2048, ttl=settings.catalog_count_cache_ttl)
+
+# Facet aggregates for listing queries, keyed the same way
+plant_facet_cache = TTLCache(maxsize=512, ttl=settings.catalog_count_cache_ttl)
+
+# Serialized PlantResponse payloads as (etag, JSON bytes), keyed by plant id
+plant_detail_cache = TTLCache(maxsize=settings.plant_detail_cache_size, ttl=settings.plant_detail_cache_ttl)
+
+# Database-derived state behind listing ETags (see catalog_fingerprint)
+_catalog_fingerprints = TTLCache(maxsize=1, ttl=settings.catalog_count_cache_ttl)
+
+# Change counter of this process; lets readers notice an invalidation that
+# raced with them. The epoch keeps tokens from different processes apart.
+_catalog_epoch = uuid.uuid4().hex[:12]
+_catalog_version = 0
+_catalog_version_lock = threading.Lock()
+
+
+def _normalize_text(value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return None
+    value = " ".join(value.lower().split())
+    return value or None
+
+
+def catalog_filter_key(search_params: PlantSearchParams) -> tuple:
+    """Key identifying the set of plants a search matches, ignoring pagination"""
+    return (
+        _normalize_text(search_params.q),
+        _normalize_text(search_params.name),
+        search_params.category,
+        search_params.min_price,
+        search_params.max_price,
+        bool(search_params.verified_only),
+    )
+
+
+def catalog_version() -> str:
+    """Opaque token that changes whenever invalidate_catalog() runs"""
+    return f"{_catalog_epoch}.{_catalog_version}"
+
+
+def catalog_fingerprint(db: Session) -> str:
+    """
+    Opaque token that changes with any plant insert, update or delete.
+    
+    Built from the plants table itself (row count, highest id, sum of row
+    versions), so every worker derives the same token and writes made by
+    another worker show up within catalog_count_cache_ttl seconds even
+    without a shared invalidation bus. Local invalidations drop it at once.
+    """
+    fingerprint = _catalog_fingerprints.get("plants")
+    if fingerprint is not None:
+        return fingerprint
+    
+    version = catalog_version()
+    count, max_id, versions = db.query(
+        func.count(Plant.id), func.max(Plant.id), func.sum(Plant.version)
+    ).one()
+    fingerprint = f"{count}.{max_id or 0}.{versions or 0}"
+    # Skip caching if the catalog changed while we were reading
+    if catalog_version() == version:
+        _catalog_fingerprints.set("plants", fingerprint)
+    return fingerprint
+
+
+def _apply_invalidation(message: str) -> None:
+    global _catalog_version
+    plant_id = None if message == "*" else int(message)
+    with _catalog_version_lock:
+        _catalog_version += 1
+    _catalog_fingerprints.clear()
+    plant_count_cache.clear()
+    plant_facet_cache.clear()
+    if plant_id is None:
+        plant_detail_cache.clear()
+    else:
+        plant_detail_cache.pop(plant_id)
+    plant_suggest_index.mark_stale(plant_id)
+
+
+catalog_bus = create_invalidation_bus(
+    settings.catalog_invalidation_backend, settings.redis_url, "plant-catalog-invalidation"
+)
+catalog_bus.subscribe(_apply_invalidation)
+
+
+def invalidate_catalog(plant_id: Optional[int] = None) -> None:
+    """Drop cached catalog data after a plant was created or changed"""
+    catalog_bus.publish("*" if plant_id is None else str(plant_id))
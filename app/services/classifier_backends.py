@@ -0,0 +1,129 @@
+"""
+Plant classifier backends.
+
+Every backend takes a compact JPEG (see app.core.imaging.compact_jpeg) and
+returns {"is_plant", "plant_type", "confidence"}; failures are reported as
+results whose plant_type starts with "Error:". The Gemini backend lives in
+app/services/ml_service.py, which also picks the backend from Settings
+(CLASSIFIER_BACKEND, CLASSIFIER_FALLBACK).
+"""
+import asyncio
+import io
+import time
+from PIL import Image
+from app.core.imaging import content_hash
+
+
+def is_error_result(result: dict) -> bool:
+    return (result.get("plant_type") or "").startswith("Error:")
+
+
+class ClassifierBackend:
+    name = "none"
+
+    def predict(self, image_data: bytes) -> dict:
+        raise NotImplementedError
+
+    async def predict_async(self, image_data: bytes) -> dict:
+        return await asyncio.to_thread(self.predict, image_data)
+
+    def status(self) -> str:
+        """ready, configured or not_configured; must not call any upstream"""
+        return "ready"
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "status": self.status()}
+
+
+class LocalClassifier(ClassifierBackend):
+    """
+    Offline stand-in for Gemini: a deterministic colour heuristic plus a
+    configurable delay that mimics upstream latency.
+
+    Mostly-green images are "plants" and get a label picked from the image
+    hash, so the same photo always gets the same answer. Good for load
+    tests and as a degraded-mode answer, not for identifying plants.
+    """
+
+    name = "local"
+    LABELS = (
+        "Monstera Deliciosa",
+        "Snake Plant",
+        "Pothos",
+        "Peace Lily",
+        "Fiddle Leaf Fig",
+        "Spider Plant",
+        "ZZ Plant",
+        "Aloe Vera",
+    )
+
+    def __init__(self, latency: float = 0.0, green_threshold: float = 0.25):
+        self.latency = latency
+        self.green_threshold = green_threshold
+
+    def _classify(self, image_data: bytes) -> dict:
+        image = Image.open(io.BytesIO(image_data))
+        image.draft("RGB", (64, 64))
+        image = image.convert("RGB")
+        image.thumbnail((32, 32))
+        pixels = image.tobytes()
+        total = len(pixels) // 3
+        green = sum(
+            1 for i in range(0, len(pixels), 3)
+            if pixels[i + 1] > pixels[i] and pixels[i + 1] > pixels[i + 2]
+        )
+        ratio = green / total if total else 0.0
+        if ratio < self.green_threshold:
+            return {"is_plant": False, "plant_type": "Not a plant", "confidence": 0.0}
+        label = self.LABELS[int(content_hash(image_data)[:8], 16) % len(self.LABELS)]
+        return {"is_plant": True, "plant_type": label, "confidence": round(min(0.5 + ratio / 2, 0.95), 2)}
+
+    def predict(self, image_data: bytes) -> dict:
+        if self.latency:
+            time.sleep(self.latency)
+        try:
+            return self._classify(image_data)
+        except Exception as e:
+            return {"is_plant": False, "plant_type": f"Error: {str(e)}", "confidence": 0.0}
+
+    async def predict_async(self, image_data: bytes) -> dict:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        try:
+            return await asyncio.to_thread(self._classify, image_data)
+        except Exception as e:
+            return {"is_plant": False, "plant_type": f"Error: {str(e)}", "confidence": 0.0}
+
+
+class FallbackClassifier(ClassifierBackend):
+    """
+    Answers from `fallback` whenever `primary` returns an error (upstream
+    down, circuit open, timed out, not configured). Such results carry
+    "degraded": True and are never cached.
+    """
+
+    def __init__(self, primary: ClassifierBackend, fallback: ClassifierBackend):
+        self.primary = primary
+        self.fallback = fallback
+        self.name = primary.name
+
+    def _degraded(self, result: dict) -> dict:
+        return {**result, "degraded": True}
+
+    def predict(self, image_data: bytes) -> dict:
+        result = self.primary.predict(image_data)
+        if is_error_result(result):
+            return self._degraded(self.fallback.predict(image_data))
+        return result
+
+    async def predict_async(self, image_data: bytes) -> dict:
+        result = await self.primary.predict_async(image_data)
+        if is_error_result(result):
+            return self._degraded(await self.fallback.predict_async(image_data))
+        return result
+
+    def status(self) -> str:
+        return self.primary.status()
+
+    def stats(self) -> dict:
+        return {**self.primary.stats(), "fallback": self.fallback.name}
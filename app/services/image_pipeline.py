@@ -0,0 +1,282 @@
+"""
+Image upload pipeline that keeps PIL and storage I/O off the event loop.
+
+Each upload is decoded once and encoded into every size in IMAGE_VARIANTS
+and every configured format. Decoding and encoding run in a process pool
+(they hold the GIL), storage uploads run in a thread pool (they wait on the
+network). Objects are stored under the SHA-256 of the uploaded bytes and
+recorded in image_blobs, so re-uploading a photo skips both. A semaphore
+caps the uploads one worker handles at once; the rest wait their turn, so a
+burst of uploads queues up instead of exhausting memory. stats() exposes the
+queue depths for /health.
+"""
+import asyncio
+import threading
+import weakref
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Optional
+from fastapi import UploadFile, HTTPException, status
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.imaging import build_image_variants, available_variant_formats, content_hash, VARIANT_FORMATS
+from app.core.image_ingest import read_upload
+from app.core.logging import logger
+from app.core.storage import get_storage, ObjectTooLarge
+from app.models import ImageBlob, ImageUpload, UploadStatus
+
+
+# Formats generated for every upload, e.g. "webp,jpeg" or "avif,webp,jpeg"
+IMAGE_FORMATS = available_variant_formats(
+    name.strip() for name in settings.image_variant_formats.split(",") if name.strip()
+)
+
+
+def variant_objects(built: Dict[str, dict], prefix: str, digest: str) -> List[tuple]:
+    """(variant, format, storage key, bytes, content type) for every encoded variant"""
+    objects = []
+    for variant, info in built.items():
+        for format_name, data in info["formats"].items():
+            _, content_type, extension, _ = VARIANT_FORMATS[format_name]
+            objects.append((variant, format_name, f"{prefix}/{digest}/{variant}.{extension}", data, content_type))
+    return objects
+
+
+def variant_manifest(built: Dict[str, dict], objects: List[tuple], urls: List[str]) -> Dict[str, dict]:
+    """The `image_variants` value stored on a plant: sizes plus one URL per format"""
+    manifest = {variant: {"width": info["width"], "height": info["height"]} for variant, info in built.items()}
+    for (variant, format_name, _, _, _), url in zip(objects, urls):
+        manifest[variant][format_name] = url
+    return manifest
+
+
+def primary_image_url(manifest: Dict[str, dict]) -> str:
+    """URL kept in Plant.image_url for clients that predate variants"""
+    full = manifest["full"]
+    return full.get("jpeg") or next(value for key, value in full.items() if key not in ("width", "height"))
+
+
+def find_blob(db: Session, digest: str) -> Optional[dict]:
+    """Variant manifest of an already processed upload with this hash"""
+    blob = db.query(ImageBlob).filter(ImageBlob.sha256 == digest).first()
+    return blob.variants if blob else None
+
+
+def save_blob(db: Session, digest: str, manifest: Dict[str, dict], size_bytes: int) -> None:
+    """Record a processed upload; a concurrent upload of the same bytes may win the insert"""
+    db.add(ImageBlob(
+        sha256=digest,
+        image_url=primary_image_url(manifest),
+        variants=manifest,
+        width=manifest["full"]["width"],
+        height=manifest["full"]["height"],
+        size_bytes=size_bytes,
+    ))
+    try:
+        db.commit()
+    except IntegrityError:
+        # Same keys, same content: the other upload's row is equivalent
+        db.rollback()
+
+
+class ImagePipeline:
+    def __init__(self, process_workers: int, upload_workers: int, max_in_flight: int):
+        self.process_workers = process_workers
+        self.upload_workers = upload_workers
+        self.max_in_flight = max_in_flight
+        self._process_pool: Optional[Executor] = None
+        self._upload_pool: Optional[Executor] = None
+        self._lock = threading.Lock()
+        # asyncio semaphores belong to one event loop
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._counts = {"waiting": 0, "processing": 0, "uploading": 0, "completed": 0, "deduplicated": 0, "failed": 0}
+
+    def _pools(self) -> tuple:
+        if self._upload_pool is None:
+            with self._lock:
+                if self._upload_pool is None:
+                    process_pool = None
+                    if self.process_workers > 0:
+                        try:
+                            process_pool = ProcessPoolExecutor(max_workers=self.process_workers)
+                        except (OSError, NotImplementedError) as e:
+                            # Some serverless runtimes cannot start processes
+                            logger.warning(f"Image process pool unavailable, using threads: {e}")
+                    self._process_pool = process_pool or ThreadPoolExecutor(
+                        max_workers=max(self.process_workers, 1), thread_name_prefix="image-process"
+                    )
+                    self._upload_pool = ThreadPoolExecutor(
+                        max_workers=self.upload_workers, thread_name_prefix="image-upload"
+                    )
+        return self._process_pool, self._upload_pool
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_in_flight)
+            return semaphore
+
+    def _count(self, name: str, delta: int) -> None:
+        with self._lock:
+            self._counts[name] += delta
+
+    async def process(self, data: bytes) -> Dict[str, dict]:
+        """Build every size and format of an image in the process pool"""
+        process_pool, _ = self._pools()
+        self._count("processing", 1)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                process_pool, build_image_variants, data, IMAGE_FORMATS
+            )
+        finally:
+            self._count("processing", -1)
+
+    async def put(self, key: str, data: bytes, content_type: str) -> str:
+        """Store bytes through the storage backend in the upload thread pool"""
+        storage = get_storage()
+        if storage is None:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Image storage not configured"
+            )
+        _, upload_pool = self._pools()
+        self._count("uploading", 1)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(upload_pool, storage.put, key, data, content_type)
+        finally:
+            self._count("uploading", -1)
+
+    @asynccontextmanager
+    async def _slot(self):
+        """Wait for one of the `max_in_flight` processing slots"""
+        semaphore = self._semaphore()
+        self._count("waiting", 1)
+        try:
+            await semaphore.acquire()
+        finally:
+            self._count("waiting", -1)
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    async def _store(self, data: bytes, db: Optional[Session], prefix: str) -> tuple[str, Dict[str, dict]]:
+        """Build, store and record the variants of raw image bytes, unless already known"""
+        digest = content_hash(data)
+        manifest = find_blob(db, digest) if db is not None else None
+        if manifest is not None:
+            self._count("deduplicated", 1)
+            return digest, manifest
+        built = await self.process(data)
+        objects = variant_objects(built, prefix, digest)
+        urls = await asyncio.gather(*(
+            self.put(key, body, content_type) for _, _, key, body, content_type in objects
+        ))
+        manifest = variant_manifest(built, objects, urls)
+        if db is not None:
+            save_blob(db, digest, manifest, len(data))
+        return digest, manifest
+
+    async def upload(self, file: UploadFile, db: Optional[Session] = None, prefix: str = "plants") -> Dict[str, dict]:
+        """
+        Process an uploaded image and store every variant; returns the variant manifest.
+        
+        With a session, uploads already in image_blobs are returned as is.
+        """
+        if get_storage() is None:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Image storage not configured"
+            )
+        if not file.content_type or not file.content_type.startswith('image/'):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="File must be an image"
+            )
+
+        try:
+            async with self._slot():
+                data = await read_upload(file, settings.image_upload_max_bytes)
+                _, manifest = await self._store(data, db, prefix)
+        except HTTPException:
+            self._count("failed", 1)
+            raise
+        except Exception as e:
+            self._count("failed", 1)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to upload image: {str(e)}"
+            )
+        self._count("completed", 1)
+        return manifest
+
+    async def finalize_upload(self, upload_id: str, session_factory: Callable[[], Session]) -> None:
+        """
+        Background step for direct uploads: read the original the client PUT
+        to storage, build and store its variants, then mark the upload ready
+        (or failed) and drop the original.
+        """
+        db = session_factory()
+        try:
+            upload = db.query(ImageUpload).filter(ImageUpload.id == upload_id).first()
+            if upload is None or upload.status != UploadStatus.PROCESSING:
+                return
+            storage = get_storage()
+            _, upload_pool = self._pools()
+            loop = asyncio.get_running_loop()
+            try:
+                async with self._slot():
+                    try:
+                        data = await loop.run_in_executor(
+                            upload_pool, storage.get, upload.object_key, settings.image_upload_max_bytes
+                        )
+                    except ObjectTooLarge:
+                        raise ValueError("Image is too large")
+                    digest, manifest = await self._store(data, db, "plants")
+            except Exception as e:
+                logger.warning(f"Processing upload {upload_id} failed: {e}")
+                db.rollback()
+                upload.status = UploadStatus.FAILED
+                upload.error = str(e)[:500]
+                db.commit()
+                self._count("failed", 1)
+                return
+            upload.sha256 = digest
+            upload.variants = manifest
+            upload.status = UploadStatus.READY
+            db.commit()
+            self._count("completed", 1)
+            try:
+                await loop.run_in_executor(upload_pool, storage.delete, upload.object_key)
+            except Exception as e:
+                logger.warning(f"Failed to delete original of upload {upload_id}: {e}")
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        """Queue depths and counters for monitoring"""
+        with self._lock:
+            stats = dict(self._counts)
+        stats["max_in_flight"] = self.max_in_flight
+        stats["process_workers"] = self.process_workers
+        stats["upload_workers"] = self.upload_workers
+        return stats
+
+    def shutdown(self) -> None:
+        with self._lock:
+            for pool in (self._process_pool, self._upload_pool):
+                if pool is not None:
+                    pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+            self._upload_pool = None
+
+
+# Process-wide pipeline; pools start on the first upload
+image_pipeline = ImagePipeline(
+    process_workers=settings.image_process_workers,
+    upload_workers=settings.image_upload_workers,
+    max_in_flight=settings.image_max_in_flight,
+)
@@ -1,11 +1,19 @@
 """
 Plant identification service using Google Gemini API
 """
+import asyncio
+import hashlib
+import json
 import os
-import io
-from typing import Dict, Optional
+import re
+import threading
+import time
+from typing import Dict, Optional, Union
 from PIL import Image
 from app.core.config import settings
+from app.core.imaging import encode_jpeg
+from app.core.resilience import CircuitBreaker, CircuitOpenError
+from app.services.classifier_backends import ClassifierBackend, LocalClassifier, FallbackClassifier
 from app.core.logging import logger
 
 # Optional google-generativeai import
@@ -18,18 +26,155 @@ except ImportError:
     logger.warning("Google Generative AI not available - install google-generativeai package")
 
 
-class PlantClassifier:
+PLANT_PROMPT = """Analyze this image and identify if it contains a plant. 
+If it is a plant, provide the common name and scientific name (if known) of the plant.
+Respond in the following JSON format:
+{
+    "is_plant": true/false,
+    "plant_name": "Common name of the plant",
+    "scientific_name": "Scientific name (if known, otherwise null)",
+    "confidence": 0.0-1.0
+}
+
+If it's not a plant, respond with:
+{
+    "is_plant": false,
+    "plant_name": "Not a plant",
+    "scientific_name": null,
+    "confidence": 0.0
+}
+
+Be specific and accurate. Only identify if you're confident it's a plant."""
+
+
+class PlantClassifier(ClassifierBackend):
     """Plant identification using Google Gemini Vision API"""
     
+    name = "gemini"
+    
     def __init__(self):
         self.model = None
         self.client = None
         self.model_name = None  # Cache selected model name
         self._initialized = False
-        self.initialize_gemini()
+        # Fails fast while Gemini is down instead of queueing requests behind timeouts
+        self.breaker = CircuitBreaker(
+            "Plant identification",
+            failure_threshold=settings.classifier_breaker_failures,
+            reset_timeout=settings.classifier_breaker_reset
+        )
+        # Upstream calls in flight across threads and event loops (see _slots)
+        self._slot_semaphore: Optional[threading.BoundedSemaphore] = None
+        self._lock = threading.Lock()
+        # The model is set up on first use (see ensure_initialized), so
+        # importing this module never calls the Gemini API
+        self._init_lock = threading.Lock()
+    
+    def ensure_initialized(self) -> bool:
+        """Set up the Gemini model if that has not happened yet; True when ready"""
+        if not self._initialized and settings.gemini_api_key:
+            with self._init_lock:
+                if not self._initialized:
+                    logger.info("Initializing Gemini model (first use)")
+                    self.initialize_gemini()
+        return self._initialized
+    
+    def status(self) -> str:
+        """ready, configured (set up on first use) or not_configured; never calls the API"""
+        if self._initialized:
+            return "ready"
+        if GEMINI_AVAILABLE and settings.gemini_api_key:
+            return "configured"
+        return "not_configured"
+    
+    def stats(self) -> dict:
+        return {"backend": self.name, "status": self.status(), "model": self.model_name, "circuit": self.breaker.stats()}
+    
+    def _key_fingerprint(self) -> str:
+        # Model lists differ per API key; never write the key itself to disk
+        return hashlib.sha256(settings.gemini_api_key.encode("utf-8")).hexdigest()[:16]
+    
+    def _cached_model_name(self) -> Optional[str]:
+        """Model chosen by an earlier discovery, if recorded for this key within the TTL"""
+        try:
+            with open(settings.gemini_model_cache_file) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if cached.get("key") != self._key_fingerprint():
+            return None
+        if time.time() - cached.get("saved_at", 0) > settings.gemini_model_cache_ttl:
+            return None
+        return cached.get("model")
+    
+    def _save_model_name(self, model_name: str) -> None:
+        path = settings.gemini_model_cache_file
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            # Write then rename so concurrent workers never read a partial file
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"model": model_name, "key": self._key_fingerprint(), "saved_at": time.time()}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not cache Gemini model name: {e}")
+    
+    def forget_model(self) -> None:
+        """Drop the selected model so the next call rediscovers one (e.g. after it was retired)"""
+        with self._init_lock:
+            self.model = None
+            self.model_name = None
+            self._initialized = False
+            try:
+                os.remove(settings.gemini_model_cache_file)
+            except OSError:
+                pass
+    
+    def _discover_models(self) -> list:
+        """Vision-capable model names from the API, best first (one network call)"""
+        try:
+            available_models = list(genai.list_models())
+            logger.info(f"Found {len(available_models)} total models from API")
+            
+            # Filter models that support generateContent (required for image analysis)
+            vision_capable = []
+            for model in available_models:
+                if 'generateContent' in model.supported_generation_methods:
+                    model_name = model.name.split('/')[-1]  # Get just the model name
+                    # Prioritize models that support vision/image analysis
+                    # Check input token limits (vision models typically have higher limits)
+                    input_token_limit = getattr(model, 'input_token_limit', 0)
+                    
+                    vision_capable.append({
+                        'name': model_name,
+                        'full_name': model.name,
+                        'input_tokens': input_token_limit,
+                        'priority': self._get_model_priority(model_name, input_token_limit)
+                    })
+            
+            # Sort by priority (higher is better) and input token limit
+            vision_capable.sort(key=lambda x: (x['priority'], x['input_tokens']), reverse=True)
+            
+            logger.info(f"Found {len(vision_capable)} vision-capable models")
+            if vision_capable:
+                logger.info(f"Top models: {[m['name'] for m in vision_capable[:5]]}")
+            
+            # Try models in priority order
+            return [m['name'] for m in vision_capable]
+            
+        except Exception as e:
+            logger.warning(f"Could not list models from API: {e}. Using fallback model names.")
+            return []
     
     def initialize_gemini(self):
-        """Initialize Gemini API client"""
+        """
+        Initialize Gemini API client.
+        
+        The model is GEMINI_MODEL when set, otherwise the one an earlier
+        discovery cached in GEMINI_MODEL_CACHE_FILE; only when neither exists
+        are the available models listed (and the choice cached for
+        GEMINI_MODEL_CACHE_TTL seconds).
+        """
         if not GEMINI_AVAILABLE:
             logger.warning("Gemini API not available")
             return
@@ -41,40 +186,8 @@ class PlantClassifier:
         try:
             genai.configure(api_key=settings.gemini_api_key)
             
-            # List available models and find the best one for image analysis
-            try:
-                available_models = list(genai.list_models())
-                logger.info(f"Found {len(available_models)} total models from API")
-                
-                # Filter models that support generateContent (required for image analysis)
-                vision_capable = []
-                for model in available_models:
-                    if 'generateContent' in model.supported_generation_methods:
-                        model_name = model.name.split('/')[-1]  # Get just the model name
-                        # Prioritize models that support vision/image analysis
-                        # Check input token limits (vision models typically have higher limits)
-                        input_token_limit = getattr(model, 'input_token_limit', 0)
-                        
-                        vision_capable.append({
-                            'name': model_name,
-                            'full_name': model.name,
-                            'input_tokens': input_token_limit,
-                            'priority': self._get_model_priority(model_name, input_token_limit)
-                        })
-                
-                # Sort by priority (higher is better) and input token limit
-                vision_capable.sort(key=lambda x: (x['priority'], x['input_tokens']), reverse=True)
-                
-                logger.info(f"Found {len(vision_capable)} vision-capable models")
-                if vision_capable:
-                    logger.info(f"Top models: {[m['name'] for m in vision_capable[:5]]}")
-                
-                # Try models in priority order
-                model_names = [m['name'] for m in vision_capable] if vision_capable else []
-                
-            except Exception as e:
-                logger.warning(f"Could not list models from API: {e}. Using fallback model names.")
-                model_names = []
+            known_model = settings.gemini_model or self._cached_model_name()
+            model_names = [known_model] if known_model else self._discover_models()
             
             # Add fallback model names (without -latest suffix, as v1beta doesn't support it)
             fallback_models = [
@@ -113,6 +226,8 @@ class PlantClassifier:
                 self.model_name = selected_model
                 self._initialized = True
                 logger.info(f"Using model '{selected_model}' for plant image analysis")
+                if not known_model and model_names:
+                    self._save_model_name(selected_model)
                 
         except Exception as e:
             logger.error(f"Failed to configure Gemini API: {e}")
@@ -150,86 +265,157 @@ class PlantClassifier:
         
         return priority
     
-    def predict(self, image: Image.Image) -> Dict[str, any]:
+    def _image_bytes(self, image: Union[Image.Image, bytes]) -> bytes:
+        if isinstance(image, bytes):
+            return image
+        # Downscale before encoding; the model gains nothing from full resolution
+        dimension = settings.prediction_image_max_dimension
+        if image.size[0] > dimension or image.size[1] > dimension:
+            image = image.copy()
+            image.thumbnail((dimension, dimension), Image.Resampling.LANCZOS)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        return encode_jpeg(image)
+    
+    def _contents(self, image_data: bytes) -> list:
+        # The API accepts the image as a dict with mime_type and data
+        return [PLANT_PROMPT, {"mime_type": "image/jpeg", "data": image_data}]
+    
+    def _error(self, message: str) -> Dict[str, any]:
+        return {
+            "is_plant": False,
+            "plant_type": f"Error: {message}",
+            "confidence": 0.0
+        }
+    
+    def _record_upstream_error(self, error: Exception) -> None:
+        self.breaker.record_failure()
+        logger.error(f"Gemini prediction failed: {error}")
+        message = str(error).lower()
+        if "404" in message and "model" in message:
+            # The cached model was retired; pick a new one on the next call
+            self.forget_model()
+    
+    def _slots(self) -> threading.BoundedSemaphore:
+        """Process-wide limit of classifier_max_in_flight upstream calls, shared by predict and predict_async"""
+        with self._lock:
+            if self._slot_semaphore is None:
+                self._slot_semaphore = threading.BoundedSemaphore(settings.classifier_max_in_flight)
+            return self._slot_semaphore
+    
+    async def _acquire_slot(self, timeout: float) -> bool:
+        """Take a slot without blocking the event loop"""
+        slots = self._slots()
+        deadline = time.monotonic() + timeout
+        delay = 0.005
+        while not slots.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        return True
+    
+    def _generate(self, image_data: bytes):
+        """Blocking upstream call; gives back the slot its caller took once it really ends"""
+        try:
+            return self.model.generate_content(
+                self._contents(image_data),
+                request_options={"timeout": settings.classifier_timeout}
+            )
+        finally:
+            self._slots().release()
+    
+    def predict(self, image: Union[Image.Image, bytes]) -> Dict[str, any]:
         """
         Predict plant type from image using Gemini API
         
+        Blocks the calling thread; async routes use predict_async instead.
+        
         Args:
-            image: PIL Image object
+            image: PIL Image object, or JPEG bytes already downscaled
+                (see app.core.imaging.compact_jpeg)
             
         Returns:
             Dictionary with is_plant, plant_type, and confidence
         """
-        # Re-initialize if needed (for serverless cold starts)
+        self.ensure_initialized()
+        
+        if not self.model:
+            logger.error("Gemini model not initialized")
+            return self._error("Gemini API not configured")
+        
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError as e:
+            return self._error(str(e))
+        
+        image_data = self._image_bytes(image)
+        if not self._slots().acquire(timeout=settings.classifier_timeout):
+            return self._error("Plant identification is busy, please retry")
+        try:
+            response_text = self._generate(image_data).text.strip()
+        except Exception as e:
+            self._record_upstream_error(e)
+            return self._error(str(e))
+        self.breaker.record_success()
+        return self._to_result(response_text)
+    
+    async def predict_async(self, image: Union[Image.Image, bytes]) -> Dict[str, any]:
+        """
+        Non-blocking predict(): the upstream call gets `classifier_timeout`
+        seconds, at most `classifier_max_in_flight` calls (sync and async
+        together) run per worker and an open circuit answers immediately
+        with an error result.
+        """
         if not self._initialized and settings.gemini_api_key:
-            logger.info("Re-initializing Gemini model (cold start)")
-            self.initialize_gemini()
+            await asyncio.to_thread(self.ensure_initialized)
         
         if not self.model:
             logger.error("Gemini model not initialized")
-            return {
-                "is_plant": False,
-                "plant_type": "Error: Gemini API not configured",
-                "confidence": 0.0
-            }
+            return self._error("Gemini API not configured")
         
         try:
-            # Convert PIL Image to bytes
-            img_bytes = io.BytesIO()
-            # Convert to RGB if necessary
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            image.save(img_bytes, format='JPEG')
-            img_bytes.seek(0)
-            
-            # Prepare the prompt for plant identification
-            prompt = """Analyze this image and identify if it contains a plant. 
-If it is a plant, provide the common name and scientific name (if known) of the plant.
-Respond in the following JSON format:
-{
-    "is_plant": true/false,
-    "plant_name": "Common name of the plant",
-    "scientific_name": "Scientific name (if known, otherwise null)",
-    "confidence": 0.0-1.0
-}
-
-If it's not a plant, respond with:
-{
-    "is_plant": false,
-    "plant_name": "Not a plant",
-    "scientific_name": null,
-    "confidence": 0.0
-}
-
-Be specific and accurate. Only identify if you're confident it's a plant."""
-            
-            # Call Gemini API with image
-            # Use the correct format for Gemini Vision API
-            import google.generativeai as genai
-            
-            # Prepare image data
-            image_data = img_bytes.getvalue()
-            
-            # Create image part for Gemini Vision API
-            # The API accepts image as a dict with mime_type and data
-            image_part = {
-                "mime_type": "image/jpeg",
-                "data": image_data
-            }
-            
-            # Generate content with both prompt and image
-            # Pass as a list: [prompt, image_part]
-            response = self.model.generate_content([prompt, image_part])
-            
-            # Parse response
+            self.breaker.before_call()
+        except CircuitOpenError as e:
+            return self._error(str(e))
+        
+        if isinstance(image, bytes):
+            image_data = image
+        else:
+            image_data = await asyncio.to_thread(self._image_bytes, image)
+        
+        if not await self._acquire_slot(settings.classifier_timeout):
+            return self._error("Plant identification is busy, please retry")
+        try:
+            generate_async = getattr(self.model, "generate_content_async", None)
+            if generate_async is not None:
+                try:
+                    # A timed-out request is cancelled, so its slot is free again
+                    response = await asyncio.wait_for(
+                        generate_async(self._contents(image_data)), timeout=settings.classifier_timeout
+                    )
+                finally:
+                    self._slots().release()
+            else:
+                # Submitted right away so the thread, which releases the slot,
+                # always runs; it keeps the slot until the call really ends
+                call = asyncio.get_running_loop().run_in_executor(None, self._generate, image_data)
+                response = await asyncio.wait_for(call, timeout=settings.classifier_timeout)
             response_text = response.text.strip()
-            
-            # Try to extract JSON from response
+        except asyncio.TimeoutError:
+            self.breaker.record_failure()
+            logger.error(f"Gemini prediction timed out after {settings.classifier_timeout}s")
+            return self._error("Plant identification timed out")
+        except Exception as e:
+            self._record_upstream_error(e)
+            return self._error(str(e))
+        self.breaker.record_success()
+        return self._to_result(response_text)
+    
+    def _to_result(self, response_text: str) -> Dict[str, any]:
+        """Map the model's reply to is_plant, plant_type and confidence"""
+        try:
             # Gemini might return text with JSON, so we need to extract it
-            import json
-            import re
-            
-            # Try to find JSON in the response
             json_match = re.search(r'\{[^{}]*\}', response_text, re.DOTALL)
             if json_match:
                 result = json.loads(json_match.group())
@@ -245,22 +431,17 @@ Be specific and accurate. Only identify if you're confident it's a plant."""
             plant_name = result.get("plant_name", "Unknown")
             is_plant = result.get("is_plant", False)
             confidence = float(result.get("confidence", 0.5 if is_plant else 0.0))
-            
-            logger.info(f"Gemini prediction: {plant_name} (is_plant: {is_plant}, confidence: {confidence})")
-            
-            return {
-                "is_plant": is_plant,
-                "plant_type": plant_name,
-                "confidence": confidence
-            }
-            
         except Exception as e:
-            logger.error(f"Gemini prediction failed: {e}")
-            return {
-                "is_plant": False,
-                "plant_type": f"Error: {str(e)}",
-                "confidence": 0.0
-            }
+            logger.error(f"Could not parse Gemini response: {e}")
+            return self._error(str(e))
+        
+        logger.info(f"Gemini prediction: {plant_name} (is_plant: {is_plant}, confidence: {confidence})")
+        
+        return {
+            "is_plant": is_plant,
+            "plant_type": plant_name,
+            "confidence": confidence
+        }
     
     def _parse_text_response(self, text: str) -> Dict:
         """Parse text response from Gemini if JSON parsing fails"""
@@ -283,5 +464,23 @@ Be specific and accurate. Only identify if you're confident it's a plant."""
         }
 
 
+def create_classifier(backend: str, fallback: str = "") -> ClassifierBackend:
+    """Build the classifier named by `backend`, optionally answering from `fallback` while it fails"""
+    backends = {
+        "gemini": PlantClassifier,
+        "local": lambda: LocalClassifier(latency=settings.local_classifier_latency),
+    }
+    if backend not in backends:
+        logger.warning(f"Unknown classifier backend {backend!r}, using gemini")
+        backend = "gemini"
+    classifier = backends[backend]()
+    if fallback and fallback != backend:
+        if fallback in backends:
+            classifier = FallbackClassifier(classifier, backends[fallback]())
+        else:
+            logger.warning(f"Unknown classifier fallback {fallback!r}, ignoring it")
+    return classifier
+
+
 # Global classifier instance
-plant_classifier = PlantClassifier()
+plant_classifier = create_classifier(settings.classifier_backend, settings.classifier_fallback)
@@ -1,9 +1,12 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, func
+from collections import Counter
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import and_, case, func
 from typing import List, Optional, Tuple
 from fastapi import HTTPException, status
 from app.models import Order, OrderItem, Plant, User, OrderStatus, Cart, CartItem, DeliveryTimeline
 from app.schemas.order import OrderCreate, OrderUpdate, OrderStats, CheckoutRequest
+from app.services.catalog_cache import invalidate_catalog
+from app.core.fieldsets import load_only_columns
 from app.core.logging import logger
 
 
@@ -11,6 +14,30 @@ class OrderService:
     def __init__(self, db: Session):
         self.db = db
     
+    def _add_sales(self, plant: Plant, quantity: int) -> None:
+        """
+        Adjust a plant's denormalized sales_count by `quantity` (negative when
+        an order is cancelled).
+        
+        The increment is computed by the database in the UPDATE, so concurrent
+        orders of the same plant don't overwrite each other's counts. Call it
+        once per plant with the summed quantity: the session doesn't
+        autoflush, so a second call before a flush replaces the first.
+        """
+        plant.sales_count = case(
+            (Plant.sales_count + quantity > 0, Plant.sales_count + quantity),
+            else_=0
+        )
+    
+    def _add_order_sales(self, order: Order, sign: int) -> None:
+        quantities = Counter()
+        for item in order.order_items:
+            quantities[item.plant_id] += item.quantity
+        for plant_id, quantity in quantities.items():
+            plant = self.db.query(Plant).filter(Plant.id == plant_id).first()
+            if plant:
+                self._add_sales(plant, sign * quantity)
+    
     def create_order(self, order_data: OrderCreate, buyer_id: int) -> Order:
         """Create a new order"""
         try:
@@ -58,6 +85,7 @@ class OrderService:
             self.db.flush()  # Get the order ID
             
             # Create order items
+            sold = Counter()
             for item_data in order_items:
                 order_item = OrderItem(
                     order_id=db_order.id,
@@ -67,12 +95,17 @@ class OrderService:
                 )
                 self.db.add(order_item)
                 
-                # Update plant stock
+                # Update plant stock and sales
                 plant = self.db.query(Plant).filter(Plant.id == item_data['plant_id']).first()
                 plant.stock_quantity -= item_data['quantity']
+                sold[plant] += item_data['quantity']
+            for plant, quantity in sold.items():
+                self._add_sales(plant, quantity)
             
             self.db.commit()
             self.db.refresh(db_order)
+            for item_data in order_items:
+                invalidate_catalog(item_data['plant_id'])
             
             logger.info(f"Order {db_order.id} created successfully")
             return db_order
@@ -86,11 +119,16 @@ class OrderService:
         """Get order by ID"""
         return self.db.query(Order).filter(Order.id == order_id).first()
     
-    def get_user_orders(self, user_id: int, page: int = 1, size: int = 20) -> Tuple[List[Order], int]:
-        """Get orders for a user (as buyer)"""
+    def get_user_orders(self, user_id: int, page: int = 1, size: int = 20,
+                        fields: Optional[List[str]] = None) -> Tuple[List[Order], int]:
+        """Get orders for a user (as buyer), loading only `fields` when given"""
         query = self.db.query(Order).filter(Order.buyer_id == user_id)
         total = query.count()
         
+        if fields:
+            query = query.options(load_only_columns(Order, fields))
+            if "order_items" in fields:
+                query = query.options(selectinload(Order.order_items))
         offset = (page - 1) * size
         orders = query.order_by(Order.created_at.desc()).offset(offset).limit(size).all()
         
@@ -119,6 +157,10 @@ class OrderService:
                 detail="Not authorized to update this order"
             )
         
+        # sales_count only counts orders that are not cancelled (see migration 003)
+        sales_changed = (status == OrderStatus.CANCELLED) != (order.status == OrderStatus.CANCELLED)
+        if sales_changed:
+            self._add_order_sales(order, -1 if status == OrderStatus.CANCELLED else 1)
         order.status = status
         # Append to delivery timeline
         try:
@@ -127,6 +169,9 @@ class OrderService:
             pass
         self.db.commit()
         self.db.refresh(order)
+        if sales_changed:
+            for item in order.order_items:
+                invalidate_catalog(item.plant_id)
         
         logger.info(f"Order {order_id} status updated to {status}")
         return order
@@ -166,13 +211,20 @@ class OrderService:
             )
         
         # Restore stock
+        plant_ids = [item.plant_id for item in order.order_items]
+        returned = Counter()
         for item in order.order_items:
             plant = self.db.query(Plant).filter(Plant.id == item.plant_id).first()
             if plant:
                 plant.stock_quantity += item.quantity
+                returned[plant] += item.quantity
+        for plant, quantity in returned.items():
+            self._add_sales(plant, -quantity)
         
         order.status = OrderStatus.CANCELLED
         self.db.commit()
+        for plant_id in plant_ids:
+            invalidate_catalog(plant_id)
         
         logger.info(f"Order {order_id} cancelled and stock restored")
         return True
@@ -216,6 +268,7 @@ class OrderService:
             items_by_seller.setdefault(plant.seller_id, []).append((plant, item))
 
         created_orders = []
+        sold = Counter()
         try:
             for seller_id, pairs in items_by_seller.items():
                 total_price = sum(p.price * it.quantity for p, it in pairs)
@@ -232,14 +285,20 @@ class OrderService:
                 for plant, it in pairs:
                     self.db.add(OrderItem(order_id=order.id, plant_id=plant.id, quantity=it.quantity, unit_price=plant.price))
                     plant.stock_quantity -= it.quantity
+                    sold[plant] += it.quantity
                 created_orders.append(order)
+            for plant, quantity in sold.items():
+                self._add_sales(plant, quantity)
 
+            plant_ids = [plant.id for pairs in items_by_seller.values() for plant, _ in pairs]
             # Clear cart
             for ci in list(cart.items):
                 self.db.delete(ci)
             self.db.commit()
             for o in created_orders:
                 self.db.refresh(o)
+            for plant_id in plant_ids:
+                invalidate_catalog(plant_id)
             return created_orders
         except Exception as e:
             self.db.rollback()
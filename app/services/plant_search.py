@@ -0,0 +1,105 @@
+"""
+Full-text search engines for the plant catalog.
+
+Each engine narrows a Plant query to rows matching free text across name,
+species, category and description, and supplies a relevance expression to
+order by. The engine is picked from the database dialect so searches stay
+index-backed: a tsvector GIN index on PostgreSQL, an FTS5 table on SQLite.
+"""
+import re
+from typing import Optional, Tuple
+from sqlalchemy import Column, Integer, MetaData, Table, func, inspect, literal_column, or_
+from sqlalchemy.orm import Query, Session
+from app.models import Plant
+from app.core.logging import logger
+
+
+def _search_terms(text: str) -> list[str]:
+    """Split free text into word tokens, dropping query-syntax characters"""
+    return re.findall(r"\w+", text or "")
+
+
+class PlantSearchEngine:
+    """Fallback engine: case-insensitive substring match on every term"""
+
+    def apply(self, query: Query, text: str) -> Tuple[Query, Optional[object]]:
+        """Return the filtered query and a relevance expression (higher is better), if any"""
+        terms = _search_terms(text)
+        for term in terms:
+            pattern = f"%{term}%"
+            query = query.filter(or_(
+                Plant.name.ilike(pattern),
+                Plant.species.ilike(pattern),
+                Plant.category.ilike(pattern),
+                Plant.description.ilike(pattern),
+            ))
+        return query, None
+
+
+class PostgresPlantSearchEngine(PlantSearchEngine):
+    """tsvector search served by the ix_plants_search_document GIN index"""
+
+    @staticmethod
+    def document():
+        # Must stay identical to the indexed expression in app/models and migration 002
+        separator = literal_column("' '")
+        empty = literal_column("''")
+        text = (
+            func.coalesce(Plant.name, empty).op("||")(separator)
+            .op("||")(func.coalesce(Plant.species, empty)).op("||")(separator)
+            .op("||")(func.coalesce(Plant.category, empty)).op("||")(separator)
+            .op("||")(func.coalesce(Plant.description, empty))
+        )
+        return func.to_tsvector(literal_column("'english'"), text)
+
+    def apply(self, query: Query, text: str) -> Tuple[Query, Optional[object]]:
+        if not _search_terms(text):
+            return query, None
+        document = self.document()
+        ts_query = func.websearch_to_tsquery(literal_column("'english'"), text)
+        query = query.filter(document.op("@@")(ts_query))
+        return query, func.ts_rank_cd(document, ts_query)
+
+
+_plants_fts = Table(
+    "plants_fts",
+    MetaData(),
+    Column("rowid", Integer),
+)
+
+
+class SqlitePlantSearchEngine(PlantSearchEngine):
+    """FTS5 search over the plants_fts external-content table"""
+
+    def apply(self, query: Query, text: str) -> Tuple[Query, Optional[object]]:
+        terms = _search_terms(text)
+        if not terms:
+            return query, None
+        # Quote every term so user input is never parsed as FTS5 syntax;
+        # the last term is a prefix so partially typed words still match.
+        match = " ".join(f'"{term}"' for term in terms) + "*"
+        fts = literal_column("plants_fts")
+        query = query.join(_plants_fts, _plants_fts.c.rowid == Plant.id).filter(fts.op("MATCH")(match))
+        # bm25() is lower for better matches, so negate it
+        return query, -func.bm25(fts)
+
+
+_engines: dict[str, PlantSearchEngine] = {}
+
+
+def get_search_engine(db: Session) -> PlantSearchEngine:
+    """Return the search engine for the session's database dialect"""
+    bind = db.get_bind()
+    dialect = bind.dialect.name
+    key = f"{dialect}:{bind.url}"
+    engine = _engines.get(key)
+    if engine is None:
+        if dialect == "postgresql":
+            engine = PostgresPlantSearchEngine()
+        elif dialect == "sqlite" and inspect(bind).has_table("plants_fts"):
+            engine = SqlitePlantSearchEngine()
+        else:
+            logger.warning(f"No full-text index available for {dialect}; plant search falls back to ILIKE")
+            engine = PlantSearchEngine()
+        _engines[key] = engine
+    return engine
@@ -1,47 +1,52 @@
 import os
-import uuid
 from typing import Optional, List
 from fastapi import UploadFile, HTTPException, status
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, func, case, literal_column
 from app.models import Plant, User, ApprovalStatus, UserRole
-from app.schemas.plant import PlantCreate, PlantUpdate, PlantSearchParams
+from app.schemas.plant import PlantCreate, PlantUpdate, PlantResponse, PlantSearchParams, CountMode, PlantSort, PlantFacetsResponse, FacetCount, PriceBucket
 from app.core.config import settings
-from PIL import Image
-import io
+from app.core.storage import get_storage
+from app.core.imaging import build_image_variants, content_hash
+from app.core.image_ingest import read_limited
+from app.services.image_pipeline import IMAGE_FORMATS, variant_objects, variant_manifest, primary_image_url, find_blob, save_blob
+from app.core.pagination import encode_cursor, decode_cursor, keyset_timestamp
+from app.services.plant_search import get_search_engine
+from app.core.http_cache import make_etag
+from app.core.fieldsets import load_only_columns
+from app.services.catalog_cache import plant_count_cache, plant_facet_cache, plant_detail_cache, catalog_filter_key, catalog_version, invalidate_catalog
+from datetime import datetime
 
-# Optional boto3 import for S3 storage
-try:
-    import boto3
-    from botocore.exceptions import ClientError
-    BOTO3_AVAILABLE = True
-except ImportError:
-    BOTO3_AVAILABLE = False
-    boto3 = None
-    ClientError = Exception
+# Listing sorts: column and whether it is descending. Each has matching
+# composite indexes on Plant (ix_plants_listing_* / ix_plants_category_*).
+PLANT_SORTS = {
+    PlantSort.NEWEST: (Plant.created_at, True),
+    PlantSort.PRICE_ASC: (Plant.price, False),
+    PlantSort.PRICE_DESC: (Plant.price, True),
+    PlantSort.POPULAR: (Plant.sales_count, True),
+    PlantSort.RATING: (Plant.rating_average, True),
+}
 
+# Lower edges of the price histogram buckets returned by get_plant_facets
+PRICE_BUCKET_EDGES = [0, 100, 250, 500, 1000, 2500]
 
 class PlantService:
     def __init__(self, db: Session):
         self.db = db
-        self.s3_client = None
-        if BOTO3_AVAILABLE and settings.aws_access_key_id and settings.aws_secret_access_key:
-            try:
-                self.s3_client = boto3.client(
-                    's3',
-                    aws_access_key_id=settings.aws_access_key_id,
-                    aws_secret_access_key=settings.aws_secret_access_key,
-                    region_name=settings.aws_region
-                )
-            except Exception:
-                self.s3_client = None
     
-    def upload_image_to_s3(self, file: UploadFile) -> str:
-        """Upload image to S3 and return URL"""
-        if not self.s3_client:
+    def upload_image(self, file: UploadFile) -> dict:
+        """
+        Build every size/format variant of an uploaded image, store them and
+        return the variant manifest (see image_pipeline.variant_manifest).
+        Bytes seen before are served from image_blobs without reprocessing.
+        
+        Blocks the calling thread; async routes use image_pipeline.upload instead.
+        """
+        storage = get_storage()
+        if storage is None:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="S3 configuration not available"
+                detail="Image storage not configured"
             )
         
         # Validate file type
@@ -51,44 +56,25 @@ class PlantService:
                 detail="File must be an image"
             )
         
-        # Process image
+        data = read_limited(file.file, settings.image_upload_max_bytes)
         try:
-            image = Image.open(file.file)
-            # Resize if too large
-            if image.size[0] > 1920 or image.size[1] > 1920:
-                image.thumbnail((1920, 1920), Image.Resampling.LANCZOS)
-            
-            # Convert to RGB if necessary
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Save to bytes
-            img_buffer = io.BytesIO()
-            image.save(img_buffer, format='JPEG', quality=85)
-            img_buffer.seek(0)
-            
-            # Generate unique filename
-            file_extension = file.filename.split('.')[-1] if '.' in file.filename else 'jpg'
-            filename = f"plants/{uuid.uuid4()}.{file_extension}"
-            
-            # Upload to S3
-            self.s3_client.upload_fileobj(
-                img_buffer,
-                settings.aws_bucket_name,
-                filename,
-                ExtraArgs={'ContentType': 'image/jpeg'}
-            )
-            
-            # Return public URL
-            return f"https://{settings.aws_bucket_name}.s3.{settings.aws_region}.amazonaws.com/{filename}"
-            
+            digest = content_hash(data)
+            manifest = find_blob(self.db, digest)
+            if manifest is not None:
+                return manifest
+            built = build_image_variants(data, IMAGE_FORMATS)
+            objects = variant_objects(built, "plants", digest)
+            urls = [storage.put(key, body, content_type) for _, _, key, body, content_type in objects]
+            manifest = variant_manifest(built, objects, urls)
+            save_blob(self.db, digest, manifest, len(data))
+            return manifest
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Failed to upload image: {str(e)}"
             )
     
-    def create_plant(self, plant_data: PlantCreate, seller_id: int, image_file: Optional[UploadFile] = None, image_url: Optional[str] = None, verified_by_ai: Optional[bool] = None) -> Plant:
+    def create_plant(self, plant_data: PlantCreate, seller_id: int, image_file: Optional[UploadFile] = None, image_url: Optional[str] = None, verified_by_ai: Optional[bool] = None, image_variants: Optional[dict] = None) -> Plant:
         """Create a new plant listing"""
         # Ensure seller is approved or is admin
         seller = self.db.query(User).filter(User.id == seller_id).first()
@@ -104,12 +90,14 @@ class PlantService:
         # Handle image: prefer provided image_url, otherwise upload file
         final_image_url = image_url
         if image_file and not final_image_url:
-            final_image_url = self.upload_image_to_s3(image_file)
+            image_variants = self.upload_image(image_file)
+            final_image_url = primary_image_url(image_variants)
         
         db_plant = Plant(
             name=plant_data.name,
             description=plant_data.description,
             image_url=final_image_url,
+            image_variants=image_variants,
             price=plant_data.price,
             category=plant_data.category,
             species=plant_data.species,
@@ -123,16 +111,56 @@ class PlantService:
         self.db.add(db_plant)
         self.db.commit()
         self.db.refresh(db_plant)
+        invalidate_catalog(db_plant.id)
         return db_plant
     
     def get_plant_by_id(self, plant_id: int) -> Optional[Plant]:
         """Get plant by ID"""
         return self.db.query(Plant).filter(Plant.id == plant_id).first()
     
-    def get_plants(self, search_params: PlantSearchParams) -> tuple[List[Plant], int]:
-        """Get plants with filtering and pagination"""
+    def get_plant_detail(self, plant_id: int) -> Optional[tuple[str, bytes]]:
+        """Get a plant's (etag, serialized PlantResponse), served from the detail cache when possible"""
+        cached = plant_detail_cache.get(plant_id)
+        if cached is not None:
+            return cached
+        
+        version = catalog_version()
+        plant = self.get_plant_by_id(plant_id)
+        if not plant:
+            return None
+        
+        entry = (
+            make_etag("plant", plant.id, plant.version),
+            PlantResponse.model_validate(plant).model_dump_json().encode("utf-8"),
+        )
+        # Skip caching if the catalog changed while we were reading
+        if catalog_version() == version:
+            plant_detail_cache.set(plant_id, entry)
+        return entry
+    
+    def get_plants_by_ids(self, plant_ids: List[int]) -> tuple[List[Plant], List[int]]:
+        """Get many plants with one IN query, in the order requested, plus the IDs not found"""
+        found = {
+            plant.id: plant
+            for plant in self.db.query(Plant).filter(Plant.id.in_(plant_ids)).all()
+        } if plant_ids else {}
+        plants = [found[plant_id] for plant_id in plant_ids if plant_id in found]
+        missing = [plant_id for plant_id in plant_ids if plant_id not in found]
+        return plants, missing
+    
+    def _filtered_plants_query(self, search_params: PlantSearchParams):
+        """
+        Build the catalog query with all search filters applied.
+        
+        Returns the query and, for full-text searches, a relevance expression
+        (higher is better) to order by.
+        """
         query = self.db.query(Plant).filter(Plant.is_active == True, Plant.approval_status == ApprovalStatus.APPROVED)
         
+        rank = None
+        if search_params.q:
+            query, rank = get_search_engine(self.db).apply(query, search_params.q)
+        
         # Apply filters
         if search_params.name:
             query = query.filter(Plant.name.ilike(f"%{search_params.name}%"))
@@ -149,14 +177,160 @@ class PlantService:
         if search_params.verified_only:
             query = query.filter(Plant.verified_by_ai == True)
         
-        # Get total count
+        return query, rank
+    
+    def _keyset_value(self, column, value=None):
+        """
+        Return a sort column (or a cursor value for it) in a form that compares correctly.
+        
+        created_at goes through keyset_timestamp; other columns compare natively.
+        """
+        if column is Plant.created_at:
+            return keyset_timestamp(self.db, column, value)
+        return column if value is None else value
+    
+    def _page_query(self, query, rank, search_params: PlantSearchParams):
+        """
+        Order and paginate a filtered catalog query.
+        
+        Returns the query, limited to one row past the page so callers can tell
+        whether another page exists, and the sort applied (None when ordered
+        by full-text relevance).
+        """
+        size = search_params.size
+        if rank is not None and search_params.sort is None and not search_params.cursor:
+            offset = (search_params.page - 1) * size
+            return query.order_by(rank.desc(), Plant.id.desc()).offset(offset).limit(size + 1), None
+        
+        sort = search_params.sort or PlantSort.NEWEST
+        column, descending = PLANT_SORTS[sort]
+        if descending:
+            query = query.order_by(column.desc(), Plant.id.desc())
+        else:
+            query = query.order_by(column.asc(), Plant.id.asc())
+        
+        if search_params.cursor:
+            try:
+                sort_name, last_value, last_id = decode_cursor(search_params.cursor, 3)
+                if sort_name != sort.value or isinstance(last_id, bool) or not isinstance(last_id, int):
+                    raise ValueError("Invalid cursor")
+                if column is Plant.created_at:
+                    if not isinstance(last_value, datetime):
+                        raise ValueError("Invalid cursor")
+                elif isinstance(last_value, bool) or not isinstance(last_value, (int, float)):
+                    raise ValueError("Invalid cursor")
+            except ValueError:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+            key = self._keyset_value(column)
+            cursor_key = self._keyset_value(column, last_value)
+            if descending:
+                query = query.filter(or_(key < cursor_key, and_(key == cursor_key, Plant.id < last_id)))
+            else:
+                query = query.filter(or_(key > cursor_key, and_(key == cursor_key, Plant.id > last_id)))
+        else:
+            query = query.offset((search_params.page - 1) * size)
+        
+        return query.limit(size + 1), sort
+    
+    def _count_plants(self, query, search_params: PlantSearchParams) -> Optional[int]:
+        """Count the plants matching a search according to its count mode"""
+        if search_params.count == CountMode.NONE:
+            return None
+        
+        key = catalog_filter_key(search_params)
+        if search_params.count == CountMode.ESTIMATE:
+            total = plant_count_cache.get(key)
+            if total is not None:
+                return total
+        
         total = query.count()
+        plant_count_cache.set(key, total)
+        return total
+    
+    def get_plants(self, search_params: PlantSearchParams) -> tuple[List[Plant], Optional[int], Optional[str]]:
+        """
+        Get plants with filtering, sorting and pagination.
         
-        # Apply pagination
-        offset = (search_params.page - 1) * search_params.size
-        plants = query.offset(offset).limit(search_params.size).all()
+        Results follow `sort` (newest first by default) with id as tie-breaker.
+        Uses keyset pagination on (sort column, id) when a cursor is given and
+        falls back to page/size offsets otherwise. Returns the page, the total
+        match count (see CountMode) and a cursor for the following page (None
+        on the last page).
         
-        return plants, total
+        Full-text searches (`q`) without an explicit sort are ordered by
+        relevance instead and only paginate by offset.
+        """
+        query, rank = self._filtered_plants_query(search_params)
+        
+        total = self._count_plants(query, search_params)
+        
+        page_query, sort = self._page_query(query, rank, search_params)
+        if search_params.fields:
+            # The sort column is still needed to build the next cursor
+            extra = [PLANT_SORTS[sort][0].key] if sort is not None else []
+            page_query = page_query.options(load_only_columns(Plant, search_params.fields, extra))
+        plants = page_query.all()
+        
+        next_cursor = None
+        if len(plants) > search_params.size:
+            plants = plants[:search_params.size]
+            if sort is not None:
+                column, _ = PLANT_SORTS[sort]
+                last = plants[-1]
+                next_cursor = encode_cursor([sort.value, getattr(last, column.key), last.id])
+        
+        return plants, total, next_cursor
+    
+    def get_plant_facets(self, search_params: PlantSearchParams) -> PlantFacetsResponse:
+        """
+        Get category counts, a price histogram and the verified count for a search.
+        
+        Everything comes from one aggregate grouped by (category, price bucket,
+        verified) over the same filters as get_plants, folded in Python and cached.
+        """
+        key = catalog_filter_key(search_params)
+        facets = plant_facet_cache.get(key)
+        if facets is not None:
+            return facets
+        
+        query, _ = self._filtered_plants_query(search_params)
+        bucket = case(
+            *[(Plant.price < edge, index) for index, edge in enumerate(PRICE_BUCKET_EDGES[1:])],
+            else_=len(PRICE_BUCKET_EDGES) - 1
+        ).label("price_bucket")
+        rows = query.with_entities(
+            Plant.category, bucket, Plant.verified_by_ai, func.count(Plant.id)
+        ).group_by(Plant.category, literal_column("price_bucket"), Plant.verified_by_ai).all()
+        
+        total = 0
+        verified_count = 0
+        category_counts = {}
+        bucket_counts = [0] * len(PRICE_BUCKET_EDGES)
+        for category, price_bucket, verified, count in rows:
+            total += count
+            if verified:
+                verified_count += count
+            category_counts[category] = category_counts.get(category, 0) + count
+            bucket_counts[price_bucket] += count
+        
+        facets = PlantFacetsResponse(
+            total=total,
+            verified_count=verified_count,
+            categories=[
+                FacetCount(value=category, count=count)
+                for category, count in sorted(category_counts.items(), key=lambda item: (-item[1], item[0] or ""))
+            ],
+            price_buckets=[
+                PriceBucket(
+                    min_price=edge,
+                    max_price=PRICE_BUCKET_EDGES[index + 1] if index + 1 < len(PRICE_BUCKET_EDGES) else None,
+                    count=bucket_counts[index]
+                )
+                for index, edge in enumerate(PRICE_BUCKET_EDGES)
+            ]
+        )
+        plant_facet_cache.set(key, facets)
+        return facets
     
     def update_plant(self, plant_id: int, plant_data: PlantUpdate, seller_id: int) -> Optional[Plant]:
         """Update plant information"""
@@ -173,6 +347,7 @@ class PlantService:
         
         self.db.commit()
         self.db.refresh(plant)
+        invalidate_catalog(plant.id)
         return plant
     
     def delete_plant(self, plant_id: int, seller_id: int) -> bool:
@@ -186,13 +361,17 @@ class PlantService:
         
         plant.is_active = False
         self.db.commit()
+        invalidate_catalog(plant.id)
         return True
     
-    def get_seller_plants(self, seller_id: int, page: int = 1, size: int = 20) -> tuple[List[Plant], int]:
-        """Get plants by seller"""
+    def get_seller_plants(self, seller_id: int, page: int = 1, size: int = 20,
+                          fields: Optional[List[str]] = None) -> tuple[List[Plant], int]:
+        """Get plants by seller, loading only `fields` when given"""
         query = self.db.query(Plant).filter(Plant.seller_id == seller_id)
         total = query.count()
         
+        if fields:
+            query = query.options(load_only_columns(Plant, fields))
         offset = (page - 1) * size
         plants = query.offset(offset).limit(size).all()
         
@@ -206,4 +385,5 @@ class PlantService:
         
         plant.verified_by_ai = verified
         self.db.commit()
+        invalidate_catalog(plant.id)
         return True
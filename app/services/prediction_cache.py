@@ -0,0 +1,86 @@
+"""
+Classifier results cached by a perceptual hash of the image.
+
+Users retake photos of the same plant all the time; the bytes differ but the
+dHash of the downscaled image (see app.core.imaging.dhash) changes by a few
+bits at most. Lookups scan this worker's recent results for a hash within
+`max_distance` bits, then fall back to an exact, indexed match on
+predictions.image_hash so that restarts and other workers also skip the
+classifier for photos seen before.
+"""
+from typing import Dict, Iterable, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.imaging import hash_distance
+from app.models import Prediction, PredictionStatus
+from app.services.classifier_backends import is_error_result
+
+
+def is_cacheable(result: dict) -> bool:
+    """Failed classifications and degraded-mode (fallback backend) answers are never reused"""
+    return not is_error_result(result) and not result.get("degraded")
+
+
+class PredictionCache:
+    def __init__(self, maxsize: int, ttl: float, max_distance: int):
+        self.max_distance = max_distance
+        self._recent = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def _near(self, image_hash: str) -> Optional[dict]:
+        result = self._recent.get(image_hash)
+        if result is not None or self.max_distance <= 0:
+            return result
+        best, best_distance = None, self.max_distance + 1
+        for key, value in self._recent.items():
+            distance = hash_distance(key, image_hash)
+            if distance < best_distance:
+                best, best_distance = value, distance
+        return best
+
+    def get(self, db: Session, image_hash: str) -> Optional[dict]:
+        """Result of an earlier prediction of this (or a near-identical) image"""
+        return self.get_many(db, [image_hash]).get(image_hash)
+
+    def get_many(self, db: Session, image_hashes: Iterable[str]) -> Dict[str, dict]:
+        """Known results for any of `image_hashes`, with one query for the memory misses"""
+        image_hashes = set(image_hashes)
+        found = {}
+        for image_hash in image_hashes:
+            result = self._near(image_hash)
+            if result is not None:
+                found[image_hash] = result
+        missing = image_hashes - set(found)
+        if not missing:
+            return found
+
+        # Only the newest usable row per hash; popular hashes have many
+        newest = db.query(func.max(Prediction.id).label("id")).filter(
+            Prediction.image_hash.in_(missing),
+            Prediction.status == PredictionStatus.COMPLETED,
+            ~Prediction.plant_type.startswith("Error:")
+        ).group_by(Prediction.image_hash).subquery()
+        rows = db.query(
+            Prediction.image_hash, Prediction.is_plant, Prediction.plant_type, Prediction.confidence
+        ).join(newest, Prediction.id == newest.c.id).all()
+        for row in rows:
+            found[row.image_hash] = {"is_plant": row.is_plant, "plant_type": row.plant_type, "confidence": row.confidence}
+        for image_hash in missing & set(found):
+            self._recent.set(image_hash, found[image_hash])
+        return found
+
+    def set(self, image_hash: str, result: dict) -> None:
+        if is_cacheable(result):
+            self._recent.set(image_hash, {key: result[key] for key in ("is_plant", "plant_type", "confidence")})
+
+    def clear(self) -> None:
+        self._recent.clear()
+
+
+# Per-process recent results; the predictions table is the shared tier
+prediction_cache = PredictionCache(
+    maxsize=settings.prediction_cache_size,
+    ttl=settings.prediction_cache_ttl,
+    max_distance=settings.prediction_cache_max_distance,
+)
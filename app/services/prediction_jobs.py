@@ -0,0 +1,243 @@
+"""
+Background prediction jobs (POST /plants/predict?async=true).
+
+The request stores a pending Prediction row and returns at once; a thread
+pool runs the classifier and fills the row in. Clients poll the row or
+follow it over server-sent events: wait() wakes streams in this process as
+soon as a job changes state, and streams re-read the row on an interval so
+jobs finished by another worker process are picked up too.
+
+Images of queued jobs live only in memory, so jobs cut off by a shutdown
+or crash cannot be re-queued: shutdown() fails the jobs it cancels, and
+rows whose updated_at heartbeat is older than prediction_job_stale_after
+are failed at startup or when a client next reads them (fail_stale). The
+process running a job touches its row every third of that interval, never
+fails its own jobs, and only stores a result over a row still processing.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.logging import logger
+from app.models import Prediction, PredictionStatus
+from app.services.classifier_backends import is_error_result
+from app.services.prediction_cache import prediction_cache
+from app.services.prediction_service import classify
+
+TERMINAL_STATUSES = (PredictionStatus.COMPLETED, PredictionStatus.FAILED)
+ACTIVE_STATUSES = (PredictionStatus.PENDING, PredictionStatus.PROCESSING)
+INTERRUPTED = "Error: Prediction was interrupted, please retry"
+
+
+def _by_factory(jobs) -> dict:
+    """Group (prediction_id, session_factory) pairs by session factory"""
+    grouped: dict = {}
+    for prediction_id, session_factory in jobs:
+        grouped.setdefault(session_factory, []).append(prediction_id)
+    return grouped
+
+
+class PredictionJobs:
+    def __init__(self, workers: int, max_queued: int, heartbeat_interval: float = 100.0):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.heartbeat_interval = heartbeat_interval
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._stopped: Optional[threading.Event] = None
+        self._lock = threading.Lock()
+        self._waiters: dict = {}
+        self._jobs: dict = {}  # Submitted future -> (prediction_id, session_factory)
+        self._counts = {"queued": 0, "completed": 0, "failed": 0}
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="prediction-job")
+                    self._stopped = threading.Event()
+                    threading.Thread(target=self._heartbeat, args=(self._stopped,),
+                                     name="prediction-job-heartbeat", daemon=True).start()
+        return self._pool
+
+    def _heartbeat(self, stopped: threading.Event) -> None:
+        """Touch the rows of this process's jobs so other workers don't fail them as lost"""
+        while not stopped.wait(self.heartbeat_interval):
+            with self._lock:
+                jobs = list(self._jobs.values())
+            for session_factory, prediction_ids in _by_factory(jobs).items():
+                db = session_factory()
+                try:
+                    db.query(Prediction).filter(
+                        Prediction.id.in_(prediction_ids), Prediction.status.in_(ACTIVE_STATUSES)
+                    ).update({Prediction.updated_at: func.now()}, synchronize_session=False)
+                    db.commit()
+                except Exception as e:
+                    logger.error(f"Could not record prediction job heartbeat: {e}")
+                finally:
+                    db.close()
+
+    def _count(self, name: str, delta: int) -> None:
+        with self._lock:
+            self._counts[name] += delta
+
+    def full(self) -> bool:
+        """Whether new jobs should be turned away"""
+        with self._lock:
+            return self._counts["queued"] >= self.max_queued
+
+    def submit(self, prediction_id: int, image_hash: str, image_data: bytes,
+               session_factory: Callable[[], Session]) -> None:
+        """Classify `image_data` in the background and store the result on the pending row"""
+        self._count("queued", 1)
+        future = self._executor().submit(self._run, prediction_id, image_hash, image_data, session_factory)
+        with self._lock:
+            self._jobs[future] = (prediction_id, session_factory)
+        future.add_done_callback(self._forget)
+    
+    def _forget(self, future: Future) -> None:
+        with self._lock:
+            self._jobs.pop(future, None)
+            if future.cancelled():
+                # _run never started, so it could not count the job out
+                self._counts["queued"] -= 1
+
+    def _transition(self, db: Session, prediction_id: int, current: PredictionStatus, values: dict) -> bool:
+        """Update the row only if it is still in `current`; False if something else moved it on"""
+        values = {Prediction.updated_at: func.now(), **values}
+        count = db.query(Prediction).filter(
+            Prediction.id == prediction_id, Prediction.status == current
+        ).update(values, synchronize_session=False)
+        db.commit()
+        self._notify(prediction_id)
+        return count == 1
+
+    def _run(self, prediction_id: int, image_hash: str, image_data: bytes,
+             session_factory: Callable[[], Session]) -> None:
+        db = session_factory()
+        try:
+            if not self._transition(db, prediction_id, PredictionStatus.PENDING,
+                                    {Prediction.status: PredictionStatus.PROCESSING}):
+                return
+
+            try:
+                result = classify(image_data)
+            except Exception as e:
+                logger.error(f"Prediction job {prediction_id} failed: {e}")
+                result = {"is_plant": False, "plant_type": f"Error: {str(e)}", "confidence": 0.0}
+            prediction_cache.set(image_hash, result)
+
+            failed = is_error_result(result)
+            values = {
+                Prediction.status: PredictionStatus.FAILED if failed else PredictionStatus.COMPLETED,
+                Prediction.is_plant: result["is_plant"],
+                Prediction.plant_type: result["plant_type"],
+                Prediction.confidence: result["confidence"],
+            }
+            if result.get("degraded"):
+                values[Prediction.image_hash] = None
+            if self._transition(db, prediction_id, PredictionStatus.PROCESSING, values):
+                self._count("failed" if failed else "completed", 1)
+            else:
+                # Already failed as lost; clients were told it ended
+                logger.warning(f"Prediction job {prediction_id} finished after it was failed as lost")
+        except Exception as e:
+            logger.error(f"Prediction job {prediction_id} could not be stored: {e}")
+            db.rollback()
+        finally:
+            db.close()
+            self._count("queued", -1)
+            # Streams re-read the row, so a wake-up on failure is harmless
+            self._notify(prediction_id)
+
+    def _notify(self, prediction_id: int) -> None:
+        with self._lock:
+            waiters = list(self._waiters.get(prediction_id, ()))
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The stream's event loop has closed
+                pass
+
+    async def wait(self, prediction_id: int, timeout: float) -> None:
+        """Return when a job of this process updates the prediction, or after `timeout`"""
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._waiters.setdefault(prediction_id, set()).add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(prediction_id)
+                if waiters is not None:
+                    waiters.discard(waiter)
+                    if not waiters:
+                        del self._waiters[prediction_id]
+
+    def fail_stale(self, db: Session, older_than: float, prediction_id: Optional[int] = None) -> int:
+        """
+        Fail predictions pending or processing without a heartbeat for longer
+        than `older_than` seconds (all of them, or just `prediction_id`);
+        returns how many. Jobs queued or running in this process are skipped.
+        """
+        with self._lock:
+            owned = [job_id for job_id, _ in self._jobs.values()]
+        if prediction_id is not None and prediction_id in owned:
+            return 0
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=older_than)
+        criteria = [func.coalesce(Prediction.updated_at, Prediction.timestamp) < cutoff]
+        if prediction_id is not None:
+            criteria.append(Prediction.id == prediction_id)
+        elif owned:
+            criteria.append(Prediction.id.notin_(owned))
+        return self._fail(db, *criteria)
+    
+    def _fail(self, db: Session, *criteria) -> int:
+        count = db.query(Prediction).filter(Prediction.status.in_(ACTIVE_STATUSES), *criteria).update(
+            {Prediction.status: PredictionStatus.FAILED, Prediction.plant_type: INTERRUPTED},
+            synchronize_session=False
+        )
+        db.commit()
+        return count
+    
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counts)
+        stats["workers"] = self.workers
+        stats["max_queued"] = self.max_queued
+        return stats
+
+    def shutdown(self) -> None:
+        """Stop the pool; jobs that never started are failed so clients stop waiting"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+            stopped, self._stopped = self._stopped, None
+            jobs = list(self._jobs.items())
+        if stopped is not None:
+            stopped.set()
+        cancelled = [job for future, job in jobs if future.cancel()]
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        
+        for session_factory, prediction_ids in _by_factory(cancelled).items():
+            db = session_factory()
+            try:
+                self._fail(db, Prediction.id.in_(prediction_ids))
+            except Exception as e:
+                logger.error(f"Could not fail {len(prediction_ids)} cancelled prediction jobs: {e}")
+            finally:
+                db.close()
+
+
+# Process-wide job runner; threads start with the first job
+prediction_jobs = PredictionJobs(
+    workers=settings.prediction_job_workers,
+    max_queued=settings.prediction_job_max_queued,
+    heartbeat_interval=settings.prediction_job_stale_after / 3,
+)
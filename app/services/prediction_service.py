@@ -1,92 +1,288 @@
+from concurrent.futures import ThreadPoolExecutor
+from starlette.concurrency import run_in_threadpool
+from datetime import datetime
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
-from typing import Optional
-from fastapi import UploadFile
+from typing import List, Optional
+from fastapi import UploadFile, HTTPException, status
 from PIL import Image
-from app.models import Prediction
-from app.schemas.ml import PredictionResponse
+from app.models import Prediction, PredictionStatus
+from app.schemas.ml import PredictionResponse, BatchPredictionItem
 from app.services.ml_service import plant_classifier
+from app.services.prediction_cache import prediction_cache
+from app.services.classifier_backends import is_error_result
+from app.core.config import settings
+from app.core.image_ingest import read_limited
+from app.core.fieldsets import load_only_columns
+from app.core.pagination import encode_cursor, decode_cursor, keyset_timestamp
+from app.core.remote_images import remote_image_fetcher
+from app.core.imaging import open_image, encode_jpeg, dhash, content_hash
+from app.core.singleflight import SingleFlight
 from app.core.logging import logger
-import io
+
+
+def prepare_image_bytes(data: bytes) -> tuple[str, bytes]:
+    """
+    Shrink an encoded image to what the classifier needs.
+
+    Returns the image's perceptual hash and a compact JPEG of it.
+    """
+    try:
+        image = open_image(data, settings.prediction_image_max_dimension)
+    except (OSError, Image.DecompressionBombError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid image file: {str(e)}"
+        )
+    return dhash(image), encode_jpeg(image)
+
+
+def prepare_image(file: UploadFile) -> tuple[str, bytes]:
+    """prepare_image_bytes for an upload, read with the upload size limit"""
+    return prepare_image_bytes(read_limited(file.file, settings.image_upload_max_bytes))
+
+
+# Identical images classified at the same time (double taps, client retries)
+# share one upstream call
+classifier_flights = SingleFlight()
+
+
+def classify(image_data: bytes) -> dict:
+    """plant_classifier.predict, joined to an identical call already in flight"""
+    result, _ = classifier_flights.do(content_hash(image_data), plant_classifier.predict, image_data)
+    return result
+
+
+async def classify_async(image_data: bytes) -> dict:
+    """plant_classifier.predict_async, joined to an identical call already in flight"""
+    result, _ = await classifier_flights.do_async(content_hash(image_data), plant_classifier.predict_async, image_data)
+    return result
+
+
+def _prepare_or_error(file: UploadFile):
+    try:
+        return prepare_image(file)
+    except HTTPException as e:
+        return e
 
 
 class MLService:
     def __init__(self, db: Session):
         self.db = db
     
+    def _record(self, result: dict, image_hash: str, user_id: Optional[int], cached: bool,
+                image_url: str = "") -> PredictionResponse:
+        """Save a prediction to the database and build its response"""
+        prediction = Prediction(
+            image_url=image_url,  # Empty for uploads; will be updated after image upload
+            is_plant=result["is_plant"],
+            plant_type=result["plant_type"],
+            confidence=result["confidence"],
+            uploaded_by=user_id,
+            # Degraded answers must not be found again by the prediction cache
+            image_hash=None if result.get("degraded") else image_hash
+        )
+        
+        self.db.add(prediction)
+        self.db.commit()
+        self.db.refresh(prediction)
+        
+        return PredictionResponse(
+            is_plant=result["is_plant"],
+            plant_type=result["plant_type"],
+            confidence=result["confidence"],
+            prediction_id=prediction.id,
+            cached=cached,
+            degraded=bool(result.get("degraded"))
+        )
+    
     def predict_from_file(self, file: UploadFile, user_id: Optional[int] = None) -> PredictionResponse:
         """Make prediction from uploaded file"""
+        image_hash, image_data = prepare_image(file)
+        
         try:
-            # Read image
-            image_data = file.file.read()
-            image = Image.open(io.BytesIO(image_data))
-            
-            # Make prediction
-            result = plant_classifier.predict(image)
-            
-            # Save prediction to database
-            prediction = Prediction(
-                image_url="",  # Will be updated after image upload
-                is_plant=result["is_plant"],
-                plant_type=result["plant_type"],
-                confidence=result["confidence"],
-                uploaded_by=user_id
-            )
-            
-            self.db.add(prediction)
-            self.db.commit()
-            self.db.refresh(prediction)
-            
-            return PredictionResponse(
-                is_plant=result["is_plant"],
-                plant_type=result["plant_type"],
-                confidence=result["confidence"],
-                prediction_id=prediction.id
-            )
-            
+            # Reuse the result for a photo we have already classified
+            result = prediction_cache.get(self.db, image_hash)
+            cached = result is not None
+            if not cached:
+                result = classify(image_data)
+                prediction_cache.set(image_hash, result)
+            return self._record(result, image_hash, user_id, cached)
         except Exception as e:
             logger.error(f"Prediction failed: {e}")
             raise
     
-    def predict_from_url(self, image_url: str, user_id: Optional[int] = None) -> PredictionResponse:
-        """Make prediction from image URL"""
+    async def predict_upload(self, file: UploadFile, user_id: Optional[int] = None) -> PredictionResponse:
+        """predict_from_file for async routes: decoding runs in a thread, the classifier call is awaited"""
+        image_hash, image_data = await run_in_threadpool(prepare_image, file)
+        
         try:
-            # Download image (simplified - in production, use proper image download)
-            response = requests.get(image_url)
-            image = Image.open(io.BytesIO(response.content))
-            
-            # Make prediction
-            result = plant_classifier.predict(image)
-            
-            # Save prediction to database
+            result = prediction_cache.get(self.db, image_hash)
+            cached = result is not None
+            if not cached:
+                result = await classify_async(image_data)
+                prediction_cache.set(image_hash, result)
+            return self._record(result, image_hash, user_id, cached)
+        except Exception as e:
+            logger.error(f"Prediction failed: {e}")
+            raise
+    
+    async def create_prediction_job(self, file: UploadFile, user_id: Optional[int] = None) -> tuple[Prediction, Optional[bytes]]:
+        """
+        Store a prediction to be classified in the background.
+        
+        Returns the row and the image to classify. Images the cache already
+        knows are completed right away, and no image is returned for them.
+        """
+        image_hash, image_data = await run_in_threadpool(prepare_image, file)
+        
+        result = prediction_cache.get(self.db, image_hash)
+        if result is not None:
             prediction = Prediction(
-                image_url=image_url,
+                image_url="",
                 is_plant=result["is_plant"],
                 plant_type=result["plant_type"],
                 confidence=result["confidence"],
-                uploaded_by=user_id
+                uploaded_by=user_id,
+                image_hash=image_hash,
+                status=PredictionStatus.COMPLETED
             )
-            
-            self.db.add(prediction)
-            self.db.commit()
-            self.db.refresh(prediction)
-            
-            return PredictionResponse(
-                is_plant=result["is_plant"],
-                plant_type=result["plant_type"],
-                confidence=result["confidence"],
-                prediction_id=prediction.id
+            image_data = None
+        else:
+            prediction = Prediction(
+                image_url="",
+                is_plant=False,
+                confidence=0.0,
+                uploaded_by=user_id,
+                image_hash=image_hash,
+                status=PredictionStatus.PENDING
             )
+        
+        self.db.add(prediction)
+        self.db.commit()
+        self.db.refresh(prediction)
+        return prediction, image_data
+    
+    def predict_batch(self, files: List[UploadFile], user_id: Optional[int] = None) -> List[BatchPredictionItem]:
+        """
+        Classify several uploads; returns one item per file, in order.
+        
+        Decoding and classifier calls run `prediction_batch_concurrency` at a
+        time, cache lookups take one query for the whole batch, identical
+        photos are classified once and every Prediction row is written in a
+        single insert. A file that cannot be read fails on its own without
+        failing the batch.
+        """
+        with ThreadPoolExecutor(
+            max_workers=settings.prediction_batch_concurrency, thread_name_prefix="predict-batch"
+        ) as pool:
+            prepared = list(pool.map(_prepare_or_error, files))
+            images = [item for item in prepared if not isinstance(item, HTTPException)]
             
+            results = prediction_cache.get_many(self.db, (image_hash for image_hash, _ in images))
+            cached = set(results)
+            pending = {}
+            for image_hash, image_data in images:
+                if image_hash not in results:
+                    pending.setdefault(image_hash, image_data)
+            for image_hash, result in zip(pending, pool.map(classify, pending.values())):
+                results[image_hash] = result
+                prediction_cache.set(image_hash, result)
+        
+        predictions = [
+            Prediction(
+                image_url="",
+                is_plant=results[image_hash]["is_plant"],
+                plant_type=results[image_hash]["plant_type"],
+                confidence=results[image_hash]["confidence"],
+                uploaded_by=user_id,
+                image_hash=None if results[image_hash].get("degraded") else image_hash
+            )
+            for image_hash, _ in images
+        ]
+        self.db.add_all(predictions)
+        self.db.flush()
+        prediction_ids = iter([prediction.id for prediction in predictions])
+        self.db.commit()
+        
+        items = []
+        for index, (file, item) in enumerate(zip(files, prepared)):
+            if isinstance(item, HTTPException):
+                items.append(BatchPredictionItem(index=index, filename=file.filename, error=item.detail))
+                continue
+            image_hash = item[0]
+            result = results[image_hash]
+            items.append(BatchPredictionItem(
+                index=index,
+                filename=file.filename,
+                result=PredictionResponse(
+                    is_plant=result["is_plant"],
+                    plant_type=result["plant_type"],
+                    confidence=result["confidence"],
+                    prediction_id=next(prediction_ids),
+                    cached=image_hash in cached,
+                    degraded=bool(result.get("degraded"))
+                ),
+                error=result["plant_type"] if is_error_result(result) else None
+            ))
+        logger.info(f"Batch prediction: {len(files)} images, {len(pending)} classified, {len(cached)} cached")
+        return items
+    
+    def predict_from_url(self, image_url: str, user_id: Optional[int] = None) -> PredictionResponse:
+        """Make prediction from image URL (blocking; call from a thread in async routes)"""
+        image_hash, image_data = prepare_image_bytes(remote_image_fetcher.fetch(image_url))
+        
+        try:
+            result = prediction_cache.get(self.db, image_hash)
+            cached = result is not None
+            if not cached:
+                result = classify(image_data)
+                prediction_cache.set(image_hash, result)
+            return self._record(result, image_hash, user_id, cached, image_url=image_url)
         except Exception as e:
             logger.error(f"Prediction from URL failed: {e}")
             raise
     
-    def get_prediction_history(self, user_id: int, limit: int = 50) -> list[Prediction]:
-        """Get user's prediction history"""
-        return self.db.query(Prediction).filter(
-            Prediction.uploaded_by == user_id
-        ).order_by(Prediction.timestamp.desc()).limit(limit).all()
+    def get_prediction_history(self, user_id: int, limit: int = 50, cursor: Optional[str] = None,
+                               fields: Optional[List[str]] = None) -> tuple[List[Prediction], Optional[str]]:
+        """
+        Get a page of the user's prediction history, newest first.
+        
+        Uses keyset pagination on (timestamp, id), served by the
+        ix_predictions_user_timestamp index. Returns the page and a cursor
+        for the following page (None on the last page); `fields` limits the
+        columns loaded.
+        """
+        query = self.db.query(Prediction).filter(Prediction.uploaded_by == user_id)
+        if cursor:
+            try:
+                last_timestamp, last_id = decode_cursor(cursor, 2)
+                if not isinstance(last_timestamp, datetime) or isinstance(last_id, bool) or not isinstance(last_id, int):
+                    raise ValueError("Invalid cursor")
+            except ValueError:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+            key = keyset_timestamp(self.db, Prediction.timestamp)
+            cursor_key = keyset_timestamp(self.db, Prediction.timestamp, last_timestamp)
+            query = query.filter(or_(
+                key < cursor_key,
+                and_(key == cursor_key, Prediction.id < last_id)
+            ))
+        if fields:
+            query = query.options(load_only_columns(Prediction, fields, ["timestamp"]))
+        
+        predictions = query.order_by(Prediction.timestamp.desc(), Prediction.id.desc()).limit(limit + 1).all()
+        next_cursor = None
+        if len(predictions) > limit:
+            predictions = predictions[:limit]
+            next_cursor = encode_cursor([predictions[-1].timestamp, predictions[-1].id])
+        return predictions, next_cursor
     
     def get_prediction_by_id(self, prediction_id: int) -> Optional[Prediction]:
         """Get prediction by ID"""
         return self.db.query(Prediction).filter(Prediction.id == prediction_id).first()
+    
+    def get_user_prediction(self, prediction_id: int, user_id: int) -> Optional[Prediction]:
+        """Get one of the user's predictions"""
+        return self.db.query(Prediction).filter(
+            Prediction.id == prediction_id, Prediction.uploaded_by == user_id
+        ).first()
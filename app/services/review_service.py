@@ -2,6 +2,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func
 from typing import Tuple, List
 from app.models import Review, Plant
+from app.services.catalog_cache import invalidate_catalog
 
 
 class ReviewService:
@@ -14,8 +15,15 @@ class ReviewService:
             raise ValueError("Plant not found")
         review = Review(user_id=user_id, plant_id=plant_id, rating=rating, comment=comment)
         self.db.add(review)
+        # Keep the denormalized rating used by the rating sort in step. Both
+        # columns are computed by the database from the row's current values,
+        # so concurrent reviews don't overwrite each other.
+        count = func.coalesce(Plant.rating_count, 0)
+        plant.rating_average = (func.coalesce(Plant.rating_average, 0.0) * count + rating) / (count + 1)
+        plant.rating_count = count + 1
         self.db.commit()
         self.db.refresh(review)
+        invalidate_catalog(plant_id)
         return review
 
     def get_reviews_for_plant(self, plant_id: int) -> Tuple[List[Review], float, int]:
@@ -0,0 +1,184 @@
+"""
+In-memory prefix index for search-box typeahead.
+
+Suggestions come from a sorted list of normalized keys searched with bisect,
+so lookups never touch the database once the index is loaded. Every word
+start of a phrase is indexed, so "pla" suggests "Snake Plant". Plant names
+and species are reference counted because many listings share them; the
+category tree leaves are static.
+"""
+import bisect
+import threading
+from collections import Counter
+from typing import Iterable, List, Optional, Set
+from sqlalchemy.orm import Session
+from app.models import Plant, ApprovalStatus
+
+
+def normalize(text: str) -> str:
+    """Case-fold and collapse whitespace so lookups ignore formatting"""
+    return " ".join(text.casefold().split())
+
+
+def _word_starts(phrase: str) -> List[str]:
+    """Every suffix of a normalized phrase that starts at a word boundary"""
+    words = phrase.split(" ")
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+
+def _category_leaves(tree) -> Iterable[str]:
+    if isinstance(tree, dict):
+        for value in tree.values():
+            yield from _category_leaves(value)
+    else:
+        yield from tree
+
+
+class PlantSuggestIndex:
+    """Thread-safe prefix index over plant names, species and categories"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # Sorted (key, display text, kind) triples; the key is what prefixes match
+        self._keys: List[tuple] = []
+        # Number of sources (plants, or the category tree) providing each triple
+        self._refs: dict = {}
+        # Triples contributed by each plant, so changes can be undone
+        self._plant_entries: dict = {}
+        self._loaded = False
+        self._stale: Set[int] = set()
+        # Bumped by full invalidations so a load racing one is not marked fresh
+        self._generation = 0
+
+    @staticmethod
+    def _entries(text: Optional[str], kind: str) -> List[tuple]:
+        if not text or not text.strip():
+            return []
+        display = " ".join(text.split())
+        return [(key, display, kind) for key in _word_starts(normalize(display))]
+
+    def _add(self, text: Optional[str], kind: str) -> List[tuple]:
+        added = self._entries(text, kind)
+        for entry in added:
+            count = self._refs.get(entry, 0)
+            if count == 0:
+                bisect.insort(self._keys, entry)
+            self._refs[entry] = count + 1
+        return added
+
+    def _remove(self, entries: List[tuple]) -> None:
+        for entry in entries:
+            count = self._refs.get(entry, 0) - 1
+            if count > 0:
+                self._refs[entry] = count
+                continue
+            self._refs.pop(entry, None)
+            index = bisect.bisect_left(self._keys, entry)
+            if index < len(self._keys) and self._keys[index] == entry:
+                del self._keys[index]
+
+    def _index_plant(self, plant_id: int, name: Optional[str], species: Optional[str]) -> None:
+        self._remove(self._plant_entries.pop(plant_id, []))
+        entries = self._add(name, "plant") + self._add(species, "species")
+        if entries:
+            self._plant_entries[plant_id] = entries
+
+    @staticmethod
+    def _listed_plants(db: Session):
+        return db.query(Plant.id, Plant.name, Plant.species).filter(
+            Plant.is_active == True, Plant.approval_status == ApprovalStatus.APPROVED
+        )
+
+    def load(self, db: Session) -> None:
+        """
+        (Re)build the whole index from the listed plants and the category tree.
+        
+        The new index is built outside the lock and sorted once, then swapped
+        in; insort is only used for single-plant updates.
+        """
+        from app.api.categories import PLANT_CATEGORY_TREE
+
+        with self._lock:
+            generation = self._generation
+            pending = set(self._stale)
+        rows = self._listed_plants(db).all()
+        refs = Counter()
+        plant_entries = {}
+        for leaf in _category_leaves(PLANT_CATEGORY_TREE):
+            refs.update(self._entries(leaf, "category"))
+        for plant_id, name, species in rows:
+            entries = self._entries(name, "plant") + self._entries(species, "species")
+            if entries:
+                plant_entries[plant_id] = entries
+                refs.update(entries)
+        keys = sorted(refs)
+        with self._lock:
+            self._keys = keys
+            self._refs = dict(refs)
+            self._plant_entries = plant_entries
+            # Changes that arrived while loading stay queued
+            self._stale -= pending
+            self._loaded = generation == self._generation
+
+    def mark_stale(self, plant_id: Optional[int] = None) -> None:
+        """Queue a plant for re-indexing on the next lookup; None reloads everything"""
+        with self._lock:
+            if plant_id is None:
+                self._loaded = False
+                self._generation += 1
+            else:
+                self._stale.add(plant_id)
+
+    def needs_refresh(self) -> bool:
+        """Whether the next lookup would reload the index or re-index plants"""
+        with self._lock:
+            return not self._loaded or bool(self._stale)
+
+    def refresh(self, db: Session) -> None:
+        """Apply pending invalidations; a full load when the index is not loaded"""
+        with self._lock:
+            if not self._loaded:
+                needs_load, stale = True, set()
+            else:
+                needs_load, stale = False, set(self._stale)
+        if needs_load:
+            self.load(db)
+            return
+        if not stale:
+            return
+
+        rows = self._listed_plants(db).filter(Plant.id.in_(stale)).all()
+        listed = {plant_id: (name, species) for plant_id, name, species in rows}
+        with self._lock:
+            for plant_id in stale:
+                if plant_id in listed:
+                    self._index_plant(plant_id, *listed[plant_id])
+                else:
+                    # Deactivated, rejected or deleted
+                    self._remove(self._plant_entries.pop(plant_id, []))
+            self._stale -= stale
+
+    def suggest(self, db: Session, prefix: str, limit: int = 10) -> List[dict]:
+        """Return up to `limit` distinct suggestions whose words start with `prefix`"""
+        self.refresh(db)
+        key = normalize(prefix)
+        if not key:
+            return []
+
+        suggestions = []
+        seen = set()
+        with self._lock:
+            index = bisect.bisect_left(self._keys, (key,))
+            while index < len(self._keys) and len(suggestions) < limit:
+                entry_key, display, kind = self._keys[index]
+                if not entry_key.startswith(key):
+                    break
+                if display.casefold() not in seen:
+                    seen.add(display.casefold())
+                    suggestions.append({"text": display, "kind": kind})
+                index += 1
+        return suggestions
+
+
+# Process-wide index, kept current by app.services.catalog_cache.invalidate_catalog
+plant_suggest_index = PlantSuggestIndex()
@@ -0,0 +1,89 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from fastapi import HTTPException, status
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.models import ImageUpload, UploadStatus
+from app.core.config import settings
+from app.core.storage import get_storage
+from app.core.logging import logger
+
+
+class UploadService:
+    """Direct-to-storage image uploads: presign, finalize, look up"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def create_upload(self, user_id: int, content_type: str) -> tuple[ImageUpload, str]:
+        """Register an upload and return it with a presigned PUT URL for the original"""
+        storage = get_storage()
+        if storage is None:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Image storage not configured"
+            )
+        if not content_type.startswith("image/"):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="File must be an image"
+            )
+
+        upload_id = uuid.uuid4().hex
+        upload = ImageUpload(
+            id=upload_id,
+            user_id=user_id,
+            object_key=f"uploads/{upload_id}",
+            content_type=content_type,
+            status=UploadStatus.PENDING,
+        )
+        try:
+            upload_url = storage.presign_put(upload.object_key, content_type, settings.image_upload_url_ttl)
+        except NotImplementedError as e:
+            raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=str(e))
+
+        self.db.add(upload)
+        self.db.commit()
+        self.db.refresh(upload)
+        logger.info(f"Image upload {upload_id} created for user {user_id}")
+        return upload, upload_url
+
+    def get_upload(self, upload_id: str, user_id: int) -> Optional[ImageUpload]:
+        """Get one of the user's uploads"""
+        return self.db.query(ImageUpload).filter(
+            ImageUpload.id == upload_id, ImageUpload.user_id == user_id
+        ).first()
+
+    def _processing_stalled(self, upload: ImageUpload) -> bool:
+        started = upload.updated_at or upload.created_at
+        if started is None:
+            return True
+        if started.tzinfo is None:
+            # SQLite returns naive UTC timestamps
+            started = started.replace(tzinfo=timezone.utc)
+        return datetime.now(timezone.utc) - started > timedelta(seconds=settings.image_upload_processing_timeout)
+
+    def start_finalize(self, upload_id: str, user_id: int) -> tuple[Optional[ImageUpload], bool]:
+        """
+        Move an upload to processing once its bytes are in storage.
+
+        Returns the upload and whether processing should be queued; uploads
+        already processing or ready are returned unchanged, failed ones retry.
+        Uploads processing for longer than image_upload_processing_timeout
+        (e.g. the worker restarted mid-way) are queued again.
+        """
+        upload = self.get_upload(upload_id, user_id)
+        if upload is None:
+            return None, False
+        if upload.status == UploadStatus.READY:
+            return upload, False
+        if upload.status == UploadStatus.PROCESSING and not self._processing_stalled(upload):
+            return upload, False
+
+        upload.status = UploadStatus.PROCESSING
+        upload.error = None
+        upload.updated_at = func.now()  # Restarts the processing timeout
+        self.db.commit()
+        self.db.refresh(upload)
+        return upload, True
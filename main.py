@@ -165,10 +165,29 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"Failed to seed default admin user: {e}", exc_info=True)
     
+    # Background prediction jobs of a previous run are gone with its memory
+    try:
+        from app.services.prediction_jobs import prediction_jobs
+        db = SessionLocal()
+        try:
+            failed = prediction_jobs.fail_stale(db, settings.prediction_job_stale_after)
+        finally:
+            db.close()
+        if failed:
+            logger.warning(f"Failed {failed} prediction jobs left unfinished by a previous run")
+    except Exception as e:
+        logger.error(f"Failed to clean up stale prediction jobs: {e}")
+    
     yield
     
     # Shutdown
     logger.info("Shutting down Plant Delivery API...")
+    from app.services.image_pipeline import image_pipeline
+    image_pipeline.shutdown()
+    from app.services.prediction_jobs import prediction_jobs
+    prediction_jobs.shutdown()
+    from app.core.remote_images import remote_image_fetcher
+    remote_image_fetcher.shutdown()
 
 
 # Create FastAPI app
@@ -193,6 +212,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # Prediction history pagination
 )
 
 # Trusted host middleware - configure for production
@@ -235,6 +255,13 @@ app.include_router(categories, prefix="/api/v1")
 app.include_router(notifications, prefix="/api/v1")
 app.include_router(stores, prefix="/api/v1")
 
+# Serve uploads written by the local storage backend (offline development/tests)
+if settings.storage_backend == "local":
+    from fastapi.staticfiles import StaticFiles
+
+    os.makedirs(settings.storage_local_root, exist_ok=True)
+    app.mount(settings.storage_local_base_url, StaticFiles(directory=settings.storage_local_root), name="uploads")
+
 
 # Global exception handlers - production-ready error handling
 # Helper function to add CORS headers to responses
@@ -363,16 +390,44 @@ async def health_check():
         health_status["database"] = "disconnected"
         health_status["status"] = "degraded"
     
-    # Check Gemini API (non-blocking)
+    # Check Gemini API (state only, no network call)
     try:
         from app.services.ml_service import plant_classifier
-        if plant_classifier._initialized:
-            health_status["gemini"] = "ready"
-        else:
-            health_status["gemini"] = "not_configured"
+        # "configured" means the model is set up on the first prediction
+        health_status["gemini"] = plant_classifier.status()
+        health_status["classifier"] = plant_classifier.stats()
     except Exception:
         health_status["gemini"] = "unknown"
     
+    # Image storage backend (configuration only, no network call)
+    try:
+        from app.core.storage import get_storage
+        storage = get_storage()
+        health_status["storage"] = storage.name if storage else "not_configured"
+    except Exception:
+        health_status["storage"] = "unknown"
+    
+    # Image upload queue depths
+    try:
+        from app.services.image_pipeline import image_pipeline
+        health_status["image_pipeline"] = image_pipeline.stats()
+    except Exception:
+        health_status["image_pipeline"] = "unknown"
+    
+    # Background prediction jobs
+    try:
+        from app.services.prediction_jobs import prediction_jobs
+        health_status["prediction_jobs"] = prediction_jobs.stats()
+    except Exception:
+        health_status["prediction_jobs"] = "unknown"
+    
+    # Remote image downloads
+    try:
+        from app.core.remote_images import remote_image_fetcher
+        health_status["remote_images"] = remote_image_fetcher.stats()
+    except Exception:
+        health_status["remote_images"] = "unknown"
+    
     # Response time
     health_status["response_time_ms"] = round((time.time() - start_time) * 1000, 2)
     
@@ -0,0 +1,14 @@
+import pytest
+from app.core import storage
+from app.core.config import settings
+
+
+@pytest.fixture
+def local_storage(tmp_path, monkeypatch):
+    """Point the process-wide storage at a temporary directory"""
+    monkeypatch.setattr(settings, "storage_backend", "local")
+    monkeypatch.setattr(settings, "storage_local_root", str(tmp_path))
+    monkeypatch.setattr(settings, "storage_local_base_url", "/uploads")
+    storage.reset_storage()
+    yield tmp_path
+    storage.reset_storage()
@@ -0,0 +1,258 @@
+import asyncio
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from PIL import Image
+from app.core.config import settings
+from app.core.resilience import CircuitBreaker, CircuitOpenError
+from app.core.imaging import compact_jpeg
+from app.services import ml_service
+from app.services.classifier_backends import LocalClassifier, FallbackClassifier
+from app.services.ml_service import PlantClassifier, create_classifier
+
+REPLY = '{"is_plant": true, "plant_name": "Snake Plant", "scientific_name": null, "confidence": 0.8}'
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Stands in for a Gemini GenerativeModel"""
+
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def generate_content(self, contents, request_options=None):
+        with self.lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.fail:
+                raise ConnectionError("upstream unavailable")
+            time.sleep(self.delay)
+            return FakeResponse(REPLY)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    async def generate_content_async(self, contents):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise ConnectionError("upstream unavailable")
+            return FakeResponse(REPLY)
+        finally:
+            self.in_flight -= 1
+
+
+class ThreadOnlyModel(FakeModel):
+    """A model without generate_content_async, so predict_async falls back to a thread"""
+
+    generate_content_async = None
+
+
+@pytest.fixture
+def classifier(monkeypatch):
+    monkeypatch.setattr(settings, "gemini_api_key", None)
+    monkeypatch.setattr(settings, "classifier_breaker_failures", 2)
+    monkeypatch.setattr(settings, "classifier_breaker_reset", 60.0)
+    classifier = PlantClassifier()
+    classifier._initialized = True
+    return classifier
+
+def test_async_prediction_parses_reply(classifier):
+    """Test the async path returns the same result shape as predict()"""
+    classifier.model = FakeModel()
+    result = asyncio.run(classifier.predict_async(b"jpeg"))
+    assert result == {"is_plant": True, "plant_type": "Snake Plant", "confidence": 0.8}
+    assert classifier.predict(b"jpeg") == result
+
+def test_async_prediction_times_out(classifier, monkeypatch):
+    """Test a slow upstream is abandoned after classifier_timeout"""
+    monkeypatch.setattr(settings, "classifier_timeout", 0.05)
+    classifier.model = FakeModel(delay=1.0)
+    started = time.monotonic()
+    result = asyncio.run(classifier.predict_async(b"jpeg"))
+    assert time.monotonic() - started < 0.5
+    assert result["plant_type"] == "Error: Plant identification timed out"
+
+def test_concurrent_calls_are_capped(classifier, monkeypatch):
+    """Test no more than classifier_max_in_flight calls reach the upstream at once"""
+    monkeypatch.setattr(settings, "classifier_max_in_flight", 2)
+    classifier.model = FakeModel(delay=0.02)
+
+    async def run():
+        return await asyncio.gather(*(classifier.predict_async(b"jpeg") for _ in range(6)))
+
+    results = asyncio.run(run())
+    assert all(result["is_plant"] for result in results)
+    assert classifier.model.max_in_flight == 2
+
+def test_sync_and_async_calls_share_the_cap(classifier, monkeypatch):
+    """Test threads (batch, jobs, URL predictions) and async routes draw from one limit"""
+    monkeypatch.setattr(settings, "classifier_max_in_flight", 2)
+    classifier.model = FakeModel(delay=0.05)
+
+    async def run():
+        return await asyncio.gather(*(classifier.predict_async(b"jpeg") for _ in range(3)))
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        threaded = [pool.submit(classifier.predict, b"jpeg") for _ in range(3)]
+        results = asyncio.run(run()) + [future.result() for future in threaded]
+    assert all(result["is_plant"] for result in results)
+    assert classifier.model.max_in_flight == 2
+
+def test_timed_out_thread_keeps_its_slot(classifier, monkeypatch):
+    """Test a call abandoned by wait_for holds its slot until the upstream call returns"""
+    monkeypatch.setattr(settings, "classifier_max_in_flight", 1)
+    monkeypatch.setattr(settings, "classifier_timeout", 0.05)
+    classifier.model = model = ThreadOnlyModel(delay=0.3)
+
+    async def run():
+        timed_out = await classifier.predict_async(b"jpeg")
+        # The abandoned thread is still calling upstream
+        return timed_out, classifier.predict(b"jpeg")
+
+    timed_out, busy = asyncio.run(run())
+    assert timed_out["plant_type"] == "Error: Plant identification timed out"
+    assert busy["plant_type"] == "Error: Plant identification is busy, please retry"
+    assert model.calls == 1
+    assert classifier.predict(b"jpeg")["is_plant"]  # Free again once the thread returned
+
+def test_circuit_opens_after_repeated_failures(classifier):
+    """Test an unhealthy upstream is no longer called until the circuit resets"""
+    classifier.model = FakeModel(fail=True)
+    for _ in range(2):
+        assert asyncio.run(classifier.predict_async(b"jpeg"))["plant_type"].startswith("Error:")
+    assert classifier.breaker.state == CircuitBreaker.OPEN
+
+    result = asyncio.run(classifier.predict_async(b"jpeg"))
+    assert "unavailable" in result["plant_type"]
+    assert classifier.predict(b"jpeg")["plant_type"] == result["plant_type"]
+    assert classifier.model.calls == 2
+
+def test_circuit_breaker_half_open_trial(monkeypatch):
+    """Test one trial call is allowed after the reset timeout and closes the circuit"""
+    now = [100.0]
+    monkeypatch.setattr("app.core.resilience.time.monotonic", lambda: now[0])
+    breaker = CircuitBreaker("upstream", failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    now[0] += 10
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+class FakeGenai:
+    """Stands in for the google.generativeai module"""
+
+    def __init__(self):
+        self.list_calls = 0
+
+    def configure(self, api_key):
+        pass
+
+    def list_models(self):
+        self.list_calls += 1
+        model = type("Model", (), {})()
+        model.name = "models/gemini-2.0-flash"
+        model.supported_generation_methods = ["generateContent"]
+        model.input_token_limit = 1048576
+        return [model]
+
+    def GenerativeModel(self, name):
+        return FakeModel()
+
+@pytest.fixture
+def fake_genai(monkeypatch, tmp_path):
+    genai = FakeGenai()
+    monkeypatch.setattr(ml_service, "genai", genai)
+    monkeypatch.setattr(ml_service, "GEMINI_AVAILABLE", True)
+    monkeypatch.setattr(settings, "gemini_api_key", "test-key")
+    monkeypatch.setattr(settings, "gemini_model", None)
+    monkeypatch.setattr(settings, "gemini_model_cache_file", str(tmp_path / "gemini-model.json"))
+    return genai
+
+def test_model_discovery_is_lazy_and_cached(fake_genai, monkeypatch):
+    """Test construction makes no API calls and later workers reuse the discovered model"""
+    classifier = PlantClassifier()
+    assert fake_genai.list_calls == 0
+    assert classifier.status() == "configured"
+
+    assert classifier.predict(b"jpeg")["plant_type"] == "Snake Plant"
+    assert classifier.status() == "ready"
+    assert classifier.model_name == "gemini-2.0-flash"
+    assert fake_genai.list_calls == 1
+
+    # Another worker boots and reads the cached choice
+    other = PlantClassifier()
+    assert other.ensure_initialized()
+    assert other.model_name == "gemini-2.0-flash"
+    assert fake_genai.list_calls == 1
+
+    # An expired entry is rediscovered
+    monkeypatch.setattr(settings, "gemini_model_cache_ttl", -1)
+    assert PlantClassifier().ensure_initialized()
+    assert fake_genai.list_calls == 2
+
+def test_pinned_model_skips_discovery(fake_genai, monkeypatch):
+    """Test GEMINI_MODEL bypasses listing models entirely"""
+    monkeypatch.setattr(settings, "gemini_model", "gemini-1.5-pro")
+    classifier = PlantClassifier()
+    assert classifier.ensure_initialized()
+    assert classifier.model_name == "gemini-1.5-pro"
+    assert fake_genai.list_calls == 0
+
+
+def _jpeg(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 480), color).save(buffer, format="JPEG")
+    return compact_jpeg(buffer.getvalue(), 1024)
+
+def test_local_backend_is_deterministic():
+    """Test the offline backend answers from image content, consistently, after its delay"""
+    classifier = LocalClassifier(latency=0.02)
+    started = time.monotonic()
+    leafy = classifier.predict(_jpeg("forestgreen"))
+    assert time.monotonic() - started >= 0.02
+    assert leafy["is_plant"] and leafy["plant_type"] in LocalClassifier.LABELS
+    assert asyncio.run(classifier.predict_async(_jpeg("forestgreen"))) == leafy
+    assert classifier.predict(_jpeg("gray")) == {"is_plant": False, "plant_type": "Not a plant", "confidence": 0.0}
+
+def test_fallback_answers_while_primary_fails(classifier):
+    """Test degraded mode: the local backend answers when Gemini errors"""
+    classifier.model = FakeModel(fail=True)
+    fallback = FallbackClassifier(classifier, LocalClassifier())
+    result = asyncio.run(fallback.predict_async(_jpeg("forestgreen")))
+    assert result["degraded"] and result["is_plant"]
+    assert fallback.stats()["fallback"] == "local"
+
+    classifier.model = FakeModel()
+    assert "degraded" not in fallback.predict(_jpeg("forestgreen"))
+
+def test_backend_selected_from_settings(monkeypatch):
+    """Test create_classifier builds the configured backend and fallback"""
+    monkeypatch.setattr(settings, "gemini_api_key", None)
+    assert isinstance(create_classifier("local"), LocalClassifier)
+    assert isinstance(create_classifier("unknown"), PlantClassifier)
+    combined = create_classifier("gemini", "local")
+    assert isinstance(combined, FallbackClassifier)
+    assert combined.name == "gemini" and combined.status() == "not_configured"
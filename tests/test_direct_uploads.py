@@ -0,0 +1,134 @@
+import io
+from datetime import datetime, timedelta, timezone
+import pytest
+from urllib.parse import urlsplit
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from PIL import Image
+from app.core.config import settings
+from app.core.database import get_db, Base
+from app.core.security import create_access_token
+from app.models import User, UserRole, ApprovalStatus, ImageUpload, UploadStatus
+from main import app
+
+# Test database
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+app.dependency_overrides[get_db] = override_get_db
+
+client = TestClient(app)
+
+@pytest.fixture(scope="module")
+def admin_headers():
+    """Create an admin and return its auth headers"""
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    admin = User(name="Upload Admin", email="upload-admin@example.com", password_hash="not-used",
+                 role=UserRole.ADMIN, vendor_status=ApprovalStatus.APPROVED)
+    db.add(admin)
+    db.commit()
+    token = create_access_token({"sub": str(admin.id)})
+    db.close()
+    yield {"Authorization": f"Bearer {token}"}
+    Base.metadata.drop_all(bind=engine)
+
+def _jpeg_bytes():
+    buffer = io.BytesIO()
+    Image.new("RGB", (1200, 900), "olive").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+def _put(ticket, data):
+    url = urlsplit(ticket["upload_url"])
+    return client.put(f"{url.path}?{url.query}", content=data, headers=ticket["headers"])
+
+def test_presigned_upload_flow(admin_headers, local_storage):
+    """Test presign, PUT, finalize and plant creation from the upload"""
+    response = client.post("/api/v1/plants/uploads", json={"content_type": "image/jpeg"}, headers=admin_headers)
+    assert response.status_code == 201
+    ticket = response.json()
+    assert ticket["method"] == "PUT"
+
+    assert _put(ticket, _jpeg_bytes()).status_code == 204
+    assert (local_storage / "uploads" / ticket["upload_id"]).exists()
+
+    # TestClient runs background tasks before returning
+    response = client.post(f"/api/v1/plants/uploads/{ticket['upload_id']}/finalize", headers=admin_headers)
+    assert response.status_code == 202
+    body = client.get(f"/api/v1/plants/uploads/{ticket['upload_id']}", headers=admin_headers).json()
+    assert body["status"] == "ready"
+    assert set(body["image_variants"]) == {"thumb", "card", "full"}
+    assert body["image_url"] == body["image_variants"]["full"]["jpeg"]
+    # The original is dropped once the variants exist
+    assert not (local_storage / "uploads" / ticket["upload_id"]).exists()
+
+    response = client.post("/api/v1/plants/", headers=admin_headers, data={
+        "name": "Uploaded Fern", "category": "Indoor", "price": "120", "stock": "3",
+        "upload_id": ticket["upload_id"],
+    })
+    assert response.status_code == 201
+    assert response.json()["image_variants"] == body["image_variants"]
+
+def test_presigned_put_rejects_tampering(admin_headers, local_storage):
+    """Test the local PUT stand-in checks its signature and content type"""
+    ticket = client.post("/api/v1/plants/uploads", json={"content_type": "image/jpeg"}, headers=admin_headers).json()
+    forged = dict(ticket, upload_url=ticket["upload_url"].replace("signature=", "signature=0"))
+    assert _put(forged, _jpeg_bytes()).status_code == 403
+    assert _put(dict(ticket, headers={"Content-Type": "image/png"}), _jpeg_bytes()).status_code == 403
+
+def test_finalize_marks_bad_uploads_failed(admin_headers, local_storage):
+    """Test non-image bytes end in a failed upload that plants cannot use"""
+    ticket = client.post("/api/v1/plants/uploads", json={"content_type": "image/jpeg"}, headers=admin_headers).json()
+    _put(ticket, b"not an image")
+    client.post(f"/api/v1/plants/uploads/{ticket['upload_id']}/finalize", headers=admin_headers)
+    body = client.get(f"/api/v1/plants/uploads/{ticket['upload_id']}", headers=admin_headers).json()
+    assert body["status"] == "failed"
+    assert body["error"]
+
+    response = client.post("/api/v1/plants/", headers=admin_headers, data={
+        "name": "Broken", "category": "Indoor", "price": "10", "stock": "1", "upload_id": ticket["upload_id"],
+    })
+    assert response.status_code == 409
+
+def test_finalize_refuses_oversized_originals(admin_headers, local_storage, monkeypatch):
+    """Test an original over the size limit fails without being read into memory"""
+    ticket = client.post("/api/v1/plants/uploads", json={"content_type": "image/jpeg"}, headers=admin_headers).json()
+    # Written straight to storage, as a presigned S3 PUT of any size would be
+    (local_storage / "uploads").mkdir(exist_ok=True)
+    (local_storage / "uploads" / ticket["upload_id"]).write_bytes(_jpeg_bytes())
+    monkeypatch.setattr(settings, "image_upload_max_bytes", 1024)
+
+    client.post(f"/api/v1/plants/uploads/{ticket['upload_id']}/finalize", headers=admin_headers)
+    body = client.get(f"/api/v1/plants/uploads/{ticket['upload_id']}", headers=admin_headers).json()
+    assert body["status"] == "failed"
+    assert body["error"] == "Image is too large"
+
+def test_finalize_requeues_stalled_processing(admin_headers, local_storage):
+    """Test an upload left processing (e.g. by a restart) is finalized again once stale"""
+    ticket = client.post("/api/v1/plants/uploads", json={"content_type": "image/jpeg"}, headers=admin_headers).json()
+    _put(ticket, _jpeg_bytes())
+    db = TestingSessionLocal()
+    upload = db.get(ImageUpload, ticket["upload_id"])
+    upload.status = UploadStatus.PROCESSING
+    db.commit()
+
+    # Recently started: left alone
+    client.post(f"/api/v1/plants/uploads/{ticket['upload_id']}/finalize", headers=admin_headers)
+    db.refresh(upload)
+    assert upload.status == UploadStatus.PROCESSING
+
+    upload.updated_at = datetime.now(timezone.utc) - timedelta(seconds=settings.image_upload_processing_timeout + 60)
+    db.commit()
+    db.close()
+    client.post(f"/api/v1/plants/uploads/{ticket['upload_id']}/finalize", headers=admin_headers)
+    body = client.get(f"/api/v1/plants/uploads/{ticket['upload_id']}", headers=admin_headers).json()
+    assert body["status"] == "ready"
@@ -0,0 +1,112 @@
+import asyncio
+import io
+import pytest
+from fastapi import UploadFile, HTTPException
+from PIL import Image
+from app.core.config import settings
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.core.database import Base
+from app.core.imaging import content_hash, open_image, compact_jpeg
+from app.core.image_ingest import read_limited, read_upload
+from app.models import ImageBlob
+from app.services.image_pipeline import ImagePipeline
+
+
+def _upload(size=(2400, 1600), content_type="image/png", color="green"):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    buffer.seek(0)
+    return UploadFile(file=buffer, filename="leaf.png", headers={"content-type": content_type})
+
+@pytest.mark.parametrize("process_workers", [0, 1])
+def test_pipeline_processes_and_stores(local_storage, process_workers):
+    """Test uploads are resized in the pool and stored through the backend"""
+    pipeline = ImagePipeline(process_workers=process_workers, upload_workers=2, max_in_flight=2)
+
+    async def run():
+        colors = ["green", "red", "blue", "white"]
+        return await asyncio.gather(*(pipeline.upload(_upload(color=color)) for color in colors))
+
+    try:
+        manifests = asyncio.run(run())
+    finally:
+        pipeline.shutdown()
+    assert len({m["full"]["jpeg"] for m in manifests}) == 4
+
+    manifest = manifests[0]
+    assert set(manifest) == {"thumb", "card", "full"}
+    assert (manifest["full"]["width"], manifest["full"]["height"]) == (1920, 1280)
+    assert (manifest["thumb"]["width"], manifest["thumb"]["height"]) == (320, 213)
+    for variant in manifest.values():
+        for format_name, pil_format in [("webp", "WEBP"), ("jpeg", "JPEG")]:
+            stored = Image.open(local_storage / variant[format_name][len(settings.storage_local_base_url) + 1:])
+            assert stored.format == pil_format
+            assert stored.size == (variant["width"], variant["height"])
+
+    stats = pipeline.stats()
+    assert stats["completed"] == 4 and stats["failed"] == 0
+    assert stats["waiting"] == stats["processing"] == stats["uploading"] == 0
+
+def test_pipeline_rejects_non_images(local_storage):
+    """Test non-image uploads fail before any work is queued"""
+    pipeline = ImagePipeline(process_workers=0, upload_workers=1, max_in_flight=1)
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(pipeline.upload(_upload(content_type="text/plain")))
+    assert excinfo.value.status_code == 400
+    assert pipeline.stats()["completed"] == 0
+
+def test_duplicate_uploads_skip_processing(local_storage, tmp_path):
+    """Test re-uploading the same bytes reuses the stored variants"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'blobs.db'}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    pipeline = ImagePipeline(process_workers=0, upload_workers=2, max_in_flight=2)
+
+    async def run():
+        first = await pipeline.upload(_upload(), db)
+        second = await pipeline.upload(_upload(), db)
+        return first, second
+
+    try:
+        first, second = asyncio.run(run())
+        assert first == second
+        assert pipeline.stats()["deduplicated"] == 1
+
+        digest = content_hash(_upload().file.read())
+        blob = db.query(ImageBlob).one()
+        assert blob.sha256 == digest
+        assert digest in first["full"]["jpeg"]
+        assert (blob.width, blob.height) == (1920, 1280)
+    finally:
+        pipeline.shutdown()
+        db.close()
+        engine.dispose()
+
+def test_open_image_downscales_and_applies_orientation():
+    """Test JPEGs are decoded small and turned upright from their EXIF orientation"""
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Rotated 90 degrees clockwise
+    buffer = io.BytesIO()
+    Image.new("RGB", (4000, 3000), "green").save(buffer, format="JPEG", exif=exif)
+
+    image = open_image(buffer.getvalue(), 1000)
+    assert image.mode == "RGB"
+    assert image.size == (750, 1000)
+
+    compact = Image.open(io.BytesIO(compact_jpeg(buffer.getvalue(), 500)))
+    assert compact.format == "JPEG"
+    assert compact.size == (375, 500)
+
+def test_reads_stop_at_the_size_limit():
+    """Test oversized uploads are rejected with 413 while streaming"""
+    data = b"x" * 1000
+    assert read_limited(io.BytesIO(data), 1000, chunk_size=64) == data
+    with pytest.raises(HTTPException) as excinfo:
+        read_limited(io.BytesIO(data), 999, chunk_size=64)
+    assert excinfo.value.status_code == 413
+
+    upload = UploadFile(file=io.BytesIO(data), filename="big.jpg")
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(read_upload(upload, 500, chunk_size=64))
+    assert excinfo.value.status_code == 413
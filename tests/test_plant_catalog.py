@@ -0,0 +1,353 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.core.cache import TTLCache
+from app.core.database import get_db, Base
+from app.models import User, Plant, UserRole, ApprovalStatus, Order, OrderItem, OrderStatus
+from app.schemas.order import OrderCreate, OrderItemCreate
+from app.schemas.plant import PlantUpdate, PlantSearchParams
+from app.services import catalog_cache
+from app.services.catalog_cache import invalidate_catalog, plant_detail_cache
+from app.services.order_service import OrderService
+from app.services.plant_service import PlantService
+from app.services.review_service import ReviewService
+from main import app
+
+# Test database
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+app.dependency_overrides[get_db] = override_get_db
+
+client = TestClient(app)
+
+@pytest.fixture(scope="module")
+def catalog():
+    """Create a seller with a small approved catalog"""
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    seller = User(
+        name="Catalog Seller",
+        email="catalog-seller@example.com",
+        password_hash="not-used",
+        role=UserRole.SELLER,
+        vendor_status=ApprovalStatus.APPROVED,
+    )
+    db.add(seller)
+    db.flush()
+    plants = [
+        Plant(name="Snake Plant", species="Dracaena trifasciata", category="Indoor", price=300.0,
+              description="Hardy succulent for low light", stock_quantity=5, seller_id=seller.id,
+              approval_status=ApprovalStatus.APPROVED),
+        Plant(name="Money Plant", species="Epipremnum aureum", category="Indoor", price=150.0,
+              description="Trailing vine", stock_quantity=5, seller_id=seller.id,
+              approval_status=ApprovalStatus.APPROVED, verified_by_ai=True),
+        Plant(name="Hibiscus", species="Hibiscus rosa-sinensis", category="Outdoor", price=450.0,
+              description="Red flowering shrub", stock_quantity=5, seller_id=seller.id,
+              approval_status=ApprovalStatus.APPROVED),
+        Plant(name="Tulsi", species="Ocimum tenuiflorum", category="Herbs", price=80.0,
+              description="Holy basil", stock_quantity=5, seller_id=seller.id,
+              approval_status=ApprovalStatus.APPROVED, verified_by_ai=True),
+        Plant(name="Areca Palm", species="Dypsis lutescens", category="Indoor", price=900.0,
+              description="Air purifying palm", stock_quantity=5, seller_id=seller.id,
+              approval_status=ApprovalStatus.APPROVED),
+        Plant(name="Pending Cactus", species="Cactaceae", category="Outdoor", price=120.0,
+              stock_quantity=5, seller_id=seller.id, approval_status=ApprovalStatus.PENDING),
+    ]
+    db.add_all(plants)
+    db.commit()
+    ids = [p.id for p in plants]
+    db.close()
+    # Rows were written directly, not through the services
+    invalidate_catalog()
+    yield ids
+    Base.metadata.drop_all(bind=engine)
+    invalidate_catalog()
+
+def test_cursor_pagination_walks_catalog(catalog):
+    """Test keyset pagination visits every approved plant exactly once"""
+    seen = []
+    cursor = None
+    for _ in range(10):
+        params = {"size": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/api/v1/plants/", params=params)
+        assert response.status_code == 200
+        body = response.json()
+        seen.extend(p["id"] for p in body["plants"])
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+    assert seen == sorted(catalog[:5], reverse=True)
+    assert body["total"] == 5
+
+def test_offset_pagination_still_supported(catalog):
+    """Test page/size pagination returns the same order as cursors"""
+    response = client.get("/api/v1/plants/", params={"page": 2, "size": 2})
+    assert response.status_code == 200
+    body = response.json()
+    assert [p["id"] for p in body["plants"]] == sorted(catalog[:5], reverse=True)[2:4]
+    assert body["pages"] == 3
+    assert body["next_cursor"]
+
+def test_invalid_cursor_rejected(catalog):
+    """Test a malformed cursor returns 400"""
+    response = client.get("/api/v1/plants/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+def test_full_text_search_matches_species_and_description(catalog):
+    """Test q searches beyond the plant name"""
+    response = client.get("/api/v1/plants/", params={"q": "epipremnum"})
+    assert response.status_code == 200
+    assert [p["name"] for p in response.json()["plants"]] == ["Money Plant"]
+
+    response = client.get("/api/v1/plants/", params={"q": "succulent"})
+    assert [p["name"] for p in response.json()["plants"]] == ["Snake Plant"]
+
+def test_full_text_search_ranks_and_filters(catalog):
+    """Test q combines with filters and ignores unapproved plants"""
+    response = client.get("/api/v1/plants/", params={"q": "plant", "category": "Indoor"})
+    body = response.json()
+    assert {p["name"] for p in body["plants"]} == {"Snake Plant", "Money Plant"}
+    assert body["total"] == 2
+
+    response = client.get("/api/v1/plants/", params={"q": "cactus"})
+    assert response.json()["total"] == 0
+
+def test_count_modes(catalog):
+    """Test count=none skips the total and estimates are invalidated on change"""
+    response = client.get("/api/v1/plants/", params={"count": "none"})
+    body = response.json()
+    assert body["total"] is None
+    assert body["pages"] is None
+    assert len(body["plants"]) == 5
+
+    response = client.get("/api/v1/plants/", params={"category": "Outdoor"})
+    assert response.json()["total"] == 1
+
+    # Approving a plant must not leave a stale cached total behind
+    from app.services.admin_service import AdminService
+    db = TestingSessionLocal()
+    AdminService(db).update_plant_status(catalog[5], ApprovalStatus.APPROVED)
+    response = client.get("/api/v1/plants/", params={"category": "Outdoor"})
+    assert response.json()["total"] == 2
+    AdminService(db).update_plant_status(catalog[5], ApprovalStatus.PENDING)
+    db.close()
+
+def test_facets(catalog):
+    """Test facet counts cover approved plants under the current filter"""
+    response = client.get("/api/v1/plants/facets")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total"] == 5
+    assert body["verified_count"] == 2
+    assert body["categories"][0] == {"value": "Indoor", "count": 3}
+    buckets = {b["min_price"]: b["count"] for b in body["price_buckets"]}
+    assert buckets[0] == 1 and buckets[100] == 1 and buckets[250] == 2 and buckets[500] == 1
+    assert sum(buckets.values()) == 5
+
+    response = client.get("/api/v1/plants/facets", params={"category": "Indoor", "max_price": 500})
+    body = response.json()
+    assert body["total"] == 2
+    assert body["categories"] == [{"value": "Indoor", "count": 2}]
+
+def test_batch_lookup_preserves_order_and_reports_missing(catalog):
+    """Test batch lookup returns plants in request order"""
+    wanted = [catalog[2], 999999, catalog[0], catalog[2]]
+    response = client.get("/api/v1/plants/batch", params={"ids": ",".join(map(str, wanted))})
+    assert response.status_code == 200
+    body = response.json()
+    assert [p["id"] for p in body["plants"]] == [catalog[2], catalog[0]]
+    assert body["missing"] == [999999]
+
+    response = client.get("/api/v1/plants/batch", params={"ids": ["1", "abc"]})
+    assert response.status_code == 400
+
+def test_suggest_prefix_index(catalog):
+    """Test typeahead matches word starts and follows catalog changes"""
+    response = client.get("/api/v1/plants/suggest", params={"prefix": "pla"})
+    assert response.status_code == 200
+    texts = [s["text"] for s in response.json()["suggestions"]]
+    assert "Snake Plant" in texts and "Money Plant" in texts
+    assert "Pending Cactus" not in texts
+
+    response = client.get("/api/v1/plants/suggest", params={"prefix": "epi"})
+    assert response.json()["suggestions"] == [{"text": "Epipremnum aureum", "kind": "species"}]
+
+    response = client.get("/api/v1/plants/suggest", params={"prefix": "mang"})
+    assert response.json()["suggestions"] == [{"text": "Mango", "kind": "category"}]
+
+    from app.services.admin_service import AdminService
+    db = TestingSessionLocal()
+    AdminService(db).update_plant_status(catalog[5], ApprovalStatus.APPROVED)
+    response = client.get("/api/v1/plants/suggest", params={"prefix": "cact"})
+    assert "Pending Cactus" in [s["text"] for s in response.json()["suggestions"]]
+    AdminService(db).update_plant_status(catalog[5], ApprovalStatus.PENDING)
+    db.close()
+    response = client.get("/api/v1/plants/suggest", params={"prefix": "cact"})
+    assert "Pending Cactus" not in [s["text"] for s in response.json()["suggestions"]]
+
+def test_sort_by_price_with_cursor(catalog):
+    """Test price sorting paginates by cursor in price order"""
+    prices = []
+    params = {"sort": "price_asc", "size": 2}
+    while True:
+        body = client.get("/api/v1/plants/", params=params).json()
+        prices.extend(p["price"] for p in body["plants"])
+        if not body["next_cursor"]:
+            break
+        params["cursor"] = body["next_cursor"]
+    assert prices == [80.0, 150.0, 300.0, 450.0, 900.0]
+
+    body = client.get("/api/v1/plants/", params={"sort": "price_desc", "size": 2}).json()
+    assert [p["price"] for p in body["plants"]] == [900.0, 450.0]
+
+    # A cursor only continues the sort it was issued for
+    response = client.get("/api/v1/plants/", params={"sort": "newest", "cursor": body["next_cursor"]})
+    assert response.status_code == 400
+
+def test_conditional_get(catalog):
+    """Test ETags on listing, detail and category tree short-circuit to 304"""
+    db = TestingSessionLocal()
+    for path in ["/api/v1/plants/", f"/api/v1/plants/{catalog[0]}", "/api/v1/categories/tree"]:
+        response = client.get(path)
+        etag = response.headers["etag"]
+        response = client.get(path, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+    listing_etag = client.get("/api/v1/plants/").headers["etag"]
+    detail_etag = client.get(f"/api/v1/plants/{catalog[0]}").headers["etag"]
+    other_detail_etag = client.get(f"/api/v1/plants/{catalog[1]}").headers["etag"]
+    # Different query parameters are different representations
+    assert client.get("/api/v1/plants/", params={"size": 2}).headers["etag"] != listing_etag
+
+    # A change through the services moves the validators that cover the plant
+    seller_id = db.query(Plant.seller_id).filter(Plant.id == catalog[0]).scalar()
+    PlantService(db).update_plant(catalog[0], PlantUpdate(price=310.0), seller_id=seller_id)
+    db.close()
+    assert client.get("/api/v1/plants/", headers={"If-None-Match": listing_etag}).status_code == 200
+    response = client.get(f"/api/v1/plants/{catalog[0]}", headers={"If-None-Match": detail_etag})
+    assert response.status_code == 200
+    assert response.json()["price"] == 310.0
+    response = client.get(f"/api/v1/plants/{catalog[1]}", headers={"If-None-Match": other_detail_etag})
+    assert response.status_code == 304
+
+def test_listing_etag_sees_other_workers_writes(catalog, monkeypatch):
+    """Test a write that skipped this process's invalidation still moves the listing ETag"""
+    # Entries expire at once, as if catalog_count_cache_ttl had passed
+    monkeypatch.setattr(catalog_cache, "_catalog_fingerprints", TTLCache(maxsize=1, ttl=0))
+    listing_etag = client.get("/api/v1/plants/").headers["etag"]
+
+    db = TestingSessionLocal()
+    plant = db.get(Plant, catalog[2])
+    plant.price = 460.0  # Committed directly, like another worker would
+    db.commit()
+    db.close()
+
+    response = client.get("/api/v1/plants/", headers={"If-None-Match": listing_etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != listing_etag
+
+def test_plant_detail_cache(catalog):
+    """Test detail payloads are cached and dropped when the plant changes"""
+    plant_id = catalog[1]
+    first = client.get(f"/api/v1/plants/{plant_id}")
+    assert plant_detail_cache.get(plant_id) is not None
+    cached = client.get(f"/api/v1/plants/{plant_id}")
+    assert cached.content == first.content
+    assert cached.headers["etag"] == first.headers["etag"]
+
+    db = TestingSessionLocal()
+    PlantService(db).update_plant_verification(plant_id, False)
+    db.close()
+    assert plant_detail_cache.get(plant_id) is None
+    response = client.get(f"/api/v1/plants/{plant_id}")
+    assert response.json()["verified_by_ai"] is False
+    assert response.headers["etag"] != first.headers["etag"]
+
+    # A message from another worker reaches the same handler
+    from app.services.catalog_cache import catalog_bus
+    catalog_bus._deliver(str(plant_id))
+    assert plant_detail_cache.get(plant_id) is None
+
+def test_sparse_fieldsets(catalog):
+    """Test fields= trims both the payload and the loaded columns"""
+    response = client.get("/api/v1/plants/", params={"fields": "name,price", "sort": "price_asc", "size": 2})
+    assert response.status_code == 200
+    body = response.json()
+    assert [set(p) for p in body["plants"]] == [{"id", "name", "price"}] * 2
+    assert "etag" in response.headers
+
+    # Cursors still work even though the sort column was not requested
+    body = client.get("/api/v1/plants/", params={"fields": "name", "sort": "price_asc", "size": 2,
+                                                 "cursor": body["next_cursor"]}).json()
+    assert [p["name"] for p in body["plants"]] == ["Snake Plant", "Hibiscus"]
+
+    response = client.get("/api/v1/plants/", params={"fields": "name,password_hash"})
+    assert response.status_code == 400
+
+    from sqlalchemy import inspect
+    db = TestingSessionLocal()
+    plants, _, _ = PlantService(db).get_plants(PlantSearchParams(fields=["id", "name"]))
+    assert {"description", "care_instructions"} <= inspect(plants[0]).unloaded
+    db.close()
+
+def test_sort_counters_survive_concurrent_writes(catalog):
+    """Test sales and rating counters are incremented in SQL, not from stale copies"""
+    plant_id = catalog[5]
+    first, second = TestingSessionLocal(), TestingSessionLocal()
+    try:
+        seller_id = first.get(Plant, plant_id).seller_id
+        second.get(Plant, plant_id)  # Loaded before the first review lands
+        ReviewService(first).create_review(seller_id, plant_id, 5, None)
+        ReviewService(second).create_review(seller_id, plant_id, 3, None)
+
+        order = Order(buyer_id=seller_id, seller_id=seller_id, status=OrderStatus.PENDING,
+                      total_price=240.0, shipping_address="1 Test Road",
+                      order_items=[OrderItem(plant_id=plant_id, quantity=2, unit_price=120.0)])
+        first.add(order)
+        first.commit()
+        OrderService(first)._add_order_sales(order, 1)
+        OrderService(second)._add_sales(second.get(Plant, plant_id), 1)
+        first.commit()
+        second.commit()
+
+        OrderService(first).update_order_status(order.id, OrderStatus.CANCELLED, seller_id)
+        plant = first.get(Plant, plant_id, populate_existing=True)
+        assert plant.rating_count == 2 and plant.rating_average == 4.0
+        assert plant.sales_count == 1
+    finally:
+        first.close()
+        second.close()
+
+def test_repeated_plant_in_one_order_counts_every_line(catalog):
+    """Test each line of an order adds to sales_count when a plant appears twice"""
+    plant_id = catalog[5]
+    db = TestingSessionLocal()
+    try:
+        plant = db.get(Plant, plant_id)
+        seller_id, sales, stock = plant.seller_id, plant.sales_count, plant.stock_quantity
+        order = OrderService(db).create_order(OrderCreate(
+            seller_id=seller_id, shipping_address="1 Test Road",
+            items=[OrderItemCreate(plant_id=plant_id, quantity=2), OrderItemCreate(plant_id=plant_id, quantity=3)]
+        ), seller_id)
+        plant = db.get(Plant, plant_id, populate_existing=True)
+        assert plant.sales_count == sales + 5 and plant.stock_quantity == stock - 5
+
+        OrderService(db).cancel_order(order.id, seller_id)
+        plant = db.get(Plant, plant_id, populate_existing=True)
+        assert plant.sales_count == sales and plant.stock_quantity == stock
+    finally:
+        db.close()
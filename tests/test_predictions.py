@@ -0,0 +1,423 @@
+import asyncio
+import io
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+from fastapi import UploadFile
+from PIL import Image, ImageDraw
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.core.database import Base, get_db
+from app.core.security import create_access_token
+from app.core.singleflight import SingleFlight
+from app.core.imaging import dhash, hash_distance
+from app.models import Prediction, PredictionStatus, User, UserRole, ApprovalStatus
+from app.services import prediction_service
+from app.services.prediction_cache import prediction_cache
+from app.services.prediction_jobs import PredictionJobs
+from app.services.prediction_service import MLService
+from tests.test_remote_images import ImageHandler
+from main import app
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'predictions.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    prediction_cache.clear()
+    yield sessionmaker(bind=engine)
+    prediction_cache.clear()
+    engine.dispose()
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
+
+@pytest.fixture
+def seller_client(session_factory):
+    """Client whose requests use the test database, plus a seller's auth headers"""
+    def override_get_db():
+        session = session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    db = session_factory()
+    seller = User(name="Batch Seller", email="batch-seller@example.com", password_hash="not-used",
+                  role=UserRole.SELLER, vendor_status=ApprovalStatus.APPROVED)
+    db.add(seller)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(seller.id)})}"}
+    db.close()
+
+    previous = app.dependency_overrides.get(get_db)
+    app.dependency_overrides[get_db] = override_get_db
+    yield TestClient(app), headers
+    if previous is None:
+        app.dependency_overrides.pop(get_db, None)
+    else:
+        app.dependency_overrides[get_db] = previous
+
+@pytest.fixture
+def classifier_calls(monkeypatch):
+    calls = []
+
+    def predict(image):
+        calls.append(image)
+        return {"is_plant": True, "plant_type": "Monstera Deliciosa", "confidence": 0.9}
+
+    monkeypatch.setattr(prediction_service.plant_classifier, "predict", predict)
+    return calls
+
+def _photo(quality=90, shift=0, size=(1600, 1200)):
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((300 + shift, 200, 1100 + shift, 1000), fill="darkgreen")
+    draw.rectangle((1200, 100, 1500, 400), fill="brown")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    buffer.seek(0)
+    return UploadFile(file=buffer, filename="plant.jpg")
+
+def test_dhash_tolerates_reencoding():
+    """Test re-encoded and slightly shifted photos hash within a few bits"""
+    first = dhash(Image.open(_photo().file))
+    second = dhash(Image.open(_photo(quality=60, shift=8).file))
+    assert len(first) == 16
+    assert hash_distance(first, second) <= 4
+    assert hash_distance(first, dhash(Image.new("RGB", (100, 100), "black"))) > 4
+
+def test_near_duplicate_photos_skip_the_classifier(db, classifier_calls):
+    """Test a retaken photo is answered from the cache and still logged"""
+    first = MLService(db).predict_from_file(_photo(), user_id=None)
+    second = MLService(db).predict_from_file(_photo(quality=60, shift=8), user_id=None)
+
+    assert len(classifier_calls) == 1
+    assert not first.cached and second.cached
+    assert second.plant_type == "Monstera Deliciosa"
+    assert db.query(Prediction).count() == 2
+
+    # Another worker (empty memory tier) finds the exact hash in the table
+    prediction_cache.clear()
+    third = MLService(db).predict_from_file(_photo(), user_id=None)
+    assert third.cached and len(classifier_calls) == 1
+
+def test_persistent_tier_uses_newest_usable_row(db):
+    """Test the table lookup answers each hash with its newest completed, non-error row"""
+    blank, other = "0" * 16, "f" * 16
+    db.add_all([
+        Prediction(image_url="", is_plant=True, plant_type="Pothos", confidence=0.6, image_hash=blank),
+        Prediction(image_url="", is_plant=True, plant_type="Monstera", confidence=0.9, image_hash=blank),
+        Prediction(image_url="", is_plant=False, plant_type="Error: timeout", confidence=0.0, image_hash=blank),
+        Prediction(image_url="", is_plant=False, confidence=0.0, image_hash=blank, status=PredictionStatus.PENDING),
+        Prediction(image_url="", is_plant=True, plant_type="Tulsi", confidence=0.8, image_hash=other),
+    ])
+    db.commit()
+
+    found = prediction_cache.get_many(db, [blank, other, "1" * 16])
+    assert {image_hash: result["plant_type"] for image_hash, result in found.items()} == {
+        blank: "Monstera", other: "Tulsi"
+    }
+
+@pytest.mark.parametrize("result", [
+    {"is_plant": False, "plant_type": "Error: Gemini API not configured", "confidence": 0.0},
+    {"is_plant": True, "plant_type": "Pothos", "confidence": 0.7, "degraded": True},
+])
+def test_failed_and_degraded_predictions_are_not_cached(db, monkeypatch, result):
+    """Test classifier errors and fallback answers are retried on the next request"""
+    calls = []
+
+    def predict(image):
+        calls.append(image)
+        return result
+
+    monkeypatch.setattr(prediction_service.plant_classifier, "predict", predict)
+    first = MLService(db).predict_from_file(_photo(), user_id=None)
+    second = MLService(db).predict_from_file(_photo(), user_id=None)
+    assert not second.cached and len(calls) == 2
+    assert first.degraded == bool(result.get("degraded"))
+
+def test_batch_prediction_keeps_order_and_reports_failures(seller_client, session_factory, classifier_calls):
+    """Test a batch classifies each distinct photo once and isolates bad files"""
+    client, headers = seller_client
+    photo = _photo().file.read()
+    other = io.BytesIO()
+    Image.new("RGB", (800, 600), "navy").save(other, format="PNG")
+    files = [
+        ("images", ("first.jpg", photo, "image/jpeg")),
+        ("images", ("broken.jpg", b"not an image", "image/jpeg")),
+        ("images", ("other.png", other.getvalue(), "image/png")),
+        ("images", ("again.jpg", photo, "image/jpeg")),
+    ]
+    response = client.post("/api/v1/plants/predict/batch", files=files, headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["succeeded"], body["failed"]) == (3, 1)
+    assert [item["filename"] for item in body["results"]] == ["first.jpg", "broken.jpg", "other.png", "again.jpg"]
+    assert body["results"][1]["result"] is None and "Invalid image" in body["results"][1]["error"]
+    assert len(classifier_calls) == 2
+
+    ids = [item["result"]["prediction_id"] for item in body["results"] if item["result"]]
+    db = session_factory()
+    assert db.query(Prediction).filter(Prediction.id.in_(ids)).count() == 3
+    db.close()
+
+def test_batch_prediction_limits_size(seller_client, monkeypatch):
+    """Test oversized batches are rejected before any work"""
+    client, headers = seller_client
+    monkeypatch.setattr(prediction_service.settings, "prediction_batch_max_images", 1)
+    files = [("images", (f"{i}.jpg", b"x", "image/jpeg")) for i in range(2)]
+    response = client.post("/api/v1/plants/predict/batch", files=files, headers=headers)
+    assert response.status_code == 400
+
+def test_identical_concurrent_predictions_share_one_call(session_factory, monkeypatch):
+    """Test simultaneous requests for the same photo make one upstream call but log each request"""
+    calls = []
+
+    async def predict_async(image):
+        calls.append(image)
+        await asyncio.sleep(0.05)
+        return {"is_plant": True, "plant_type": "Pothos", "confidence": 0.8}
+
+    monkeypatch.setattr(prediction_service.plant_classifier, "predict_async", predict_async)
+    photo = _photo().file.read()
+
+    async def run():
+        sessions = [session_factory() for _ in range(3)]
+        try:
+            return await asyncio.gather(*(
+                MLService(session).predict_upload(UploadFile(file=io.BytesIO(photo), filename="plant.jpg"))
+                for session in sessions
+            ))
+        finally:
+            for session in sessions:
+                session.close()
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert {result.plant_type for result in results} == {"Pothos"}
+    assert len({result.prediction_id for result in results}) == 3
+
+def test_singleflight_coalesces_threads():
+    """Test concurrent sync calls with one key run the function once"""
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow(value):
+        calls.append(value)
+        started.set()
+        release.wait(5)
+        return value * 2
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        leader = pool.submit(flights.do, "key", slow, 21)
+        started.wait(5)
+        followers = [pool.submit(flights.do, "key", slow, 21) for _ in range(2)]
+        while flights.coalesced < 2:
+            time.sleep(0.001)
+        release.set()
+        assert leader.result() == (42, False)
+        assert [f.result() for f in followers] == [(42, True), (42, True)]
+    assert calls == [21]
+
+    # Errors reach every waiter and the key is free again afterwards
+    with pytest.raises(ZeroDivisionError):
+        flights.do("key", lambda: 1 / 0)
+    assert flights.do("key", lambda: "again") == ("again", False)
+
+def test_async_prediction_job(seller_client, classifier_calls, monkeypatch):
+    """Test ?async=true returns a job at once that can be polled and streamed"""
+    client, headers = seller_client
+    gate = threading.Event()
+    original = prediction_service.plant_classifier.predict
+
+    def gated(image):
+        gate.wait(5)
+        return original(image)
+
+    monkeypatch.setattr(prediction_service.plant_classifier, "predict", gated)
+    files = {"image": ("plant.jpg", _photo().file.read(), "image/jpeg")}
+    response = client.post("/api/v1/plants/predict?async=true", files=files, headers=headers)
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] in ("pending", "processing")
+    assert job["status_url"] == f"/api/v1/plants/predictions/{job['prediction_id']}"
+
+    polled = client.get(job["status_url"], headers=headers).json()
+    assert polled["status"] in ("pending", "processing")
+
+    threading.Timer(0.2, gate.set).start()
+    with client.stream("GET", job["events_url"], headers=headers) as stream:
+        assert stream.headers["content-type"].startswith("text/event-stream")
+        events = [line for line in stream.iter_lines() if line.startswith("data: ")]
+    assert '"status":"completed"' in events[-1]
+    assert len(events) >= 2
+
+    polled = client.get(job["status_url"], headers=headers).json()
+    assert polled["status"] == "completed" and polled["plant_type"] == "Monstera Deliciosa"
+    assert len(classifier_calls) == 1
+
+    # Same photo again: answered from the cache without queueing
+    response = client.post("/api/v1/plants/predict?async=true", files=files, headers=headers)
+    assert response.json()["status"] == "completed"
+    assert len(classifier_calls) == 1
+
+    history = client.get("/api/v1/plants/predictions/history", headers=headers)
+    assert history.status_code == 200 and len(history.json()) == 2
+    assert client.get("/api/v1/plants/predictions/999999", headers=headers).status_code == 404
+
+def test_lost_prediction_jobs_are_failed(seller_client, session_factory, classifier_calls, monkeypatch):
+    """Test jobs cancelled by shutdown or orphaned by a dead worker end as failed"""
+    client, headers = seller_client
+    gate = threading.Event()
+    monkeypatch.setattr(prediction_service.plant_classifier, "predict",
+                        lambda image: gate.wait(5) and {"is_plant": True, "plant_type": "Pothos", "confidence": 0.9})
+
+    db = session_factory()
+    seller = db.query(User).filter(User.email == "batch-seller@example.com").first()
+    rows = [Prediction(image_url="", is_plant=False, confidence=0.0, uploaded_by=seller.id,
+                       status=PredictionStatus.PENDING) for _ in range(3)]
+    rows[2].timestamp = datetime.now(timezone.utc) - timedelta(hours=1)  # Left behind by a previous run
+    db.add_all(rows)
+    db.commit()
+    running, queued, orphaned = (row.id for row in rows)
+
+    jobs = PredictionJobs(workers=1, max_queued=10)
+    jobs.submit(running, "0" * 16, b"jpeg", session_factory)
+    jobs.submit(queued, "1" * 16, b"jpeg", session_factory)
+    time.sleep(0.1)
+    jobs.shutdown()
+    gate.set()
+    deadline = time.monotonic() + 2
+    while jobs.stats()["queued"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert jobs.stats()["queued"] == 0
+
+    assert db.get(Prediction, queued, populate_existing=True).status == PredictionStatus.FAILED
+    assert db.get(Prediction, orphaned).status == PredictionStatus.PENDING
+    db.close()
+
+    body = client.get(f"/api/v1/plants/predictions/{orphaned}", headers=headers).json()
+    assert body["status"] == "failed" and body["plant_type"].startswith("Error:")
+
+def test_live_prediction_jobs_are_not_failed(seller_client, session_factory, monkeypatch):
+    """Test queued jobs keep their rows alive and a job failed as lost stays failed"""
+    gate = threading.Event()
+    monkeypatch.setattr(prediction_service.plant_classifier, "predict",
+                        lambda image: gate.wait(5) and {"is_plant": True, "plant_type": "Pothos", "confidence": 0.9})
+
+    db = session_factory()
+    seller = db.query(User).filter(User.email == "batch-seller@example.com").first()
+    long_ago = datetime.now(timezone.utc) - timedelta(hours=1)
+    rows = [Prediction(image_url="", is_plant=False, confidence=0.0, uploaded_by=seller.id,
+                       status=PredictionStatus.PENDING, timestamp=long_ago) for _ in range(2)]
+    db.add_all(rows)
+    db.commit()
+    running, queued = (row.id for row in rows)
+
+    jobs = PredictionJobs(workers=1, max_queued=10, heartbeat_interval=0.05)
+    jobs.submit(running, "0" * 16, b"jpeg", session_factory)
+    jobs.submit(queued, "1" * 16, b"jpeg", session_factory)
+    time.sleep(0.2)
+    # The owner never fails its own jobs; other workers see the heartbeat
+    assert jobs.fail_stale(db, 300) == 0 and jobs.fail_stale(db, 300, queued) == 0
+    assert PredictionJobs(workers=1, max_queued=10).fail_stale(db, 300) == 0
+
+    # Failed by a worker that missed the heartbeat: the late result is dropped
+    PredictionJobs(workers=1, max_queued=10).fail_stale(db, 0, running)
+    gate.set()
+    deadline = time.monotonic() + 2
+    while jobs.stats()["queued"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert db.get(Prediction, running, populate_existing=True).status == PredictionStatus.FAILED
+    assert db.get(Prediction, queued, populate_existing=True).status == PredictionStatus.COMPLETED
+    jobs.shutdown()
+    db.close()
+
+def test_predict_from_url(seller_client, session_factory, classifier_calls, monkeypatch):
+    """Test /predict-url downloads the image, stores its URL and caches the result"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(prediction_service.remote_image_fetcher, "allow_private", True)
+    client, headers = seller_client
+    url = f"http://127.0.0.1:{server.server_address[1]}/photo.jpg"
+    try:
+        first = client.post("/api/v1/plants/predict-url", json={"image_url": url}, headers=headers)
+        second = client.post("/api/v1/plants/predict-url", json={"image_url": url}, headers=headers)
+        page = client.post("/api/v1/plants/predict-url", json={"image_url": url.replace("photo.jpg", "page.html")}, headers=headers)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert first.status_code == 200 and first.json()["plant_type"] == "Monstera Deliciosa"
+    assert second.json()["cached"] is True
+    assert page.status_code == 415
+    assert len(classifier_calls) == 1
+    assert client.post("/api/v1/plants/predict-url", json={}, headers=headers).status_code == 400
+
+    db = session_factory()
+    assert {p.image_url for p in db.query(Prediction).all()} == {url}
+    db.close()
+
+def test_prediction_history_pages_by_cursor(seller_client, session_factory):
+    """Test history pages follow X-Next-Cursor without gaps and compact mode drops columns"""
+    client, headers = seller_client
+    db = session_factory()
+    seller = db.query(User).filter(User.email == "batch-seller@example.com").first()
+    same_time = datetime(2026, 10, 1, 12, 0, 0)
+    db.add_all([
+        Prediction(image_url=f"https://example.com/{i}.jpg", is_plant=True, plant_type="Pothos",
+                   confidence=0.8, uploaded_by=seller.id, timestamp=same_time - timedelta(minutes=i // 2))
+        for i in range(7)
+    ])
+    db.commit()
+    db.close()
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/api/v1/plants/predictions/history", params=params, headers=headers)
+        assert response.status_code == 200
+        seen.extend(item["id"] for item in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert len(seen) == 7 and len(set(seen)) == 7
+
+    compact = client.get("/api/v1/plants/predictions/history", params={"compact": "true", "limit": 2}, headers=headers)
+    assert set(compact.json()[0]) == {"id", "is_plant", "plant_type", "confidence", "status", "timestamp"}
+    assert compact.headers["X-Next-Cursor"]
+    assert client.get("/api/v1/plants/predictions/history", params={"cursor": "bogus"}, headers=headers).status_code == 400
+
+def test_prediction_history_pages_server_timestamps(seller_client, session_factory):
+    """Test cursors advance over rows stamped by the database default"""
+    client, headers = seller_client
+    db = session_factory()
+    seller = db.query(User).filter(User.email == "batch-seller@example.com").first()
+    db.add_all([
+        Prediction(image_url=f"https://example.com/{i}.jpg", is_plant=True, plant_type="Pothos",
+                   confidence=0.8, uploaded_by=seller.id)
+        for i in range(7)
+    ])
+    db.commit()
+    db.close()
+
+    seen, cursor = [], None
+    for _ in range(5):
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/api/v1/plants/predictions/history", params=params, headers=headers)
+        assert response.status_code == 200
+        seen.extend(item["id"] for item in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert len(seen) == 7 and len(set(seen)) == 7
@@ -0,0 +1,131 @@
+import io
+import threading
+import time
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from fastapi import HTTPException
+from PIL import Image
+from urllib3.response import BaseHTTPResponse, HTTPResponse
+from app.core.remote_images import RemoteImageFetcher
+
+
+def _jpeg():
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), "darkgreen").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+PHOTO = _jpeg()
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code, content_type="image/jpeg", body=b"", headers=None):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.requests_seen.append((self.path, self.headers.get("If-None-Match")))
+        if self.path == "/photo.jpg":
+            if self.headers.get("If-None-Match") == '"v1"':
+                self._send(304, headers={"ETag": '"v1"'})
+            else:
+                self._send(200, body=PHOTO, headers={"ETag": '"v1"'})
+        elif self.path == "/moved":
+            self._send(302, headers={"Location": "/photo.jpg"})
+        elif self.path == "/page.html":
+            self._send(200, content_type="text/html", body=b"<html></html>")
+        elif self.path == "/huge.jpg":
+            self._send(200, body=b"\xff" * 4096)
+        elif self.path == "/slow.jpg":
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(PHOTO)))
+            self.end_headers()
+            for byte in PHOTO[:40]:
+                self.wfile.write(bytes([byte]))
+                self.wfile.flush()
+                time.sleep(0.05)
+        else:
+            self._send(404, content_type="text/plain")
+
+
+@pytest.fixture
+def image_server():
+    ImageHandler.requests_seen = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+def test_fetch_revalidates_cached_image(image_server, tmp_path):
+    """Test a cached download is reused after a 304 and redirects are followed"""
+    fetcher = RemoteImageFetcher(cache_dir=str(tmp_path), allow_private=True)
+
+    assert fetcher.fetch(f"{image_server}/photo.jpg") == PHOTO
+    assert fetcher.fetch(f"{image_server}/photo.jpg") == PHOTO
+    assert fetcher.fetch(f"{image_server}/moved") == PHOTO
+    assert ImageHandler.requests_seen[:2] == [("/photo.jpg", None), ("/photo.jpg", '"v1"')]
+    assert fetcher.stats()["revalidated"] == 1
+    fetcher.shutdown()
+
+def test_fetch_rejects_bad_responses(image_server):
+    """Test non-images, oversized bodies and upstream errors are refused"""
+    fetcher = RemoteImageFetcher(max_bytes=1024, allow_private=True)
+
+    for path, code in (("/page.html", 415), ("/huge.jpg", 413), ("/missing.jpg", 502)):
+        with pytest.raises(HTTPException) as error:
+            fetcher.fetch(f"{image_server}{path}")
+        assert error.value.status_code == code
+
+def test_fetch_refuses_private_hosts(image_server):
+    """Test loopback addresses and non-http URLs are refused before connecting"""
+    fetcher = RemoteImageFetcher()
+
+    for url in (f"{image_server}/photo.jpg", "file:///etc/passwd", "http://[::1]/photo.jpg"):
+        with pytest.raises(HTTPException) as error:
+            fetcher.fetch(url)
+        assert error.value.status_code == 400
+    assert ImageHandler.requests_seen == []
+
+def test_fetch_deadline_covers_trickling_bodies(image_server):
+    """Test a host sending one byte at a time is cut off at the total deadline"""
+    fetcher = RemoteImageFetcher(read_timeout=5.0, total_timeout=0.5, allow_private=True)
+
+    started = time.monotonic()
+    with pytest.raises(HTTPException) as error:
+        fetcher.fetch(f"{image_server}/slow.jpg")
+    assert error.value.status_code == 504
+    assert time.monotonic() - started < 1.5
+    fetcher.shutdown()
+
+def test_fetch_connects_to_checked_address(image_server):
+    """Test the connection goes to the address _check_url approved, not a fresh DNS answer"""
+    class PinnedFetcher(RemoteImageFetcher):
+        def _check_url(self, url):
+            return "127.0.0.1"
+
+    fetcher = PinnedFetcher()
+    port = image_server.rsplit(":", 1)[1]
+
+    assert fetcher.fetch(f"http://images.invalid:{port}/photo.jpg") == PHOTO
+    fetcher.shutdown()
+
+def test_fetch_without_read1(image_server, monkeypatch):
+    """Test downloads still work on urllib3 releases without HTTPResponse.read1"""
+    for cls in (HTTPResponse, BaseHTTPResponse):
+        monkeypatch.delattr(cls, "read1")
+    fetcher = RemoteImageFetcher(allow_private=True)
+
+    assert fetcher.fetch(f"{image_server}/photo.jpg") == PHOTO
+    fetcher.shutdown()
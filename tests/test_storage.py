@@ -0,0 +1,60 @@
+import io
+import os
+import pytest
+from fastapi import UploadFile
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.core import storage
+from app.core.database import Base
+from app.core.config import settings
+from app.services.plant_service import PlantService
+
+
+def test_local_backend_is_shared_and_writes_files(local_storage):
+    """Test get_storage returns one backend that writes under its root"""
+    backend = storage.get_storage()
+    assert backend is storage.get_storage()
+    assert backend.name == "local"
+
+    url = backend.put("plants/a.jpg", b"data", "image/jpeg")
+    assert url == "/uploads/plants/a.jpg"
+    assert (local_storage / "plants" / "a.jpg").read_bytes() == b"data"
+
+    with pytest.raises(ValueError):
+        backend.put("../escape.jpg", b"data", "image/jpeg")
+
+def test_local_backend_is_never_auto_selected(monkeypatch):
+    """Test auto-detection without cloud credentials finds no backend"""
+    for name in ["aws_access_key_id", "aws_secret_access_key", "aws_bucket_name",
+                 "cloudinary_cloud_name", "cloudinary_api_key", "cloudinary_api_secret"]:
+        monkeypatch.setattr(settings, name, None)
+    assert storage.create_storage("auto") is None
+
+def test_s3_client_is_built_lazily(monkeypatch):
+    """Test the S3 backend builds its client on first use only"""
+    if not storage.BOTO3_AVAILABLE:
+        pytest.skip("boto3 not installed")
+    backend = storage.S3Storage("bucket", "us-east-1", "key", "secret")
+    assert backend._client is None
+    assert backend.client is backend.client
+
+def test_plant_service_uploads_through_storage(local_storage, tmp_path):
+    """Test PlantService re-encodes uploads and stores them via the backend"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'storage.db'}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    buffer = io.BytesIO()
+    Image.new("RGBA", (2400, 1200)).save(buffer, format="PNG")
+    buffer.seek(0)
+    upload = UploadFile(file=buffer, filename="leaf.png", headers={"content-type": "image/png"})
+
+    variants = PlantService(db).upload_image(upload)
+    db.close()
+    engine.dispose()
+    url = variants["full"]["jpeg"]
+    assert url.startswith("/uploads/plants/")
+    stored = Image.open(os.path.join(local_storage, url[len("/uploads/"):]))
+    assert stored.format == "JPEG"
+    assert max(stored.size) == 1920
+    assert variants["thumb"]["webp"].endswith("/thumb.webp")